@@ -1,42 +1,182 @@
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, g, request, jsonify, abort
+from flask.json.provider import DefaultJSONProvider
 from http import HTTPStatus
-from db import Database
-from typing import Dict, Any
+from jsonstream import iter_json_documents
+from metrics import REQUEST_ID_HEADER, configure_logging, current_request_id, logger, record_request, render, resolve_request_id
+from pymongo.errors import DuplicateKeyError
+from queries import MOVEMENT_BUCKET_FIELDS, PRODUCT_FIELDS, movement_window_start
+from serialization import JSONProviderMixin, dumps
+from storage import BULK_WRITE_MODES, StorageError, create_database
+from validation import (
+    DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, DEFAULT_SUGGEST_LIMIT, MAX_PAGE_SIZE, MAX_SUGGEST_LIMIT,
+    encode_keyset_cursor, parse_export_args, parse_fields, parse_listing_args, parse_low_stock_args, parse_movement_args,
+    parse_product_ids, parse_reservation_items, parse_result_window, parse_stock_delta, parse_stock_ranking_args,
+    sanitize_product_data
+)
+from write_batcher import WriteBatcher
+import click
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+import zlib
+
+
+class ProductJSONProvider(JSONProviderMixin, DefaultJSONProvider):
+    """Serializes responses with serialization.dumps, which encodes ObjectId directly and prefers orjson."""
 
-app = Flask(__name__)
-app.config["MONGO_URI"] = "mongodb://db:27017/flaskdb"
-db = Database(app)
-
-db.load_sample_data()
-db.create_text_index()
 
-
-def object_id_to_string(product: Dict[str, Any]) -> None:
-    """
-    MongoDB uses ObjectId for the "_id" field by default.
-    Since ObjectId is not JSON serializable, we convert it to a string.
+app = Flask(__name__)
+app.json = ProductJSONProvider(app)
+# "mongodb" (the default) or "sqlite"; SQLITE_PATH ":memory:" keeps the whole catalog inside each process.
+app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "mongodb")
+app.config["SQLITE_PATH"] = os.environ.get("SQLITE_PATH", ":memory:")
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://db:27017/flaskdb")
+app.config["MONGO_MAX_POOL_SIZE"] = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+app.config["MONGO_MIN_POOL_SIZE"] = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+app.config["PRODUCT_CACHE_SIZE"] = int(os.environ.get("PRODUCT_CACHE_SIZE", "1024"))
+app.config["PRODUCT_CACHE_TTL"] = float(os.environ.get("PRODUCT_CACHE_TTL", "30"))
+# File through which the worker processes on this host share cache invalidations; gunicorn.conf.py sets it.
+app.config["PRODUCT_CACHE_GENERATION_FILE"] = os.environ.get("PRODUCT_CACHE_GENERATION_FILE") or None
+# MongoDB commands slower than this many milliseconds are logged; 0 disables the slow query log.
+app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", "0"))
+
+# Opt-in write coalescing: single-product POST and PUT requests are applied together in batches of up to
+# WRITE_BATCH_MAX_SIZE operations, collected for at most WRITE_BATCH_MAX_DELAY_MS milliseconds.
+app.config["WRITE_BATCHING"] = os.environ.get("WRITE_BATCHING", "false").lower() in ("1", "true", "yes")
+app.config["WRITE_BATCH_MAX_SIZE"] = int(os.environ.get("WRITE_BATCH_MAX_SIZE", "500"))
+app.config["WRITE_BATCH_MAX_DELAY_MS"] = float(os.environ.get("WRITE_BATCH_MAX_DELAY_MS", "5"))
+# Seconds a request waits for its batched write before it is answered with a 503.
+app.config["WRITE_BATCH_TIMEOUT"] = float(os.environ.get("WRITE_BATCH_TIMEOUT", "10"))
+# Write concern of the batched writes: a number of members or "majority", and whether to wait for the journal.
+app.config["WRITE_BATCH_W"] = os.environ.get("WRITE_BATCH_W", "1")
+app.config["WRITE_BATCH_JOURNAL"] = os.environ.get("WRITE_BATCH_JOURNAL", "false").lower() in ("1", "true", "yes")
+
+configure_logging()
+
+# Creating the MongoDB backend does not contact the server; seeding and index creation happen in bootstrap().
+db = create_database(app)
+# add_product and update_product_by_id go through 'writer', which is the database itself unless batching is on.
+writer = WriteBatcher(
+    db, max_size=app.config["WRITE_BATCH_MAX_SIZE"], max_delay=app.config["WRITE_BATCH_MAX_DELAY_MS"] / 1000,
+    timeout=app.config["WRITE_BATCH_TIMEOUT"]
+) if app.config["WRITE_BATCHING"] else db
+
+# Number of rows sent to MongoDB per bulk_write in POST /products/bulk.
+BULK_CHUNK_SIZE = 1000
+# zlib compression level of gzip-encoded exports; low levels keep the export CPU-bound on the database, not on gzip.
+EXPORT_GZIP_LEVEL = 3
+# Bytes of compressed output collected before a chunk of a gzip-encoded export is sent.
+EXPORT_GZIP_CHUNK_SIZE = 64 * 1024
+# Per-row errors reported by POST /products/bulk before the list is truncated.
+MAX_REPORTED_ERRORS = 1000
+
+# Seconds between scheduled rebuilds of the category summary; 0 disables the schedule.
+ANALYTICS_REBUILD_INTERVAL = int(os.environ.get("ANALYTICS_REBUILD_INTERVAL", "0"))
+# Seconds between reloads of the prefix index, which picks up writes made by other processes; 0 disables.
+SUGGEST_INDEX_REFRESH_INTERVAL = int(os.environ.get("SUGGEST_INDEX_REFRESH_INTERVAL", "300"))
+
+
+def stock_cover(units_out, days, quantity):
+    """Return the average units moved out per day and how many days 'quantity' lasts at that rate.
+
+    Days of cover is None when nothing moved out, since the stock would last indefinitely.
     """
-    if product and '_id' in product:
-        product['_id'] = str(product['_id'])
+    velocity = units_out / days
+    return velocity, (quantity / velocity if velocity and quantity is not None else None)
 
 def validate_product_data(data):
     """Validate and sanitize product data."""
-    
-    """Ensure that ProductID is a string"""
-    if 'ProductID' in data:
-        data['ProductID'] = str(data['ProductID'])
-
-    """Validate AvailableQuantity and Price"""
-    fields_to_validate = ['AvailableQuantity', 'Price']
-    for field in fields_to_validate:
-        if field in data:
-            try:
-                data[field] = int(data[field])
-            except ValueError:
-                return False, jsonify({"message": f"Invalid {field} value"}), HTTPStatus.BAD_REQUEST
+    error_message = sanitize_product_data(data)
+    if error_message:
+        return False, jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
 
     return True, None, None
 
+def schedule_periodic(interval: int, task) -> None:
+    """Run 'task' every 'interval' seconds on a daemon timer."""
+    def run():
+        task()
+        schedule_periodic(interval, task)
+
+    timer = threading.Timer(interval, run)
+    timer.daemon = True
+    timer.start()
+
+def stream_json_array(products):
+    """Yield a JSON array one document at a time, so the full collection is never held in memory."""
+    yield b'['
+    for index, product in enumerate(products):
+        yield (b',' if index else b'') + dumps(product)
+    yield b']'
+
+def stream_ndjson(products):
+    """Yield one JSON document per line (NDJSON) as the cursor produces them."""
+    for product in products:
+        yield dumps(product) + b'\n'
+
+def stream_csv(products, columns):
+    """Yield a CSV header and then one row per product. Fields not in 'columns' are left out."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for product in products:
+        writer.writerow(product)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def gzip_stream(chunks, level=EXPORT_GZIP_LEVEL):
+    """Compress a stream of byte chunks into gzip format, yielding compressed output as it fills up."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            pending.append(compressed)
+            pending_size += len(compressed)
+            if pending_size >= EXPORT_GZIP_CHUNK_SIZE:
+                yield b''.join(pending)
+                pending, pending_size = [], 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+@app.before_request
+def start_request():
+    """Assign the request ID and start timing the request."""
+    g.request_id = resolve_request_id(request.headers.get(REQUEST_ID_HEADER), lambda: uuid.uuid4().hex)
+    g.request_id_token = current_request_id.set(g.request_id)
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    """Record the request in the route's metrics and echo the request ID back to the client.
+
+    Streamed responses are timed until their first byte is ready, not until the body is sent.
+    """
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(request.method, route, response.status_code, time.perf_counter() - started)
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+@app.teardown_request
+def clear_request_id(error=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        current_request_id.reset(token)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request and MongoDB command metrics for this process, in the Prometheus text format."""
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
 
 @app.route('/products', methods=['POST'])
 def add_product():
@@ -48,18 +188,18 @@ def add_product():
     is_valid, error_response, status_code = validate_product_data(data)
     if not is_valid:
         return error_response, status_code
+    if 'ProductID' not in data:
+        return jsonify({"message": "ProductID is required"}), HTTPStatus.BAD_REQUEST
 
-    """Check if a product with this ProductID already exists and return 409 if it does."""
-    existing_product = db.get_product_by_id(data['ProductID'])
-    if existing_product:
-        return jsonify({"message": "ProductID already exists"}), HTTPStatus.CONFLICT
-
-    """Insert the data as a new document in the MongoDB products collection."""
-    result = db.add_product(data)
+    """Insert the data as a new document in the MongoDB products collection.
+    The unique index on ProductID rejects duplicates, which the DuplicateKeyError handler turns into a 409."""
+    result = writer.add_product(data)
 
     """If the insert was successful, the insert_one method returns an InsertOneResult object.
     We can get the ID of the new document from this object."""
-    if result.acknowledged:
+    if result and result.acknowledged:
+        db.update_category_summary(current=data)
+
         """Return a successful response with the ID of the new product."""
         return jsonify({"ProductID": data['ProductID'], "message": "Product added successfully"}), HTTPStatus.CREATED
     
@@ -67,6 +207,68 @@ def add_product():
     return jsonify({"message": "Failed to add product"}), HTTPStatus.INTERNAL_SERVER_ERROR
 
 
+@app.route('/products/bulk', methods=['POST'])
+def bulk_import_products():
+    """Import products from a streamed NDJSON or JSON array body.
+
+    Rows are validated one at a time and written in chunks of BULK_CHUNK_SIZE with an unordered
+    bulk_write, so a bad row is reported without aborting the rest of the import.
+    """
+    mode = request.args.get('mode', 'insert')
+    if mode not in BULK_WRITE_MODES:
+        return jsonify({"message": f"mode must be one of: {', '.join(BULK_WRITE_MODES)}"}), HTTPStatus.BAD_REQUEST
+
+    totals = {"received": 0, "inserted": 0, "upserted": 0, "modified": 0}
+    errors = []
+    error_count = 0
+    started = time.perf_counter()
+
+    def report_error(index, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"index": index, "message": message})
+
+    def flush(chunk, chunk_indexes):
+        result = db.bulk_write_products(chunk, mode)
+        for field in ("inserted", "upserted", "modified"):
+            totals[field] += result[field]
+        for error in result["errors"]:
+            report_error(chunk_indexes[error["index"]], error["message"])
+
+    chunk, chunk_indexes = [], []
+    for index, (product, parse_error) in enumerate(iter_json_documents(request.stream)):
+        totals["received"] += 1
+        if parse_error:
+            report_error(index, parse_error)
+            continue
+        if not isinstance(product, dict) or 'ProductID' not in product:
+            report_error(index, "ProductID is required")
+            continue
+        error_message = sanitize_product_data(product)
+        if error_message:
+            report_error(index, error_message)
+            continue
+
+        chunk.append(product)
+        chunk_indexes.append(index)
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            flush(chunk, chunk_indexes)
+            chunk, chunk_indexes = [], []
+
+    if chunk:
+        flush(chunk, chunk_indexes)
+
+    elapsed = time.perf_counter() - started
+    return jsonify({
+        **totals,
+        "error_count": error_count,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(totals["received"] / elapsed, 1) if elapsed else None
+    }), HTTPStatus.OK
+
+
 @app.route('/products/<id>', methods=['PUT'])
 def update_product_by_id(id: str):
     """Extract the JSON data from the request."""
@@ -77,44 +279,85 @@ def update_product_by_id(id: str):
     if not is_valid:
         return error_response, status_code
 
-    """Check if a product with this ProductID (from the payload) already exists and if it belongs to another product."""
-    product_id_from_payload = data.get('ProductID', None)
-    if product_id_from_payload:
-        existing_product = db.get_product_by_id(product_id_from_payload)
-        if existing_product and existing_product['ProductID'] != id:
-            return jsonify({"message": "ProductID already exists"}), HTTPStatus.CONFLICT
-
-
-
-    """Update the document in the MongoDB products collection with the given ID."""
-    result = db.update_product_by_id(id, data)
+    """Update the document in the MongoDB products collection with the given ID.
+    If the payload's ProductID belongs to another product, the unique index raises a DuplicateKeyError (409)."""
+    previous_product = writer.update_product_by_id(id, data)
     
     """If no document was found with the given ID, return a 404 error."""
-    if result.matched_count == 0:
+    if previous_product is None:
         return jsonify({"message": "ID does not exist"}), HTTPStatus.NOT_FOUND
+
+    current_product = {**previous_product, **data}
+    db.update_category_summary(previous=previous_product, current=current_product)
     
     """If the update was successful, return 200."""
     return jsonify({"message": "Product updated successfully"}), HTTPStatus.OK
 
 
+@app.route('/products/<id>/stock', methods=['PATCH'])
+def adjust_product_stock(id: str):
+    """Atomically adjusts a product's AvailableQuantity by the given delta."""
+    delta, error_message = parse_stock_delta(request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    """The update is a single server-side $inc guarded so the quantity cannot go below zero."""
+    product = db.adjust_stock(id, delta)
+    if product is None:
+        existing_product = db.get_product_by_id(id)
+        if existing_product is None:
+            return jsonify({"message": "ID does not exist"}), HTTPStatus.NOT_FOUND
+        return jsonify({
+            "message": "Insufficient stock",
+            "ProductID": id,
+            "AvailableQuantity": existing_product.get('AvailableQuantity')
+        }), HTTPStatus.CONFLICT
+
+    previous_product = {**product, 'AvailableQuantity': product['AvailableQuantity'] - delta}
+    db.update_category_summary(previous=previous_product, current=product)
+
+    return jsonify({"ProductID": id, "AvailableQuantity": product['AvailableQuantity']}), HTTPStatus.OK
+
+
+@app.route('/products/reservations', methods=['POST'])
+def reserve_products():
+    """Reserves stock for several products at once; either every item is reserved or none is."""
+    quantities, error_message = parse_reservation_items(request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    reserved_products, failed_product_ids = db.reserve_stock(quantities)
+    if failed_product_ids:
+        return jsonify({"message": "Insufficient stock", "failed": failed_product_ids}), HTTPStatus.CONFLICT
+
+    db.adjust_category_quantities([
+        (product.get('ProductCategory'), product.get('Price'), -quantities[product['ProductID']])
+        for product in reserved_products
+    ])
+
+    return jsonify({
+        "message": "Stock reserved successfully",
+        "items": [{"ProductID": product['ProductID'], "AvailableQuantity": product['AvailableQuantity']} for product in reserved_products]
+    }), HTTPStatus.OK
+
+
 @app.route('/products/analytics', methods=['GET'])
 def get_product_analytics():
-    """Returns analytics about the products in the database."""
-    results = db.get_product_analytics()
+    """Returns analytics about the products in the database.
+
+    Category figures are read from the incrementally maintained summary, so the cost grows
+    with the number of categories rather than the number of products.
+    """
+    results = db.get_category_summary()
     
     """The '$group' stage of MongoDB's aggregation framework uses '_id' as a special field to define the grouping criteria.
     Here we convert the '_id' field to 'category' for a more user-friendly response and cleaner looking code in cli.py."""
     for result in results:
         result['category'] = result.pop('_id')
 
-    """Get the most and least stocked products."""
+    """Get the most and least stocked products from the AvailableQuantity index."""
     most_stocked_product = db.get_product_by_quantity("highest")
-    print("Most stocked:", most_stocked_product)
     least_stocked_product = db.get_product_by_quantity("lowest")
-    print("Least stocked:", least_stocked_product)
-    
-    object_id_to_string(most_stocked_product)
-    object_id_to_string(least_stocked_product)
 
     """Add the most and least stocked products to the response."""
     results.append({"most_stocked_product": most_stocked_product, "least_stocked_product": least_stocked_product})
@@ -122,15 +365,174 @@ def get_product_analytics():
     return jsonify(results), HTTPStatus.OK
 
 
+@app.route('/products/analytics/rebuild', methods=['POST'])
+def rebuild_product_analytics():
+    """Recomputes the category summary from the products collection."""
+    if not db.rebuild_category_summary():
+        return jsonify({"message": "Failed to rebuild analytics"}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    return jsonify({"message": "Analytics rebuilt successfully"}), HTTPStatus.OK
+
+
+@app.route('/products/analytics/consistency', methods=['GET'])
+def check_product_analytics():
+    """Reports whether the category summary matches a full recomputation."""
+    mismatches = db.check_category_summary()
+    return jsonify({"consistent": not mismatches, "mismatches": mismatches}), HTTPStatus.OK
+
+
+@app.route('/products/analytics/movements', methods=['GET'])
+def get_category_movements():
+    """Reports units moved in and out per category over the last 'days' days (default 7), with stock velocity.
+
+    Totals come from the per-product day buckets, so the report does not read individual movements.
+    'days_of_cover' is how long each category's current stock lasts at its average daily outflow.
+    """
+    days, _, error_message = parse_movement_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    since = movement_window_start(days)
+    quantities = {result["_id"]: result["total_quantity"] for result in db.get_category_summary()}
+
+    categories = []
+    for movement in db.get_category_movements(since):
+        category = movement.pop("_id")
+        velocity, days_of_cover = stock_cover(movement["units_out"], days, quantities.get(category))
+        categories.append({"category": category, **movement, "total_quantity": quantities.get(category),
+                           "daily_velocity": velocity, "days_of_cover": days_of_cover})
+
+    return jsonify({"days": days, "since": since, "categories": categories}), HTTPStatus.OK
+
+
+@app.route('/products/<id>/movements', methods=['GET'])
+def get_product_movements(id: str):
+    """Reports a product's stock movements over the last 'days' days, bucketed by 'granularity' (day or hour)."""
+    days, granularity, error_message = parse_movement_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    product = db.get_product_by_id(id)
+    if product is None:
+        return jsonify({"message": "ID does not exist"}), HTTPStatus.NOT_FOUND
+
+    since = movement_window_start(days)
+    buckets = db.get_product_movements(id, since, granularity)
+    totals = {field: sum(bucket.get(field, 0) for bucket in buckets) for field in MOVEMENT_BUCKET_FIELDS}
+    velocity, days_of_cover = stock_cover(totals["units_out"], days, product.get('AvailableQuantity'))
+
+    return jsonify({
+        "ProductID": id,
+        "AvailableQuantity": product.get('AvailableQuantity'),
+        "days": days,
+        "since": since,
+        "granularity": granularity,
+        **totals,
+        "daily_velocity": velocity,
+        "days_of_cover": days_of_cover,
+        "buckets": buckets
+    }), HTTPStatus.OK
+
+
+@app.route('/products/stock/<any(lowest, highest):order>', methods=['GET'])
+def get_stock_ranking(order: str):
+    """Returns the products with the lowest or highest AvailableQuantity.
+
+    'limit' sets how many (default 10), 'category' restricts the ranking to one category, and
+    'per_category=true' returns a separate ranking for every category.
+    """
+    ranking, error_message = parse_stock_ranking_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    if ranking["per_category"]:
+        categories = db.get_products_by_quantity_per_category(order, ranking["limit"], ranking["fields"])
+        return jsonify({"categories": categories}), HTTPStatus.OK
+
+    products = db.get_products_by_quantity(order, ranking["limit"], ranking["category"], ranking["fields"])
+    return jsonify({"products": products}), HTTPStatus.OK
+
+
+@app.route('/products/stock/below', methods=['GET'])
+def get_low_stock_products():
+    """Returns the products whose AvailableQuantity is below 'threshold', lowest first.
+
+    Results are paged like GET /products: pass the returned 'next_cursor' as 'after' for the next page.
+    """
+    low_stock, error_message = parse_low_stock_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    limit = low_stock["limit"]
+    products = db.get_products_page(limit=limit, **low_stock["query"])
+
+    next_cursor = encode_keyset_cursor(products[-1], 'AvailableQuantity') if len(products) == limit else None
+    return jsonify({"products": products, "next_cursor": next_cursor}), HTTPStatus.OK
+
+
 @app.route('/products', methods=['GET'])
 def get_all_products():
-    """Returns a list of all products in the database."""
-    products = db.get_all_products()
-    
-    for product in products:
-        object_id_to_string(product)
+    """Returns the products in the database.
+
+    Without query parameters the whole collection is streamed as a JSON array.
+    'category', 'min_price', 'max_price', 'min_quantity' and 'max_quantity' filter the listing
+    and 'sort' orders it by ProductID, Price or AvailableQuantity ('-' prefix for descending).
+    'limit' and 'after' switch to keyset pagination, 'format=ndjson' streams one document
+    per line, and 'explain=true' reports the query plan instead of the products.
+    'fields' returns only the listed fields, plus ProductID and the sort field.
+    """
+    listing, error_message = parse_listing_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    limit = listing["limit"]
+    query = listing["query"]
+
+    """Report which index the query would use and how many documents it examines."""
+    if listing["explain"]:
+        explanation = db.explain_products(limit=limit, **query)
+        if explanation is None:
+            return jsonify({"message": "Failed to explain query"}), HTTPStatus.INTERNAL_SERVER_ERROR
+        return jsonify(explanation), HTTPStatus.OK
+
+    """NDJSON is written out as the cursor yields documents, optionally starting after a cursor."""
+    if listing["format"] == 'ndjson':
+        return Response(stream_ndjson(db.iter_products(limit=limit, **query)), mimetype='application/x-ndjson')
+
+    if limit is None and listing["after"] is None:
+        return Response(stream_json_array(db.iter_products(**query)), mimetype='application/json')
+
+    """Fetch one page and hand back the position of its last product as the cursor for the next one."""
+    limit = limit or DEFAULT_PAGE_SIZE
+    products = db.get_products_page(limit=limit, **query)
+
+    next_cursor = encode_keyset_cursor(products[-1], query["sort_field"]) if len(products) == limit else None
+    return jsonify({"products": products, "next_cursor": next_cursor})
 
-    return jsonify(products)
+
+@app.route('/products/export', methods=['GET'])
+def export_products():
+    """Streams the whole catalog, or the filtered part of it, as NDJSON or CSV in ProductID order.
+
+    Products are read 'batch_size' at a time from a server-side cursor and written out as they
+    arrive, so memory use does not grow with the catalog. The body is gzip-encoded on the fly for
+    clients that send 'Accept-Encoding: gzip'. 'fields' selects the exported fields and CSV columns.
+    """
+    export, error_message = parse_export_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    products = db.iter_products(filters=export["filters"], fields=export["fields"], batch_size=export["batch_size"])
+    if export["format"] == 'csv':
+        body, mimetype = stream_csv(products, export["fields"] or list(PRODUCT_FIELDS)), 'text/csv'
+    else:
+        body, mimetype = stream_ndjson(products), 'application/x-ndjson'
+
+    headers = {"Content-Disposition": f'attachment; filename="products.{export["format"]}"', "Vary": "Accept-Encoding"}
+    if request.accept_encodings['gzip']:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype=mimetype, headers=headers)
 
 
 @app.route('/products/<id>', methods=['GET'])
@@ -141,30 +543,73 @@ def get_product_by_id(id: str):
     if product is None:
         abort(HTTPStatus.NOT_FOUND)
 
-    object_id_to_string(product)
-    return jsonify(product)
+    """Tag the response with an ETag so clients polling an unchanged product get a body-less 304."""
+    response = jsonify(product)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/products/batch-get', methods=['POST'])
+def batch_get_products():
+    """Returns several products in one request, keyed by ProductID, and lists the IDs that were not found."""
+    product_ids, error_message = parse_product_ids(request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    products = db.get_products_by_ids(product_ids)
+
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    return jsonify({"products": products, "missing": missing}), HTTPStatus.OK
+
+
+@app.route('/products/cache/stats', methods=['GET'])
+def get_product_cache_stats():
+    """Returns the hit/miss counters of the product cache."""
+    return jsonify(db.cache.stats()), HTTPStatus.OK
 
 @app.route('/products/search', methods=['GET'])
 def search_products():
-    """Search for products based on the given query."""
+    """Search for products based on the given query, most relevant first."""
     query = request.args.get('q', '')
     if not query:
         return jsonify({"message": "Query parameter 'q' is required"}), HTTPStatus.BAD_REQUEST
-    search_results = db.search_products(query)
-    for product in search_results:
-        object_id_to_string(product)
-    return jsonify(search_results)
+
+    limit, offset, error_message = parse_result_window(request.args, DEFAULT_SEARCH_LIMIT, MAX_PAGE_SIZE)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    fields, error_message = parse_fields(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    return jsonify(db.search_products(query, limit=limit, skip=offset, fields=fields))
+
+
+@app.route('/products/suggest', methods=['GET'])
+def suggest_products():
+    """Type-ahead suggestions for products whose name, category, or ID starts with the given prefix."""
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix:
+        return jsonify({"message": "Query parameter 'prefix' is required"}), HTTPStatus.BAD_REQUEST
+
+    limit, _, error_message = parse_result_window(request.args, DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    return jsonify(db.suggest_products(prefix, limit))
 
 
 @app.route('/products/<id>', methods=['DELETE'])
 def delete_product_by_id(id: str):
     """Deletes a single product from the database."""
     
-    result = db.delete_product_by_id(id)
+    deleted_product = db.delete_product_by_id(id)
     
-    if result.deleted_count == 0:
+    if deleted_product is None:
         abort(HTTPStatus.NOT_FOUND)
 
+    db.update_category_summary(previous=deleted_product)
+
     return jsonify({"message": "Product deleted successfully"}), HTTPStatus.OK
 
 
@@ -180,5 +625,77 @@ def not_found(error=None):
     return resp
 
 
+@app.errorhandler(DuplicateKeyError)
+def duplicate_product_id(error):
+    """Handle unique index violations on ProductID by returning a 409 Conflict."""
+    return jsonify({"message": "ProductID already exists"}), HTTPStatus.CONFLICT
+
+
+@app.errorhandler(StorageError)
+def storage_unavailable(error):
+    """Handle storage failures whose outcome cannot be reported by returning a 503."""
+    return jsonify({"message": str(error)}), HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def bootstrap() -> bool:
+    """One-time deployment setup: seed the sample data, create indexes and build the analytics summary.
+
+    Run this once per deployment with 'flask --app api bootstrap' rather than in every worker.
+    Returns False if an index could not be created.
+    """
+    db.load_sample_data()
+    text_index_created = db.create_text_index()
+    indexes_created = db.create_indexes()
+    db.rebuild_category_summary()
+    return text_index_created and indexes_created
+
+
+_worker_started = False
+_worker_lock = threading.Lock()
+
+def start_worker() -> float:
+    """Per-process setup: load the prefix index and start the periodic tasks.
+
+    Runs at most once per worker process and returns how long it took in seconds.
+    """
+    global _worker_started
+    with _worker_lock:
+        if _worker_started:
+            return 0.0
+
+        started = time.perf_counter()
+        if db.ephemeral:
+            """An in-memory database starts empty in every process, so each worker bootstraps its own."""
+            if not bootstrap():
+                logger.error("Worker %s could not create the indexes", os.getpid())
+        db.load_prefix_index()
+        if ANALYTICS_REBUILD_INTERVAL > 0:
+            schedule_periodic(ANALYTICS_REBUILD_INTERVAL, db.rebuild_category_summary)
+        if SUGGEST_INDEX_REFRESH_INTERVAL > 0:
+            schedule_periodic(SUGGEST_INDEX_REFRESH_INTERVAL, db.load_prefix_index)
+        _worker_started = True
+        return time.perf_counter() - started
+
+
+@app.before_request
+def ensure_worker_started():
+    """Start the worker lazily on servers that do not call start_worker() themselves."""
+    if not _worker_started:
+        elapsed = start_worker()
+        if elapsed:
+            logger.info("Worker %s started in %.1f ms", os.getpid(), elapsed * 1000)
+
+
+@app.cli.command("bootstrap")
+def bootstrap_command():
+    """Seed sample data and create indexes."""
+    started = time.perf_counter()
+    if not bootstrap():
+        raise click.ClickException("Bootstrap failed: the indexes could not be created")
+    print(f"Bootstrap completed in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
 if __name__ == '__main__':
+    if not bootstrap():
+        raise SystemExit("Bootstrap failed: the indexes could not be created")
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,347 @@
+from quart import Quart, Response, g, request, jsonify, abort
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.http import generate_etag, quote_etag
+from http import HTTPStatus
+from async_db import AsyncDatabase
+from metrics import REQUEST_ID_HEADER, configure_logging, current_request_id, record_request, render, resolve_request_id
+from pymongo.errors import DuplicateKeyError
+from serialization import JSONProviderMixin, dumps
+from storage import StorageError
+from validation import (
+    DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, DEFAULT_SUGGEST_LIMIT, MAX_PAGE_SIZE, MAX_SUGGEST_LIMIT,
+    encode_keyset_cursor, parse_fields, parse_listing_args, parse_product_ids, parse_reservation_items, parse_result_window,
+    parse_stock_delta, sanitize_product_data
+)
+import asyncio
+import functools
+import os
+import time
+import uuid
+
+# The asyncio variant of api.py. It serves the same JSON contract for product reads and writes, search,
+# suggestions, batch-get, stock adjustment and reservation, and the analytics summary, but handlers await
+# a Motor client instead of blocking a worker thread on PyMongo. Bootstrap (seeding, indexes, analytics
+# summary), bulk import, export, stock ranking and threshold listings, analytics rebuild/consistency,
+# stock movement reports and explain are only served by api.py.
+
+
+class ProductJSONProvider(JSONProviderMixin, DefaultJSONProvider):
+    """Serializes responses with serialization.dumps, which encodes ObjectId directly and prefers orjson."""
+
+
+app = Quart(__name__)
+app.json = ProductJSONProvider(app)
+
+# Requests handled at once; further requests wait up to ASYNC_QUEUE_TIMEOUT seconds for a slot, then get a 503.
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("ASYNC_MAX_CONCURRENT_REQUESTS", "256"))
+QUEUE_TIMEOUT = float(os.environ.get("ASYNC_QUEUE_TIMEOUT", "1.0"))
+# Seconds a handler may run before the request is answered with a 504.
+REQUEST_TIMEOUT = float(os.environ.get("ASYNC_REQUEST_TIMEOUT", "10.0"))
+
+db = AsyncDatabase(
+    os.environ.get("MONGO_URI", "mongodb://db:27017/flaskdb"),
+    max_pool_size=int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+    min_pool_size=int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+    cache_size=int(os.environ.get("PRODUCT_CACHE_SIZE", "1024")),
+    cache_ttl=float(os.environ.get("PRODUCT_CACHE_TTL", "30")),
+    cache_generation_file=os.environ.get("PRODUCT_CACHE_GENERATION_FILE") or None,
+    slow_query_ms=float(os.environ.get("SLOW_QUERY_MS", "0"))
+)
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+configure_logging()
+
+
+def bounded(handler):
+    """Limit concurrent handlers, shed load when the queue is full, and time out slow requests."""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        try:
+            await asyncio.wait_for(request_slots.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return jsonify({"message": "Server is busy, retry later"}), HTTPStatus.SERVICE_UNAVAILABLE, {"Retry-After": "1"}
+
+        try:
+            return await asyncio.wait_for(handler(*args, **kwargs), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            return jsonify({"message": "Request timed out"}), HTTPStatus.GATEWAY_TIMEOUT
+        finally:
+            request_slots.release()
+    return wrapper
+
+async def stream_json_array(products):
+    """Yield a JSON array one document at a time, so the full collection is never held in memory."""
+    yield b'['
+    index = 0
+    async for product in products:
+        yield (b',' if index else b'') + dumps(product)
+        index += 1
+    yield b']'
+
+async def stream_ndjson(products):
+    """Yield one JSON document per line (NDJSON) as the cursor produces them."""
+    async for product in products:
+        yield dumps(product) + b'\n'
+
+
+@app.before_request
+async def start_request():
+    """Assign the request ID and start timing the request."""
+    g.request_id = resolve_request_id(request.headers.get(REQUEST_ID_HEADER), lambda: uuid.uuid4().hex)
+    current_request_id.set(g.request_id)
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def finish_request(response):
+    """Record the request in the route's metrics and echo the request ID back to the client."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(request.method, route, response.status_code, time.perf_counter() - started)
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+@app.before_serving
+async def start_worker():
+    """Per-process setup: load the prefix index used by /products/suggest."""
+    await db.load_prefix_index()
+
+
+@app.after_serving
+async def stop_worker():
+    db.close()
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Request and MongoDB command metrics for this process, in the Prometheus text format."""
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/products', methods=['POST'])
+@bounded
+async def add_product():
+    """Insert a new product; the unique index on ProductID turns duplicates into a 409."""
+    data = await request.get_json()
+
+    error_message = sanitize_product_data(data)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+    if 'ProductID' not in data:
+        return jsonify({"message": "ProductID is required"}), HTTPStatus.BAD_REQUEST
+
+    result = await db.add_product(data)
+    if result and result.acknowledged:
+        await db.update_category_summary(current=data)
+        return jsonify({"ProductID": data['ProductID'], "message": "Product added successfully"}), HTTPStatus.CREATED
+
+    return jsonify({"message": "Failed to add product"}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+@app.route('/products/<id>', methods=['PUT'])
+@bounded
+async def update_product_by_id(id: str):
+    """Update a product and apply the change to the category summary."""
+    data = await request.get_json()
+
+    error_message = sanitize_product_data(data)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    previous_product = await db.update_product_by_id(id, data)
+    if previous_product is None:
+        return jsonify({"message": "ID does not exist"}), HTTPStatus.NOT_FOUND
+
+    await db.update_category_summary(previous=previous_product, current={**previous_product, **data})
+    return jsonify({"message": "Product updated successfully"}), HTTPStatus.OK
+
+
+@app.route('/products/<id>/stock', methods=['PATCH'])
+@bounded
+async def adjust_product_stock(id: str):
+    """Atomically adjusts a product's AvailableQuantity by the given delta."""
+    delta, error_message = parse_stock_delta(await request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    product = await db.adjust_stock(id, delta)
+    if product is None:
+        existing_product = await db.get_product_by_id(id)
+        if existing_product is None:
+            return jsonify({"message": "ID does not exist"}), HTTPStatus.NOT_FOUND
+        return jsonify({
+            "message": "Insufficient stock",
+            "ProductID": id,
+            "AvailableQuantity": existing_product.get('AvailableQuantity')
+        }), HTTPStatus.CONFLICT
+
+    previous_product = {**product, 'AvailableQuantity': product['AvailableQuantity'] - delta}
+    await db.update_category_summary(previous=previous_product, current=product)
+    return jsonify({"ProductID": id, "AvailableQuantity": product['AvailableQuantity']}), HTTPStatus.OK
+
+
+@app.route('/products/reservations', methods=['POST'])
+@bounded
+async def reserve_products():
+    """Reserves stock for several products at once; either every item is reserved or none is."""
+    quantities, error_message = parse_reservation_items(await request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    reserved_products, failed_product_ids = await db.reserve_stock(quantities)
+    if failed_product_ids:
+        return jsonify({"message": "Insufficient stock", "failed": failed_product_ids}), HTTPStatus.CONFLICT
+
+    """The stock is already decremented, so a request timeout must not skip the summary delta."""
+    await asyncio.shield(db.adjust_category_quantities([
+        (product.get('ProductCategory'), product.get('Price'), -quantities[product['ProductID']])
+        for product in reserved_products
+    ]))
+    return jsonify({
+        "message": "Stock reserved successfully",
+        "items": [{"ProductID": product['ProductID'], "AvailableQuantity": product['AvailableQuantity']} for product in reserved_products]
+    }), HTTPStatus.OK
+
+
+@app.route('/products/analytics', methods=['GET'])
+@bounded
+async def get_product_analytics():
+    """Returns the category summary plus the most and least stocked products, fetched concurrently."""
+    results, most_stocked_product, least_stocked_product = await asyncio.gather(
+        db.get_category_summary(),
+        db.get_product_by_quantity("highest"),
+        db.get_product_by_quantity("lowest")
+    )
+    for result in results:
+        result['category'] = result.pop('_id')
+
+    results.append({"most_stocked_product": most_stocked_product, "least_stocked_product": least_stocked_product})
+    return jsonify(results), HTTPStatus.OK
+
+
+@app.route('/products', methods=['GET'])
+@bounded
+async def get_all_products():
+    """Returns the products in the database, with the same parameters as the sync app (explain excepted)."""
+    listing, error_message = parse_listing_args(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    limit = listing["limit"]
+    query = listing["query"]
+
+    if listing["format"] == 'ndjson':
+        return Response(stream_ndjson(db.iter_products(limit=limit, **query)), mimetype='application/x-ndjson')
+
+    if limit is None and listing["after"] is None:
+        return Response(stream_json_array(db.iter_products(**query)), mimetype='application/json')
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    products = await db.get_products_page(limit=limit, **query)
+
+    next_cursor = encode_keyset_cursor(products[-1], query["sort_field"]) if len(products) == limit else None
+    return jsonify({"products": products, "next_cursor": next_cursor})
+
+
+@app.route('/products/<id>', methods=['GET'])
+@bounded
+async def get_product_by_id(id: str):
+    """Returns a single product, or an empty 304 when the client's ETag still matches."""
+    product = await db.get_product_by_id(id)
+    if product is None:
+        abort(HTTPStatus.NOT_FOUND)
+
+    body = dumps(product)
+    etag = generate_etag(body)
+    if request.if_none_match.contains(etag):
+        return Response(status=HTTPStatus.NOT_MODIFIED, headers={"ETag": quote_etag(etag)})
+
+    return Response(body, mimetype='application/json', headers={"ETag": quote_etag(etag)})
+
+
+@app.route('/products/batch-get', methods=['POST'])
+@bounded
+async def batch_get_products():
+    """Returns several products in one request, keyed by ProductID, and lists the IDs that were not found."""
+    product_ids, error_message = parse_product_ids(await request.get_json())
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    products = await db.get_products_by_ids(product_ids)
+
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    return jsonify({"products": products, "missing": missing}), HTTPStatus.OK
+
+
+@app.route('/products/cache/stats', methods=['GET'])
+async def get_product_cache_stats():
+    """Returns the hit/miss counters of the product cache."""
+    return jsonify(db.cache.stats()), HTTPStatus.OK
+
+
+@app.route('/products/search', methods=['GET'])
+@bounded
+async def search_products():
+    """Search for products based on the given query, most relevant first."""
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({"message": "Query parameter 'q' is required"}), HTTPStatus.BAD_REQUEST
+
+    limit, offset, error_message = parse_result_window(request.args, DEFAULT_SEARCH_LIMIT, MAX_PAGE_SIZE)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    fields, error_message = parse_fields(request.args)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    return jsonify(await db.search_products(query, limit=limit, skip=offset, fields=fields))
+
+
+@app.route('/products/suggest', methods=['GET'])
+async def suggest_products():
+    """Type-ahead suggestions from the in-process prefix index; no database round trip."""
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix:
+        return jsonify({"message": "Query parameter 'prefix' is required"}), HTTPStatus.BAD_REQUEST
+
+    limit, _, error_message = parse_result_window(request.args, DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT)
+    if error_message:
+        return jsonify({"message": error_message}), HTTPStatus.BAD_REQUEST
+
+    return jsonify(db.suggest_products(prefix, limit))
+
+
+@app.route('/products/<id>', methods=['DELETE'])
+@bounded
+async def delete_product_by_id(id: str):
+    """Deletes a single product from the database."""
+    deleted_product = await db.delete_product_by_id(id)
+    if deleted_product is None:
+        abort(HTTPStatus.NOT_FOUND)
+
+    await db.update_category_summary(previous=deleted_product)
+    return jsonify({"message": "Product deleted successfully"}), HTTPStatus.OK
+
+
+@app.errorhandler(HTTPStatus.NOT_FOUND)
+async def not_found(error=None):
+    """Handle 404 errors by returning a JSON response and the requested URL."""
+    return jsonify({'status': HTTPStatus.NOT_FOUND, 'message': f'Not Found: {request.url}'}), HTTPStatus.NOT_FOUND
+
+
+@app.errorhandler(DuplicateKeyError)
+async def duplicate_product_id(error):
+    """Handle unique index violations on ProductID by returning a 409 Conflict."""
+    return jsonify({"message": "ProductID already exists"}), HTTPStatus.CONFLICT
+
+
+@app.errorhandler(StorageError)
+async def storage_unavailable(error):
+    """Handle storage failures whose outcome cannot be reported by returning a 503."""
+    return jsonify({"message": str(error)}), HTTPStatus.SERVICE_UNAVAILABLE
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,444 @@
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import (
+    BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError, DuplicateKeyError, OperationFailure
+)
+from cache import ProductCache
+from metrics import CommandMetricsListener
+from prefix_index import INDEXED_FIELDS, PrefixIndex
+from queries import (
+    CATEGORY_SUMMARY_COLLECTION, PRODUCTS_COLLECTION, STOCK_MOVEMENT_BUCKETS_COLLECTION, STOCK_MOVEMENTS_COLLECTION,
+    TEXT_SCORE_PROJECTION, TEXT_SCORE_SORT, build_product_query, build_projection, category_bounds_pipeline,
+    movement_bucket_update, movement_buckets, quantity_change, quantity_delta_updates, quantity_only_delta,
+    removed_price_on_boundary, stock_movements, summary_delta_update, summary_to_analytics
+)
+from storage import STREAM_BATCH_SIZE, StorageError
+import asyncio
+
+
+class AsyncDatabase:
+    """The asyncio counterpart of Database, backed by the Motor driver.
+
+    Methods mirror Database one for one, so both apps share the same query documents (queries.py),
+    the product cache, and the prefix index.
+    """
+
+    def __init__(self, uri, max_pool_size=100, min_pool_size=0, cache_size=1024, cache_ttl=30, slow_query_ms=0,
+                 cache_generation_file=None):
+        self.command_listener = CommandMetricsListener(slow_query_ms=slow_query_ms)
+        self.client = AsyncIOMotorClient(
+            uri, maxPoolSize=max_pool_size, minPoolSize=min_pool_size, event_listeners=[self.command_listener]
+        )
+        self.db = self.client.get_default_database()
+        self.cache = ProductCache(max_size=cache_size, ttl=cache_ttl, shared_generation=cache_generation_file)
+        self.prefix_index = PrefixIndex()
+        self._supports_transactions = None
+
+    def close(self):
+        self.client.close()
+
+    async def get_category_summary(self):
+        """Return the materialized per-category analytics in the same shape as the '$group' output."""
+        try:
+            summaries = await self.db[CATEGORY_SUMMARY_COLLECTION].find().to_list(length=None)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+            return []
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+            return []
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return []
+        return summary_to_analytics(summaries)
+
+    async def update_category_summary(self, previous=None, current=None):
+        """Apply the change from the previous to the current version of a product to the category summary."""
+        try:
+            quantity_delta = quantity_only_delta(previous, current)
+            if quantity_delta is not None:
+                if quantity_delta:
+                    operations = [UpdateOne({"_id": category}, update) for category, update in
+                                  quantity_delta_updates([(current.get("ProductCategory"), current.get("Price"), quantity_delta)])]
+                    await self.db[CATEGORY_SUMMARY_COLLECTION].bulk_write(operations, ordered=False)
+                return
+
+            if previous:
+                await self._apply_summary_delta(previous, -1)
+            if current:
+                await self._apply_summary_delta(current, 1)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the summary update operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    async def adjust_category_quantities(self, changes):
+        """Apply a list of (category, price, quantity_delta) stock changes to the category summary."""
+        operations = [UpdateOne({"_id": category}, update) for category, update in quantity_delta_updates(changes)]
+        if not operations:
+            return
+        try:
+            await self.db[CATEGORY_SUMMARY_COLLECTION].bulk_write(operations, ordered=False)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the summary update operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    async def _apply_summary_delta(self, product, sign):
+        """Add (sign=1) or remove (sign=-1) a single product's contribution to its category summary."""
+        category, update = summary_delta_update(product, sign)
+        summary = await self.db[CATEGORY_SUMMARY_COLLECTION].find_one_and_update(
+            {"_id": category}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if sign > 0:
+            return
+
+        if summary["count"] <= 0:
+            await self.db[CATEGORY_SUMMARY_COLLECTION].delete_one({"_id": category})
+        elif removed_price_on_boundary(summary, product):
+            bounds = await self.db[PRODUCTS_COLLECTION].aggregate(category_bounds_pipeline(category)).to_list(length=1)
+            if bounds:
+                await self.db[CATEGORY_SUMMARY_COLLECTION].update_one(
+                    {"_id": category}, {"$set": {"min_price": bounds[0]["min_price"], "max_price": bounds[0]["max_price"]}}
+                )
+
+    async def record_stock_movements(self, movements):
+        """Append movements to the ledger and upsert their hour and day buckets, one bulk write per collection."""
+        if not movements:
+            return
+        moment = datetime.now(timezone.utc)
+        try:
+            await self.db[STOCK_MOVEMENTS_COLLECTION].insert_many([{**movement, "at": moment} for movement in movements], ordered=False)
+            await self.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].bulk_write([
+                UpdateOne({"_id": bucket["_id"]}, movement_bucket_update(bucket), upsert=True)
+                for bucket in movement_buckets(movements, moment)
+            ], ordered=False)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except (BulkWriteError, OperationFailure) as e:
+            print(f"Error while recording stock movements: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    async def search_products(self, query, limit=50, skip=0, fields=None):
+        """Search for products using a text index, ranked by relevance."""
+        try:
+            cursor = (
+                self.db[PRODUCTS_COLLECTION]
+                .find({"$text": {"$search": query}}, build_projection(fields, TEXT_SCORE_PROJECTION))
+                .sort(TEXT_SCORE_SORT)
+                .skip(skip)
+                .limit(limit)
+            )
+            return await cursor.to_list(length=limit)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the search operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return []
+
+    async def load_prefix_index(self):
+        """Rebuild the in-process prefix index from the products collection."""
+        projection = {field: 1 for field in INDEXED_FIELDS}
+        projection["_id"] = 0
+        try:
+            products = await self.db[PRODUCTS_COLLECTION].find({}, projection).batch_size(STREAM_BATCH_SIZE).to_list(length=None)
+            self.prefix_index.load(products)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    def suggest_products(self, prefix, limit=10):
+        """Return products whose name, category, or ID has a word starting with 'prefix'."""
+        return self.prefix_index.search(prefix, limit)
+
+    async def add_product(self, product):
+        """Insert a new product into the products collection. DuplicateKeyError is re-raised."""
+        try:
+            result = await self.db[PRODUCTS_COLLECTION].insert_one(product)
+            self.prefix_index.upsert(product)
+            await self.record_stock_movements(stock_movements([(product, quantity_change(None, product))], "create"))
+            return result
+        except DuplicateKeyError:
+            raise
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return None
+
+    async def get_products_page(self, after=None, limit=100, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Fetch one page of filtered products in sort order, starting after the given keyset cursor."""
+        query, sort = build_product_query(after, filters, sort_field, descending)
+        try:
+            return await self.db[PRODUCTS_COLLECTION].find(query, build_projection(fields)).sort(sort).limit(limit).to_list(length=limit)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return []
+
+    def iter_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Return an async cursor over filtered products in sort order, for streaming responses."""
+        query, sort = build_product_query(after, filters, sort_field, descending)
+        cursor = self.db[PRODUCTS_COLLECTION].find(query, build_projection(fields)).sort(sort).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    async def get_product_by_id(self, product_id):
+        """Fetch a specific product using its ProductID, reading through the product cache."""
+        product = self.cache.get(product_id)
+        if product is not None:
+            return product
+
+        generation = self.cache.generation
+        try:
+            product = await self.db[PRODUCTS_COLLECTION].find_one({'ProductID': product_id})
+            if product is not None:
+                self.cache.set(product_id, product, generation)
+            return product
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return None
+
+    async def get_products_by_ids(self, product_ids):
+        """Fetch several products with one $in query, serving cached products without touching the database."""
+        products = {}
+        for product_id in product_ids:
+            product = self.cache.get(product_id)
+            if product is not None:
+                products[product_id] = product
+
+        uncached_ids = [product_id for product_id in product_ids if product_id not in products]
+        if not uncached_ids:
+            return products
+
+        generation = self.cache.generation
+        try:
+            async for product in self.db[PRODUCTS_COLLECTION].find({'ProductID': {'$in': uncached_ids}}):
+                self.cache.set(product['ProductID'], product, generation)
+                products[product['ProductID']] = product
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The products could not be fetched") from e
+        except OperationFailure as e:
+            print(f"Error during the retrieval operation: {e}")
+            raise StorageError("The products could not be fetched") from e
+        return products
+
+    async def get_product_by_quantity(self, order="highest"):
+        """Retrieve a product based on its quantity."""
+        try:
+            sort_order = -1 if order == "highest" else 1
+            return await self.db[PRODUCTS_COLLECTION].find_one(sort=[("AvailableQuantity", sort_order)])
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the retrieval operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return None
+
+    async def update_product_by_id(self, product_id, data):
+        """Update product details and return the product as it was before the update, or None if no product matched.
+
+        StorageError is raised when the database fails, so the failure is not reported as a 404.
+        """
+        try:
+            previous_product = await self.db[PRODUCTS_COLLECTION].find_one_and_update(
+                {'ProductID': product_id}, {"$set": data}, return_document=ReturnDocument.BEFORE
+            )
+            if previous_product is not None:
+                current_product = {**previous_product, **data}
+                self.prefix_index.replace(product_id, current_product)
+                await self.record_stock_movements(
+                    stock_movements([(current_product, quantity_change(previous_product, current_product))], "update")
+                )
+            return previous_product
+        except DuplicateKeyError:
+            raise
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The product update failed") from e
+        except OperationFailure as e:
+            print(f"Error during the update operation: {e}")
+            raise StorageError("The product update failed") from e
+        finally:
+            self.cache.invalidate(product_id, data.get('ProductID'))
+
+    async def adjust_stock(self, product_id, delta):
+        """Atomically add 'delta' to AvailableQuantity without letting it drop below zero.
+
+        Returns the updated product, or None if the product does not exist or has too little stock.
+        StorageError is raised when the database fails.
+        """
+        query = {'ProductID': product_id}
+        if delta < 0:
+            query['AvailableQuantity'] = {'$gte': -delta}
+
+        try:
+            product = await self.db[PRODUCTS_COLLECTION].find_one_and_update(
+                query, {"$inc": {'AvailableQuantity': delta}}, return_document=ReturnDocument.AFTER
+            )
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The stock update failed") from e
+        except OperationFailure as e:
+            print(f"Error during the stock update operation: {e}")
+            raise StorageError("The stock update failed") from e
+        finally:
+            self.cache.invalidate(product_id)
+
+        if product is not None:
+            await self.record_stock_movements(stock_movements([(product, delta)], "adjustment"))
+        return product
+
+    async def supports_transactions(self):
+        """Return True if the server is a replica set member or mongos, which is required for transactions."""
+        if self._supports_transactions is None:
+            try:
+                hello = await self.client.admin.command("hello")
+                self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+            except Exception:
+                self._supports_transactions = False
+        return self._supports_transactions
+
+    async def reserve_stock(self, quantities):
+        """Decrement stock for several products at once, all or nothing.
+
+        Returns (reserved_products, failed_product_ids) like Database.reserve_stock. StorageError is
+        raised when the database fails.
+        """
+        try:
+            if await self.supports_transactions():
+                reserved_products, failed_product_ids = await self._reserve_stock_in_transaction(quantities)
+            else:
+                reserved_products, failed_product_ids = await self._reserve_stock_with_compensation(quantities)
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The stock reservation failed") from e
+        except OperationFailure as e:
+            print(f"Error during the stock reservation operation: {e}")
+            raise StorageError("The stock reservation failed") from e
+        finally:
+            self.cache.invalidate(*quantities)
+
+        """Once the stock is decremented, its movements are recorded even if the caller is cancelled meanwhile."""
+        await asyncio.shield(self.record_stock_movements(stock_movements(
+            [(product, -quantities[product['ProductID']]) for product in reserved_products], "reservation"
+        )))
+        return reserved_products, failed_product_ids
+
+    async def _reserve_stock_in_transaction(self, quantities):
+        """Reserve stock with one guarded bulk_write inside a transaction, retried by with_transaction()."""
+        collection = self.db[PRODUCTS_COLLECTION]
+
+        async def reserve(session):
+            products = {
+                product['ProductID']: product
+                async for product in collection.find({'ProductID': {'$in': list(quantities)}}, session=session)
+            }
+            failed = [product_id for product_id, quantity in quantities.items()
+                      if product_id not in products or products[product_id].get('AvailableQuantity', 0) < quantity]
+            if failed:
+                await session.abort_transaction()
+                return [], failed
+
+            operations = [
+                UpdateOne({'ProductID': product_id, 'AvailableQuantity': {'$gte': quantity}}, {"$inc": {'AvailableQuantity': -quantity}})
+                for product_id, quantity in quantities.items()
+            ]
+            result = await collection.bulk_write(operations, ordered=False, session=session)
+            if result.matched_count < len(operations):
+                await session.abort_transaction()
+                return [], list(quantities)
+            for product_id, quantity in quantities.items():
+                products[product_id]['AvailableQuantity'] -= quantity
+            return list(products.values()), []
+
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(reserve)
+
+    async def _reserve_stock_with_compensation(self, quantities):
+        """Reserve stock one guarded $inc at a time and undo the applied ones if any item falls short.
+
+        Used on standalone servers, where transactions are unavailable; see Database._reserve_stock_with_compensation.
+
+        The applied steps are also undone when the caller is cancelled, as async_api's request timeout does.
+        A cancelled step may still be applied by the driver, so it is awaited and undone with the others.
+        """
+        collection = self.db[PRODUCTS_COLLECTION]
+        reserved = []
+
+        async def undo():
+            if reserved:
+                await collection.bulk_write([
+                    UpdateOne({'ProductID': item['ProductID']}, {"$inc": {'AvailableQuantity': quantities[item['ProductID']]}})
+                    for item in reserved
+                ], ordered=False)
+
+        for product_id, quantity in quantities.items():
+            step = asyncio.ensure_future(collection.find_one_and_update(
+                {'ProductID': product_id, 'AvailableQuantity': {'$gte': quantity}},
+                {"$inc": {'AvailableQuantity': -quantity}},
+                return_document=ReturnDocument.AFTER
+            ))
+            try:
+                product = await asyncio.shield(step)
+            except BaseException:
+                await asyncio.wait([step])
+                if step.exception() is None and step.result() is not None:
+                    reserved.append(step.result())
+                await asyncio.shield(undo())
+                raise
+            if product is None:
+                await undo()
+                return [], [product_id]
+            reserved.append(product)
+        return reserved, []
+
+    async def delete_product_by_id(self, product_id):
+        """Remove a product and return it, or None if no product matched. StorageError is raised when the database fails."""
+        try:
+            deleted_product = await self.db[PRODUCTS_COLLECTION].find_one_and_delete({'ProductID': product_id})
+            if deleted_product is not None:
+                self.prefix_index.remove(product_id)
+                await self.record_stock_movements(stock_movements([(deleted_product, quantity_change(deleted_product, None))], "delete"))
+            return deleted_product
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The product delete failed") from e
+        except OperationFailure as e:
+            print(f"Error during the delete operation: {e}")
+            raise StorageError("The product delete failed") from e
+        finally:
+            self.cache.invalidate(product_id)
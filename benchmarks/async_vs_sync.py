@@ -0,0 +1,92 @@
+# Compare the concurrency ceiling of the Flask app (api.py) and the asyncio app (async_api.py).
+# Both servers must be running against the same database, e.g.:
+#   gunicorn -c gunicorn.conf.py api:app
+#   hypercorn async_api:app --bind 0.0.0.0:5001
+#   python benchmarks/async_vs_sync.py --sync-url http://localhost:5000 --async-url http://localhost:5001
+import click
+import json
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from load_runner import percentile
+
+# Status codes that count as a successful response.
+OK_STATUSES = (200, 304)
+
+
+# Send requests to the given paths in a loop until the deadline, recording latency and errors.
+def run_client(base_url, paths, deadline, timeout):
+    session = requests.Session()
+    latencies, errors, position = [], 0, 0
+    while time.perf_counter() < deadline:
+        path = paths[position % len(paths)]
+        position += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}{path}", timeout=timeout)
+            response.content
+            if response.status_code not in OK_STATUSES:
+                errors += 1
+                continue
+        except requests.RequestException:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    session.close()
+    return latencies, errors
+
+
+# Run one load step at a fixed number of concurrent clients and summarize it.
+def run_step(base_url, paths, concurrency, duration, timeout):
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: run_client(base_url, paths, deadline, timeout), range(concurrency)))
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    errors = sum(client_errors for _, client_errors in results)
+    total = len(latencies) + errors
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "error_rate": round(errors / total, 4) if total else 1.0
+    }
+
+
+# Step up the concurrency until the server stops meeting the latency and error budget.
+def find_ceiling(base_url, paths, levels, duration, timeout, max_p99_ms, max_error_rate):
+    steps, ceiling = [], None
+    for concurrency in levels:
+        step = run_step(base_url, paths, concurrency, duration, timeout)
+        steps.append(step)
+        click.echo(f"{base_url} concurrency={concurrency} rps={step['throughput_rps']} p99={step['p99_ms']}ms errors={step['error_rate']}", err=True)
+        if step["error_rate"] > max_error_rate or step["p99_ms"] is None or step["p99_ms"] > max_p99_ms:
+            break
+        ceiling = concurrency
+    return {"url": base_url, "concurrency_ceiling": ceiling, "steps": steps}
+
+
+@click.command(help="Steps up concurrent load against the sync and async apps and prints the results as JSON.")
+@click.option('--sync-url', default='http://localhost:5000', show_default=True, help='Base URL of the Flask app.')
+@click.option('--async-url', default='http://localhost:5001', show_default=True, help='Base URL of the asyncio app.')
+@click.option('--path', 'paths', multiple=True, default=['/products/1', '/products?limit=50', '/products/search?q=laptop'], show_default=True, help='Path to request; repeat to rotate through several.')
+@click.option('--levels', default='8,16,32,64,128,256,512', show_default=True, help='Comma-separated concurrency levels to try in order.')
+@click.option('--duration', type=float, default=10.0, show_default=True, help='Seconds to run each concurrency level.')
+@click.option('--timeout', type=float, default=10.0, show_default=True, help='Client-side request timeout in seconds.')
+@click.option('--max-p99-ms', type=float, default=500.0, show_default=True, help='p99 latency budget; the ceiling is the last level within it.')
+@click.option('--max-error-rate', type=float, default=0.01, show_default=True, help='Error rate budget; the ceiling is the last level within it.')
+def main(sync_url, async_url, paths, levels, duration, timeout, max_p99_ms, max_error_rate):
+    levels = [int(level) for level in levels.split(',')]
+    results = {
+        "paths": list(paths),
+        "budget": {"max_p99_ms": max_p99_ms, "max_error_rate": max_error_rate},
+        "sync": find_ceiling(sync_url, paths, levels, duration, timeout, max_p99_ms, max_error_rate),
+        "async": find_ceiling(async_url, paths, levels, duration, timeout, max_p99_ms, max_error_rate)
+    }
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Synthetic product catalog generator for benchmarks.
+# The same size and seed always produce the same catalog, so runs against different builds are comparable.
+import math
+import random
+
+# Named catalog sizes accepted wherever a size is expected.
+CATALOG_SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# Categories with typical median prices and the nouns used to name their products.
+CATEGORIES = [
+    ("Electronics", 350, ["Laptop", "Smartphone", "Headphones", "Monitor", "Tablet", "Camera", "Speaker", "Charger"]),
+    ("Apparel", 40, ["T-shirt", "Jeans", "Jacket", "Sneakers", "Hoodie", "Dress", "Scarf", "Cap"]),
+    ("Home", 60, ["Lamp", "Blender", "Kettle", "Pillow", "Blanket", "Vase", "Clock", "Rug"]),
+    ("Furniture", 250, ["Bookshelf", "Desk", "Chair", "Sofa", "Wardrobe", "Nightstand", "Bench", "Cabinet"]),
+    ("Sports", 80, ["Racket", "Football", "Yoga Mat", "Dumbbell", "Helmet", "Bicycle", "Tent", "Backpack"]),
+    ("Books", 20, ["Novel", "Cookbook", "Atlas", "Biography", "Guide", "Anthology", "Textbook", "Journal"]),
+    ("Toys", 30, ["Puzzle", "Robot", "Doll", "Kite", "Board Game", "Train Set", "Blocks", "Plush"]),
+    ("Beauty", 25, ["Perfume", "Lipstick", "Shampoo", "Lotion", "Serum", "Brush", "Mascara", "Soap"]),
+    ("Grocery", 8, ["Coffee", "Tea", "Olive Oil", "Pasta", "Honey", "Granola", "Chocolate", "Rice"]),
+    ("Garden", 45, ["Hose", "Shovel", "Planter", "Seeds", "Pruner", "Sprinkler", "Lantern", "Trowel"]),
+    ("Automotive", 70, ["Wiper", "Floor Mat", "Jump Starter", "Car Cover", "Tire Gauge", "Polish", "Dash Cam", "Seat Cover"]),
+    ("Office", 15, ["Stapler", "Notebook", "Pen Set", "Binder", "Desk Organizer", "Label Maker", "Whiteboard", "Calculator"]),
+]
+BRANDS = ["Acme", "Northwind", "Contoso", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Hooli", "Vandelay", "Soylent", "Tyrell"]
+ADJECTIVES = ["Classic", "Pro", "Compact", "Deluxe", "Eco", "Ultra", "Smart", "Premium", "Essential", "Travel", "Mini", "Max"]
+
+# Zipf exponent of the category distribution: a few categories hold most products, as in real catalogs.
+DEFAULT_CATEGORY_SKEW = 1.1
+# Share of products generated out of stock.
+OUT_OF_STOCK_RATE = 0.03
+
+
+def parse_catalog_size(value):
+    """Accept a named size ('10k', '100k', '1M') or a plain number of products."""
+    if value in CATALOG_SIZES:
+        return CATALOG_SIZES[value]
+    size = int(value)
+    if size < 1:
+        raise ValueError("catalog size must be positive")
+    return size
+
+def category_weights(skew=DEFAULT_CATEGORY_SKEW):
+    """Zipf weights for CATEGORIES in their listed order."""
+    return [1 / (rank ** skew) for rank in range(1, len(CATEGORIES) + 1)]
+
+def vocabulary():
+    """Words that appear in generated product names and categories, for search and suggest requests."""
+    words = set(BRANDS) | set(ADJECTIVES)
+    for category, _, nouns in CATEGORIES:
+        words.add(category)
+        words.update(word for noun in nouns for word in noun.split())
+    return sorted(words)
+
+def generate_catalog(size, seed=0, skew=DEFAULT_CATEGORY_SKEW):
+    """Yield 'size' products with ProductIDs "1" to str(size)."""
+    rng = random.Random(seed)
+    weights = category_weights(skew)
+    for number in range(1, size + 1):
+        category, median_price, nouns = rng.choices(CATEGORIES, weights)[0]
+        """Prices are log-normal around the category median; quantities are mostly moderate with a long tail."""
+        price = max(1, int(round(rng.lognormvariate(math.log(median_price), 0.6))))
+        quantity = 0 if rng.random() < OUT_OF_STOCK_RATE else int(rng.expovariate(1 / 150)) + 1
+        yield {
+            "ProductID": str(number),
+            "ProductName": f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(nouns)}",
+            "ProductCategory": category,
+            "Price": price,
+            "AvailableQuantity": quantity
+        }
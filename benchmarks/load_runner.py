@@ -0,0 +1,415 @@
+# Reproducible load test that drives every route in api.py with a weighted mix of operations.
+#
+#   python benchmarks/load_runner.py generate --size 100k > catalog.ndjson
+#   python benchmarks/load_runner.py run --size 100k --concurrency 32 --duration 60 --output run.json
+#   python benchmarks/load_runner.py run --in-memory --size 10k --duration 20
+#   python benchmarks/load_runner.py compare baseline.json run.json
+#
+# 'run' seeds the catalog through POST /products/bulk unless --no-seed is given, then reports
+# throughput and p50/p95/p99 latency per operation as JSON.
+import click
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from catalog import CATEGORIES, DEFAULT_CATEGORY_SKEW, generate_catalog, parse_catalog_size, vocabulary
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Operation weights used when --mix is not given. Admin routes are available but off by default.
+DEFAULT_MIX = (
+    "get_product=35,list_page=10,stream=2,export=1,batch_get=5,search=10,suggest=8,analytics=5,stock_ranking=3,"
+    "low_stock=3,movements=2,product_movements=2,create=4,update=4,adjust_stock=8,reserve=4,delete=3,bulk=1,"
+    "cache_stats=1,metrics=0,consistency=0,rebuild=0"
+)
+# Products per request in the 'batch_get', 'reserve' and 'bulk' operations.
+BATCH_GET_SIZE = 20
+BULK_SIZE = 100
+# Status codes that are an expected outcome rather than a failure, e.g. insufficient stock.
+EXPECTED_STATUSES = (304, 404, 409)
+
+
+# Return the value at the given percentile of an already sorted list.
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# One simulated client: its own HTTP session, random stream and the products it created.
+class Client:
+    def __init__(self, base_url, catalog_size, seed, run_id):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.rng = random.Random(seed)
+        self.catalog_size = catalog_size
+        self.id_prefix = f"bench-{run_id}-{seed}-"
+        self.created = []
+        self.created_count = 0
+        self.words = vocabulary()
+
+    def product_id(self):
+        return str(self.rng.randint(1, self.catalog_size))
+
+    def new_product(self):
+        self.created_count += 1
+        return {
+            "ProductID": f"{self.id_prefix}{self.created_count}",
+            "ProductName": f"{self.rng.choice(self.words)} {self.rng.choice(self.words)}",
+            "ProductCategory": "Benchmark",
+            "Price": self.rng.randint(1, 500),
+            "AvailableQuantity": self.rng.randint(0, 500)
+        }
+
+    def request(self, method, path, **kwargs):
+        return self.session.request(method, f"{self.base_url}{path}", timeout=30, **kwargs)
+
+
+def op_get_product(client):
+    return client.request("GET", f"/products/{client.product_id()}")
+
+def op_list_page(client):
+    params = {"limit": 50, "sort": client.rng.choice(["ProductID", "-Price", "AvailableQuantity"])}
+    if client.rng.random() < 0.5:
+        params["after"] = client.product_id() if params["sort"] == "ProductID" else f"{client.rng.randint(0, 500)},{client.product_id()}"
+    return client.request("GET", "/products", params=params)
+
+def op_stream(client):
+    return client.request("GET", "/products", params={"format": "ndjson", "limit": 1000, "after": client.product_id()})
+
+def op_export(client):
+    # One category per request; the largest categories still export thousands of products.
+    category = client.rng.choice(CATEGORIES)[0]
+    return client.request("GET", "/products/export", params={"format": client.rng.choice(["ndjson", "csv"]), "category": category})
+
+def op_batch_get(client):
+    return client.request("POST", "/products/batch-get", json={"ids": [client.product_id() for _ in range(BATCH_GET_SIZE)]})
+
+def op_search(client):
+    return client.request("GET", "/products/search", params={"q": client.rng.choice(client.words), "limit": 20})
+
+def op_suggest(client):
+    word = client.rng.choice(client.words)
+    return client.request("GET", "/products/suggest", params={"prefix": word[:client.rng.randint(2, 4)]})
+
+def op_analytics(client):
+    return client.request("GET", "/products/analytics")
+
+def op_stock_ranking(client):
+    order = client.rng.choice(["lowest", "highest"])
+    roll = client.rng.random()
+    if roll < 0.2:
+        params = {"per_category": "true", "limit": 5}
+    elif roll < 0.6:
+        params = {"category": client.rng.choice(CATEGORIES)[0], "limit": 10}
+    else:
+        params = {"limit": 10}
+    return client.request("GET", f"/products/stock/{order}", params=params)
+
+def op_low_stock(client):
+    threshold = client.rng.randint(1, 50)
+    params = {"threshold": threshold, "limit": 50}
+    if client.rng.random() < 0.5:
+        params["after"] = f"{client.rng.randint(0, threshold - 1)},{client.product_id()}"
+    return client.request("GET", "/products/stock/below", params=params)
+
+def op_movements(client):
+    return client.request("GET", "/products/analytics/movements", params={"days": client.rng.choice([1, 7, 30])})
+
+def op_product_movements(client):
+    params = {"days": client.rng.choice([1, 7]), "granularity": client.rng.choice(["day", "hour"])}
+    return client.request("GET", f"/products/{client.product_id()}/movements", params=params)
+
+def op_create(client):
+    product = client.new_product()
+    response = client.request("POST", "/products", json=product)
+    if response.status_code == 201:
+        client.created.append(product["ProductID"])
+    return response
+
+def op_update(client):
+    product_id = client.rng.choice(client.created) if client.created else client.product_id()
+    return client.request("PUT", f"/products/{product_id}", json={"Price": client.rng.randint(1, 500)})
+
+def op_adjust_stock(client):
+    delta = client.rng.choice([-3, -2, -1, 1, 2, 3])
+    return client.request("PATCH", f"/products/{client.product_id()}/stock", json={"delta": delta})
+
+def op_reserve(client):
+    items = [{"ProductID": client.product_id(), "quantity": 1} for _ in range(client.rng.randint(1, 3))]
+    return client.request("POST", "/products/reservations", json={"items": items})
+
+def op_delete(client):
+    if not client.created:
+        return None
+    return client.request("DELETE", f"/products/{client.created.pop()}")
+
+def op_bulk(client):
+    body = "\n".join(json.dumps(client.new_product()) for _ in range(BULK_SIZE))
+    return client.request("POST", "/products/bulk", params={"mode": "upsert"}, data=body.encode("utf-8"),
+                          headers={"Content-Type": "application/x-ndjson"})
+
+def op_cache_stats(client):
+    return client.request("GET", "/products/cache/stats")
+
+def op_metrics(client):
+    return client.request("GET", "/metrics")
+
+def op_consistency(client):
+    return client.request("GET", "/products/analytics/consistency")
+
+def op_rebuild(client):
+    return client.request("POST", "/products/analytics/rebuild")
+
+OPERATIONS = {
+    "get_product": op_get_product,
+    "list_page": op_list_page,
+    "stream": op_stream,
+    "export": op_export,
+    "batch_get": op_batch_get,
+    "search": op_search,
+    "suggest": op_suggest,
+    "analytics": op_analytics,
+    "stock_ranking": op_stock_ranking,
+    "low_stock": op_low_stock,
+    "movements": op_movements,
+    "product_movements": op_product_movements,
+    "create": op_create,
+    "update": op_update,
+    "adjust_stock": op_adjust_stock,
+    "reserve": op_reserve,
+    "delete": op_delete,
+    "bulk": op_bulk,
+    "cache_stats": op_cache_stats,
+    "metrics": op_metrics,
+    "consistency": op_consistency,
+    "rebuild": op_rebuild,
+}
+
+
+# Parse 'name=weight,...' into a dict of positive weights.
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise click.BadParameter(f"unknown operation '{name}'; choose from: {', '.join(OPERATIONS)}")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise click.BadParameter(f"invalid weight for '{name}'")
+        if weight > 0:
+            mix[name] = weight
+    if not mix:
+        raise click.BadParameter("at least one operation needs a positive weight")
+    return mix
+
+
+# Start api.app on a local port in a background thread and return its base URL.
+def start_in_process_server(in_memory):
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(REPO_ROOT)
+    if in_memory:
+        # api reads its storage settings at import time.
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = ":memory:"
+    import api
+
+    if not api.bootstrap():
+        raise click.ClickException("Bootstrap failed: the indexes could not be created")
+    # Per-request access log lines would swamp the report on stderr.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+# Load the catalog with one streamed upsert request, so the analytics summary is rebuilt once.
+def seed_catalog(base_url, size, seed, skew):
+    started = time.perf_counter()
+    body = (json.dumps(product).encode("utf-8") + b"\n" for product in generate_catalog(size, seed, skew))
+    response = requests.post(f"{base_url}/products/bulk", params={"mode": "upsert"}, data=body,
+                             headers={"Content-Type": "application/x-ndjson"})
+    if response.status_code != 200:
+        raise click.ClickException(f"Seeding failed with {response.status_code}: {response.text}")
+    result = response.json()
+    if result["error_count"]:
+        raise click.ClickException(f"Seeding reported {result['error_count']} errors: {result['errors'][:5]}")
+    return time.perf_counter() - started
+
+
+# Run one client until the deadline; samples taken before 'record_after' are discarded as warmup.
+def run_client(client, operations, weights, record_after, deadline):
+    samples = []
+    while time.perf_counter() < deadline:
+        name = client.rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = OPERATIONS[name](client)
+            if response is None:
+                continue
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        finished = time.perf_counter()
+        if started >= record_after:
+            samples.append((name, finished - started, status))
+    client.session.close()
+    return samples
+
+
+# Summarize (latency, status) samples into counts, throughput and latency percentiles.
+def summarize(samples, duration):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    errors = 0
+    for _, status in samples:
+        key = str(status) if status is not None else "exception"
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or (status >= 400 and status not in EXPECTED_STATUSES):
+            errors += 1
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / duration, 2),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "statuses": statuses
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def cli():
+    """Catalog generation, load tests and run comparison for the inventory API."""
+    pass
+
+
+@cli.command(help="Writes a synthetic catalog as NDJSON.")
+@click.option('--size', default='10k', show_default=True, help='Number of products, or 10k, 100k or 1M.')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed; the same seed gives the same catalog.')
+@click.option('--skew', type=float, default=DEFAULT_CATEGORY_SKEW, show_default=True, help='Zipf exponent of the category distribution.')
+@click.option('--output', type=click.File('w'), default='-', help='File to write to (default: stdout).')
+def generate(size, seed, skew, output):
+    for product in generate_catalog(parse_catalog_size(size), seed, skew):
+        output.write(json.dumps(product) + "\n")
+
+
+@cli.command(help="Seeds a catalog, drives the API with a weighted operation mix and reports latency percentiles as JSON.")
+@click.option('--url', default='http://localhost:5000', show_default=True, help='Base URL of a running API.')
+@click.option('--in-process', is_flag=True, help='Start api.app in this process instead of using --url (uses MONGO_URI).')
+@click.option('--in-memory', is_flag=True, help='Like --in-process, but backed by an in-memory SQLite database instead of a mongod.')
+@click.option('--size', default='10k', show_default=True, help='Catalog size: a number of products, or 10k, 100k or 1M.')
+@click.option('--seed/--no-seed', 'seed_data', default=True, show_default=True, help='Load the catalog before the run.')
+@click.option('--random-seed', type=int, default=0, show_default=True, help='Seed for the catalog and the operation sequence.')
+@click.option('--skew', type=float, default=DEFAULT_CATEGORY_SKEW, show_default=True, help='Zipf exponent of the category distribution.')
+@click.option('--concurrency', type=int, default=16, show_default=True, help='Number of concurrent clients.')
+@click.option('--duration', type=float, default=30.0, show_default=True, help='Seconds of measured load.')
+@click.option('--warmup', type=float, default=5.0, show_default=True, help='Seconds of unmeasured load before the measurement starts.')
+@click.option('--mix', default=DEFAULT_MIX, show_default=True, help='Operation weights as name=weight pairs.')
+@click.option('--output', type=click.File('w'), default='-', help='File to write the JSON report to (default: stdout).')
+def run(url, in_process, in_memory, size, seed_data, random_seed, skew, concurrency, duration, warmup, mix, output):
+    catalog_size = parse_catalog_size(size)
+    weights_by_name = parse_mix(mix)
+    base_url = start_in_process_server(in_memory) if in_process or in_memory else url.rstrip('/')
+
+    seed_seconds = None
+    if seed_data:
+        click.echo(f"Seeding {catalog_size} products into {base_url} ...", err=True)
+        seed_seconds = seed_catalog(base_url, catalog_size, random_seed, skew)
+        click.echo(f"Seeded in {seed_seconds:.1f}s ({catalog_size / seed_seconds:.0f} rows/sec)", err=True)
+
+    operations = list(weights_by_name)
+    weights = [weights_by_name[name] for name in operations]
+    run_id = uuid.uuid4().hex[:8]
+    clients = [Client(base_url, catalog_size, random_seed * 1000 + index, run_id) for index in range(concurrency)]
+
+    click.echo(f"Running {concurrency} clients for {warmup:.0f}s warmup + {duration:.0f}s ...", err=True)
+    record_after = time.perf_counter() + warmup
+    deadline = record_after + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda client: run_client(client, operations, weights, record_after, deadline), clients))
+
+    by_operation = {}
+    for samples in results:
+        for name, latency, status in samples:
+            by_operation.setdefault(name, []).append((latency, status))
+    all_samples = [sample for samples in by_operation.values() for sample in samples]
+
+    report = {
+        "config": {
+            "url": base_url,
+            "backend": "sqlite-memory" if in_memory else "mongodb",
+            "catalog_size": catalog_size,
+            "random_seed": random_seed,
+            "category_skew": skew,
+            "concurrency": concurrency,
+            "duration_seconds": duration,
+            "warmup_seconds": warmup,
+            "mix": weights_by_name
+        },
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        },
+        "seed_seconds": round(seed_seconds, 3) if seed_seconds is not None else None,
+        "totals": summarize(all_samples, duration),
+        "operations": {name: summarize(by_operation[name], duration) for name in sorted(by_operation)}
+    }
+    output.write(json.dumps(report, indent=2) + "\n")
+
+
+@cli.command(help="Compares two run reports and exits non-zero if p95 latency or throughput regressed beyond the threshold.")
+@click.argument('baseline', type=click.File('r'))
+@click.argument('current', type=click.File('r'))
+@click.option('--threshold', type=float, default=0.10, show_default=True, help='Allowed relative regression, e.g. 0.10 for 10%.')
+def compare(baseline, current, threshold):
+    baseline, current = json.load(baseline), json.load(current)
+    rows = [("totals", baseline["totals"], current["totals"])]
+    rows += [(name, baseline["operations"][name], current["operations"][name])
+             for name in sorted(current["operations"]) if name in baseline["operations"]]
+
+    regressions = []
+    click.echo(f"{'operation':<14}{'p95 before':>12}{'p95 after':>12}{'rps before':>12}{'rps after':>12}")
+    for name, before, after in rows:
+        click.echo(f"{name:<14}{before['p95_ms'] or 0:>12.2f}{after['p95_ms'] or 0:>12.2f}{before['throughput_rps']:>12.1f}{after['throughput_rps']:>12.1f}")
+        if before["p95_ms"] and after["p95_ms"] and after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {after['p95_ms']:.2f} ms")
+        if before["throughput_rps"] and after["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} rps")
+
+    if regressions:
+        click.echo("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+    click.echo("\nNo regressions beyond the threshold.")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Layout of the shared generation counter: one unsigned 64-bit integer.
+COUNTER_FORMAT = "<Q"
+COUNTER_SIZE = struct.calcsize(COUNTER_FORMAT)
+
+
+class SharedCounter:
+    """A counter in a file that every process on the host maps into memory.
+
+    Reading it is a memory access. Increments hold an exclusive flock, so concurrent ones are not lost.
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError("A shared cache generation file needs fcntl, which this platform does not have")
+        self.path = path
+        self._pid = None
+        self._open()
+
+    def _open(self):
+        """Map the file, again after a fork so that each process holds its own flock."""
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < COUNTER_SIZE:
+            os.ftruncate(fd, COUNTER_SIZE)
+        self._fd = fd
+        self._map = mmap.mmap(fd, COUNTER_SIZE)
+        self._pid = os.getpid()
+
+    def value(self):
+        self._open()
+        return struct.unpack_from(COUNTER_FORMAT, self._map)[0]
+
+    def increment(self):
+        """Add one to the counter and return the value it had before."""
+        self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            value = struct.unpack_from(COUNTER_FORMAT, self._map)[0]
+            struct.pack_into(COUNTER_FORMAT, self._map, 0, value + 1)
+            return value
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class ProductCache:
+    """A thread-safe, in-process LRU cache with a per-entry time-to-live.
+
+    Entries are copied on the way in and out, so callers can mutate the documents they get back
+    (e.g. converting '_id' to a string) without corrupting the cached copy.
+
+    With 'shared_generation' set to a file path, every invalidation also bumps a counter in that file,
+    and a cache that sees the counter moved drops all its entries. Processes on one host that share
+    the file, such as gunicorn workers, then never serve a product older than another worker's last write.
+    """
+
+    def __init__(self, max_size=1024, ttl=30.0, shared_generation=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._shared = SharedCounter(shared_generation) if shared_generation else None
+        self._shared_seen = self._shared.value() if self._shared else 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Return a copy of the cached value, or None if it is missing or expired."""
+        with self._lock:
+            self._sync_shared()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    @property
+    def generation(self):
+        """A counter that every invalidation bumps. Read it before fetching a value to pass to set()."""
+        with self._lock:
+            self._sync_shared()
+            return self._generation
+
+    def _sync_shared(self):
+        """Drop every entry if another process invalidated anything since the last check. Call with the lock held."""
+        if self._shared is None:
+            return
+        value = self._shared.value()
+        if value != self._shared_seen:
+            self._shared_seen = value
+            self._generation += 1
+            self._entries.clear()
+
+    def set(self, key, value, generation=None):
+        """Store a copy of the value, evicting the least recently used entry when full.
+
+        If 'generation' is given and keys were invalidated since it was read, the value is not stored:
+        it may have been fetched before a write that the invalidation was for.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._sync_shared()
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        """Drop the given keys from the cache."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            if self._shared is not None:
+                """Another process's invalidation that lands just before this one still has to clear the cache."""
+                previous = self._shared.increment()
+                if previous != self._shared_seen:
+                    self._entries.clear()
+                self._shared_seen = previous + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl
+            }
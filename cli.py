@@ -1,6 +1,10 @@
 # Import the necessary modules for the CLI and for making HTTP requests.
 import click
+import json
 import requests
+import time
+import zlib
+from jsonstream import iter_json_documents
 
 # Define the base URL for our API endpoints.
 BASE_URL = "http://localhost:5000/products"
@@ -44,6 +48,84 @@ def view_analytics():
     else:
         click.echo("\nFailed to retrieve product analytics.\n")
 
+# Define a command to import products from a file.
+@cli.command(name="import", help="Imports products from a JSON array or NDJSON file.")
+@click.argument('file', type=click.File('rb'))
+@click.option('--mode', type=click.Choice(['insert', 'upsert']), default='insert', show_default=True, help='Insert new products only, or create and update by ProductID.')
+@click.option('--chunk-size', type=int, default=5000, show_default=True, help='Number of rows sent per request.')
+def import_products(file, mode, chunk_size):
+    totals = {"received": 0, "inserted": 0, "upserted": 0, "modified": 0, "error_count": 0}
+    started = time.perf_counter()
+
+    # Send one chunk of rows as an NDJSON request body and accumulate the results.
+    def send(rows, row_numbers):
+        response = requests.post(f"{BASE_URL}/bulk", params={'mode': mode}, data="\n".join(rows).encode("utf-8"), headers={'Content-Type': 'application/x-ndjson'})
+        if response.status_code != 200:
+            click.echo(f"Error {response.status_code}: {response.text}")
+            return False
+
+        result = response.json()
+        for field in totals:
+            totals[field] += result[field]
+        for error in result['errors']:
+            click.echo(f"Row {row_numbers[error['index']]}: {error['message']}")
+
+        elapsed = time.perf_counter() - started
+        click.echo(f"Imported {totals['received']} rows ({totals['received'] / elapsed:.0f} rows/sec)")
+        return True
+
+    # Stream the file and send it up in chunks, so the whole file is never held in memory.
+    rows, row_numbers = [], []
+    for row_number, (product, parse_error) in enumerate(iter_json_documents(file)):
+        if parse_error:
+            click.echo(f"Row {row_number}: {parse_error}")
+            totals['received'] += 1
+            totals['error_count'] += 1
+            continue
+
+        rows.append(json.dumps(product))
+        row_numbers.append(row_number)
+        if len(rows) >= chunk_size:
+            if not send(rows, row_numbers):
+                return
+            rows, row_numbers = [], []
+
+    if rows and not send(rows, row_numbers):
+        return
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"\nImport complete: {totals['inserted']} inserted, {totals['upserted']} upserted, {totals['modified']} modified, {totals['error_count']} errors.")
+    click.echo(f"{totals['received']} rows in {elapsed:.2f}s ({totals['received'] / elapsed:.0f} rows/sec)\n")
+
+# Define a command to rebuild the analytics summary.
+@cli.command(help="Rebuilds the product analytics summary from scratch.")
+def rebuild_analytics():
+    response = requests.post(f"{BASE_URL}/analytics/rebuild")
+    if response.status_code == 200:
+        click.echo("\nProduct analytics rebuilt successfully.\n")
+    else:
+        click.echo("\nFailed to rebuild product analytics.\n")
+
+# Define a command to check the analytics summary against the live data.
+@cli.command(help="Checks whether the product analytics summary is up to date.")
+def check_analytics():
+    response = requests.get(f"{BASE_URL}/analytics/consistency")
+    if response.status_code != 200:
+        click.echo("\nFailed to check product analytics.\n")
+        return
+
+    response_json = response.json()
+    if response_json['consistent']:
+        click.echo("\nProduct analytics are up to date.\n")
+        return
+
+    click.echo("\nProduct analytics are stale for the following categories:\n")
+    for mismatch in response_json['mismatches']:
+        click.echo(f"Category: {mismatch['category']}")
+        click.echo(f"Expected: {mismatch['expected']}")
+        click.echo(f"Actual: {mismatch['actual']}\n")
+    click.echo("Run 'rebuild-analytics' to refresh the summary.\n")
+
 # Define a command to list all products.
 @cli.command(help="Lists all products.")
 def list_products():
@@ -57,6 +139,113 @@ def list_products():
     else:
         click.echo("\nFailed to retrieve products.\n")
 
+# Define a command to stream the catalog to a file.
+@cli.command(help="Exports the product catalog to a file as NDJSON or CSV, gzip-compressed if OUTPUT ends in .gz.")
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'output_format', type=click.Choice(['ndjson', 'csv']), default=None, help='Output format (default: from the file name, else ndjson).')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Products the server reads per database round trip.')
+@click.option('--category', default=None, help='Only export products in this category.')
+@click.option('--fields', default=None, help='Comma-separated fields to export.')
+def export(output, output_format, batch_size, category, fields):
+    compressed = output.endswith('.gz')
+    if output_format is None:
+        output_format = 'csv' if output.removesuffix('.gz').endswith('.csv') else 'ndjson'
+    params = {'format': output_format, 'batch_size': batch_size, 'category': category, 'fields': fields}
+
+    response = requests.get(f"{BASE_URL}/export", params=params, headers={'Accept-Encoding': 'gzip'}, stream=True)
+    if response.status_code != 200:
+        click.echo(f"Error {response.status_code}: {response.text}")
+        return
+
+    # A gzip file is written with the server's compressed bytes as they arrive; they are only
+    # decompressed on the side to count rows. Otherwise requests decompresses the body.
+    compressor = None
+    if compressed and response.headers.get('Content-Encoding') == 'gzip':
+        chunks = response.raw.stream(64 * 1024, decode_content=False)
+        decompressor = zlib.decompressobj(31)
+        count_lines = lambda chunk: decompressor.decompress(chunk).count(b"\n")
+    else:
+        chunks = response.iter_content(64 * 1024)
+        count_lines = lambda chunk: chunk.count(b"\n")
+        if compressed:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    lines = 0
+    started = reported = time.perf_counter()
+    with open(output, 'wb') as file:
+        for chunk in chunks:
+            lines += count_lines(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            file.write(chunk)
+
+            # Report progress about once a second.
+            now = time.perf_counter()
+            if now - reported >= 1:
+                click.echo(f"Exported {lines} rows ({lines / (now - started):.0f} rows/sec)")
+                reported = now
+        if compressor is not None:
+            file.write(compressor.flush())
+
+    # The CSV header line is not a product.
+    rows = lines - 1 if output_format == 'csv' and lines else lines
+    elapsed = time.perf_counter() - started
+    click.echo(f"\nExport complete: {rows} rows written to {output} in {elapsed:.2f}s ({rows / elapsed:.0f} rows/sec)\n")
+
+# Print the products ranked by GET /products/stock/<order>, per category if requested.
+def show_stock_ranking(order, limit, category, per_category):
+    response = requests.get(f"{BASE_URL}/stock/{order}", params={'limit': limit, 'category': category, 'per_category': str(per_category).lower()})
+    if response.status_code != 200:
+        click.echo(f"\nFailed to retrieve the {order} stock products.\n")
+        return
+
+    response_json = response.json()
+    rankings = response_json['categories'] if per_category else [{'category': category, 'products': response_json['products']}]
+    for ranking in rankings:
+        click.echo(f"\n{order.capitalize()} stock{' in ' + str(ranking['category']) if ranking['category'] is not None else ''}:\n")
+        for product in ranking['products']:
+            click.echo(print_product_details(product))
+    click.echo()
+
+# Define commands to list the products with the least and the most stock.
+@cli.command(help="Lists the products with the lowest available quantity.")
+@click.option('--limit', type=int, default=10, show_default=True, help='Number of products to list (per category with --per-category).')
+@click.option('--category', default=None, help='Only rank products in this category.')
+@click.option('--per-category', is_flag=True, help='List the lowest stock products of every category.')
+def lowest_stock(limit, category, per_category):
+    show_stock_ranking('lowest', limit, category, per_category)
+
+@cli.command(help="Lists the products with the highest available quantity.")
+@click.option('--limit', type=int, default=10, show_default=True, help='Number of products to list (per category with --per-category).')
+@click.option('--category', default=None, help='Only rank products in this category.')
+@click.option('--per-category', is_flag=True, help='List the highest stock products of every category.')
+def highest_stock(limit, category, per_category):
+    show_stock_ranking('highest', limit, category, per_category)
+
+# Define a command to list every product below a stock threshold, fetching one page at a time.
+@cli.command(help="Lists all products whose available quantity is below a threshold, lowest first.")
+@click.option('--threshold', type=int, prompt='Stock threshold', help='List products with fewer units than this.')
+@click.option('--category', default=None, help='Only list products in this category.')
+@click.option('--page-size', type=int, default=500, show_default=True, help='Products fetched per request.')
+def low_stock(threshold, category, page_size):
+    params = {'threshold': threshold, 'category': category, 'limit': page_size}
+    count = 0
+    click.echo(f"\nProducts with fewer than {threshold} units:\n")
+    while True:
+        response = requests.get(f"{BASE_URL}/stock/below", params=params)
+        if response.status_code != 200:
+            click.echo(f"\nFailed to retrieve low stock products: {response.text}\n")
+            return
+
+        response_json = response.json()
+        for product in response_json['products']:
+            click.echo(print_product_details(product))
+        count += len(response_json['products'])
+        if not response_json['next_cursor']:
+            break
+        params['after'] = response_json['next_cursor']
+    click.echo(f"\n{count} products below the threshold.\n")
+
 # Define a command to get a specific product by ID.
 @cli.command(help="Get a product by its ID.")
 @click.option('--product-id', prompt='Please enter the Product ID', help='The ID of the product.')
@@ -70,6 +259,23 @@ def get_product(product_id):
     else:
         click.echo("\nFailed to retrieve product.\n")
 
+# Define a command to get several products by ID in one request.
+@cli.command(help="Get several products by their IDs.")
+@click.argument('product_ids', nargs=-1, required=True)
+def get_products(product_ids):
+    response = requests.post(f"{BASE_URL}/batch-get", json={'ids': list(product_ids)})
+    if response.status_code == 200:
+        response_json = response.json()
+        click.echo("\nProducts:\n")
+        for product_id in product_ids:
+            if product_id in response_json['products']:
+                click.echo(print_product_details(response_json['products'][product_id]))
+        for product_id in response_json['missing']:
+            click.echo(f"No product found with ID: {product_id}")
+        click.echo()
+    else:
+        click.echo("\nFailed to retrieve products.\n")
+
 # Define a command to search products.
 @cli.command(help="Search products based on a query.")
 @click.option('--query', prompt="\nPlease enter the product name, category, or ID you'd like to search for", help='The name, category, or ID of the product.')
@@ -1,15 +1,43 @@
 from flask_pymongo import PyMongo
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, CursorNotFound, DuplicateKeyError, OperationFailure, BulkWriteError
+from pymongo.errors import (
+    ConnectionFailure, ServerSelectionTimeoutError, CursorNotFound, DuplicateKeyError, OperationFailure, BulkWriteError, PyMongoError
+)
+from pymongo import InsertOne, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.results import InsertOneResult
 from bson.son import SON
+from datetime import datetime, timezone
+from metrics import CommandMetricsListener
+from prefix_index import INDEXED_FIELDS
+from queries import (
+    CATEGORY_SUMMARY_COLLECTION, MOVEMENT_BUCKET_FIELDS, PRODUCTS_COLLECTION, STOCK_MOVEMENT_BUCKETS_COLLECTION,
+    STOCK_MOVEMENTS_COLLECTION, SUMMARY_FIELDS_PROJECTION, TEXT_SCORE_PROJECTION, TEXT_SCORE_SORT, build_product_query, build_projection,
+    category_bounds_pipeline, category_movements_pipeline, movement_bucket_update, movement_buckets,
+    quantity_change, quantity_delta_updates, quantity_only_delta, removed_price_on_boundary, stock_movements,
+    summary_change_updates, summary_delta_update, summary_to_analytics
+)
+from storage import STREAM_BATCH_SIZE, ProductStore, StorageError
 import json
 
-# Constants
-PRODUCTS_COLLECTION = "products"
 
-
-class Database:
+class Database(ProductStore):
     def __init__(self, app):
-        self.mongo = PyMongo(app)
+        """connect=False defers the connection until first use, so the client is safe to create before workers fork."""
+        super().__init__(app)
+        self.command_listener = CommandMetricsListener(slow_query_ms=app.config.get("SLOW_QUERY_MS", 0))
+        self.mongo = PyMongo(
+            app,
+            maxPoolSize=app.config.get("MONGO_MAX_POOL_SIZE", 100),
+            minPoolSize=app.config.get("MONGO_MIN_POOL_SIZE", 0),
+            event_listeners=[self.command_listener],
+            connect=False
+        )
+        self._supports_transactions = None
+
+        """Write concern for coalesced write batches. Callers wait for per-operation results, so it must be acknowledged."""
+        w = app.config.get("WRITE_BATCH_W", 1)
+        self.batch_write_concern = WriteConcern(w=int(w) if str(w).isdigit() else w, j=app.config.get("WRITE_BATCH_JOURNAL") or None)
+        if not self.batch_write_concern.acknowledged:
+            raise ValueError("WRITE_BATCH_W must acknowledge writes so each caller can get its result")
 
     def load_sample_data(self):
         """Load sample data into the database if the products collection is empty."""
@@ -32,7 +60,12 @@ class Database:
             print(f"An unexpected error occurred: {e}")
 
     def get_product_analytics(self):
-        """Return analytics about products grouped by category."""
+        """Return category analytics and the most and least stocked products.
+
+        The categories come from one '$group' over the collection. The most and least stocked
+        products are separate sort-and-limit queries, which the AvailableQuantity index answers
+        by reading one index entry each; inside a '$facet' they would sort the whole collection.
+        """
         pipeline = [
             {
                 "$group": {
@@ -49,8 +82,64 @@ class Database:
                 "$sort": SON([("count", -1), ("_id", -1)])
             }
         ]
+        categories = []
+        try:
+            categories = list(self.mongo.db[PRODUCTS_COLLECTION].aggregate(pipeline))
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the aggregation operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return {
+            "categories": categories,
+            "most_stocked_product": self.get_product_by_quantity("highest"),
+            "least_stocked_product": self.get_product_by_quantity("lowest")
+        }
+
+    def get_category_summary(self):
+        """Return the materialized per-category analytics in the same shape as the '$group' output."""
+        try:
+            summaries = list(self.mongo.db[CATEGORY_SUMMARY_COLLECTION].find())
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+            return []
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+            return []
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return []
+
+        """Match the ordering of the '$group' pipeline: count descending, then category descending."""
+        return summary_to_analytics(summaries)
+
+    def rebuild_category_summary(self):
+        """Recompute the category summary from the products collection and replace it atomically."""
+        pipeline = [
+            {
+                "$group": {
+                    "_id": "$ProductCategory",
+                    "count": {"$sum": 1},
+                    "price_sum": {"$sum": "$Price"},
+                    "total_value": {"$sum": {"$multiply": ["$Price", "$AvailableQuantity"]}},
+                    "total_quantity": {"$sum": "$AvailableQuantity"},
+                    "max_price": {"$max": "$Price"},
+                    "min_price": {"$min": "$Price"}
+                }
+            },
+            {
+                "$addFields": {"updated_at": datetime.now(timezone.utc)}
+            },
+            {
+                "$out": CATEGORY_SUMMARY_COLLECTION
+            }
+        ]
         try:
-            return list(self.mongo.db[PRODUCTS_COLLECTION].aggregate(pipeline))
+            self.mongo.db[PRODUCTS_COLLECTION].aggregate(pipeline)
+            return True
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
@@ -59,12 +148,198 @@ class Database:
             print(f"Error during the aggregation operation: {e}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
+        return False
+
+    def update_category_summary(self, previous=None, current=None):
+        """Apply the change from the previous to the current version of a product to the category summary.
+
+        Pass only 'current' for an insert and only 'previous' for a delete.
+        """
+        try:
+            """A quantity-only change is a single increment and never moves the price bounds."""
+            quantity_delta = quantity_only_delta(previous, current)
+            if quantity_delta is not None:
+                if quantity_delta:
+                    self._apply_quantity_deltas([(current.get("ProductCategory"), current.get("Price"), quantity_delta)])
+                return
+
+            if previous:
+                self._apply_summary_delta(previous, -1)
+            if current:
+                self._apply_summary_delta(current, 1)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the summary update operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    def adjust_category_quantities(self, changes):
+        """Apply a list of (category, price, quantity_delta) stock changes to the category summary."""
+        try:
+            self._apply_quantity_deltas(changes)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the summary update operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    def apply_category_summary_changes(self, changes):
+        """Apply (previous, current) product changes to the category summary with one bulk_write."""
+        try:
+            updates = summary_change_updates(changes)
+            if not updates:
+                return
+            """Only a category that gains a product can be missing from the summary."""
+            self.mongo.db[CATEGORY_SUMMARY_COLLECTION].bulk_write([
+                UpdateOne({"_id": category}, update, upsert=update["$inc"]["count"] > 0 or "$min" in update)
+                for category, update, _ in updates
+            ], ordered=False)
+
+            """Drop emptied categories and recompute bounds that a removed price may have defined."""
+            shrunk = {
+                category: removed_prices for category, update, removed_prices in updates
+                if update["$inc"]["count"] < 0 or removed_prices
+            }
+            if shrunk:
+                for category_summary in self.mongo.db[CATEGORY_SUMMARY_COLLECTION].find({"_id": {"$in": list(shrunk)}}):
+                    category = category_summary["_id"]
+                    if category_summary["count"] <= 0:
+                        self.mongo.db[CATEGORY_SUMMARY_COLLECTION].delete_one({"_id": category})
+                    elif any(removed_price_on_boundary(category_summary, {"Price": price}) for price in shrunk[category]):
+                        self._refresh_category_bounds(category)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the summary update operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    def _apply_quantity_deltas(self, changes):
+        """Increment total_quantity and total_value per category in one bulk_write."""
+        operations = [UpdateOne({"_id": category}, update) for category, update in quantity_delta_updates(changes)]
+        if operations:
+            self.mongo.db[CATEGORY_SUMMARY_COLLECTION].bulk_write(operations, ordered=False)
+
+    def _apply_summary_delta(self, product, sign):
+        """Add (sign=1) or remove (sign=-1) a single product's contribution to its category summary."""
+        category, update = summary_delta_update(product, sign)
+        summary = self.mongo.db[CATEGORY_SUMMARY_COLLECTION].find_one_and_update(
+            {"_id": category}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if sign > 0:
+            return
+
+        if summary["count"] <= 0:
+            self.mongo.db[CATEGORY_SUMMARY_COLLECTION].delete_one({"_id": category})
+        elif removed_price_on_boundary(summary, product):
+            self._refresh_category_bounds(category)
+
+    def _refresh_category_bounds(self, category):
+        """Recompute min and max price for a single category using the ProductCategory index."""
+        bounds = next(self.mongo.db[PRODUCTS_COLLECTION].aggregate(category_bounds_pipeline(category)), None)
+        if bounds:
+            self.mongo.db[CATEGORY_SUMMARY_COLLECTION].update_one(
+                {"_id": category}, {"$set": {"min_price": bounds["min_price"], "max_price": bounds["max_price"]}}
+            )
+
+    def record_stock_movements(self, movements):
+        """Append movements to the ledger and upsert their hour and day buckets, one bulk write per collection.
+
+        Reports read the buckets, so their cost grows with the number of products and days in the window,
+        not with the number of movements.
+        """
+        if not movements:
+            return
+        moment = datetime.now(timezone.utc)
+        try:
+            self.mongo.db[STOCK_MOVEMENTS_COLLECTION].insert_many([{**movement, "at": moment} for movement in movements], ordered=False)
+            self.mongo.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].bulk_write([
+                UpdateOne({"_id": bucket["_id"]}, movement_bucket_update(bucket), upsert=True)
+                for bucket in movement_buckets(movements, moment)
+            ], ordered=False)
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except (BulkWriteError, OperationFailure) as e:
+            print(f"Error while recording stock movements: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    def get_category_movements(self, since):
+        """Total the day buckets from 'since' on per category, most units moved out first."""
+        try:
+            return list(self.mongo.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].aggregate(category_movements_pipeline(since)))
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the aggregation operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return []
+
+    def get_product_movements(self, product_id, since, granularity="day"):
+        """Return one product's hour or day buckets from 'since' on, oldest first."""
+        try:
+            return list(self.mongo.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].find(
+                {"ProductID": product_id, "granularity": granularity, "start": {"$gte": since}},
+                {"_id": 0, "start": 1, **{field: 1 for field in MOVEMENT_BUCKET_FIELDS}}
+            ).sort("start", 1))
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the retrieval operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
         return []
-    
+
+    def create_indexes(self):
+        """Create the indexes used by the query paths, including the unique index on ProductID.
+
+        Returns True once they exist, or False if any of them could not be created.
+        """
+        try:
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("ProductID", 1)], unique=True)
+
+            """Compound indexes follow equality (category), sort, then range, with ProductID as the keyset tiebreaker."""
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("AvailableQuantity", 1), ("ProductID", 1)])
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("Price", 1), ("ProductID", 1)])
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("ProductCategory", 1), ("ProductID", 1)])
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("ProductCategory", 1), ("AvailableQuantity", 1), ("ProductID", 1)])
+            self.mongo.db[PRODUCTS_COLLECTION].create_index([("ProductCategory", 1), ("Price", 1), ("ProductID", 1)])
+
+            """Movement reports read day buckets by date range and one product's buckets by ProductID."""
+            self.mongo.db[STOCK_MOVEMENTS_COLLECTION].create_index([("ProductID", 1), ("at", 1)])
+            self.mongo.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].create_index([("granularity", 1), ("start", 1), ("ProductCategory", 1)])
+            self.mongo.db[STOCK_MOVEMENT_BUCKETS_COLLECTION].create_index([("ProductID", 1), ("granularity", 1), ("start", 1)])
+            return True
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except OperationFailure as e:
+            print(f"Error during the index creation operation: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+        return False
+
     def create_text_index(self):
-        """Create a text index on the ProductName, ProductCategory, and ProductID fields."""
+        """Create a text index on the ProductName, ProductCategory, and ProductID fields. Returns False on failure."""
         try:
             self.mongo.db[PRODUCTS_COLLECTION].create_index([("ProductName", "text"), ("ProductCategory", "text"), ("ProductID", "text")])
+            return True
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
@@ -73,11 +348,18 @@ class Database:
             print(f"Error during the index creation operation: {e}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
+        return False
 
-    def search_products(self, query):
-        """Search for products using a text index."""
+    def search_products(self, query, limit=50, skip=0, fields=None):
+        """Search for products using a text index, ranked by relevance."""
         try:
-            return list(self.mongo.db[PRODUCTS_COLLECTION].find({"$text": {"$search": query}}))
+            return list(
+                self.mongo.db[PRODUCTS_COLLECTION]
+                .find({"$text": {"$search": query}}, build_projection(fields, TEXT_SCORE_PROJECTION))
+                .sort(TEXT_SCORE_SORT)
+                .skip(skip)
+                .limit(limit)
+            )
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
@@ -87,13 +369,33 @@ class Database:
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
         return []
-    
+
+    def load_prefix_index(self):
+        """Rebuild the in-process prefix index from the products collection."""
+        projection = {field: 1 for field in INDEXED_FIELDS}
+        projection["_id"] = 0
+        try:
+            self.prefix_index.load(self.mongo.db[PRODUCTS_COLLECTION].find({}, projection).batch_size(STREAM_BATCH_SIZE))
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
     def add_product(self, product):
-        """Insert a new product into the products collection."""
+        """Insert a new product into the products collection.
+
+        DuplicateKeyError is re-raised so the caller can report the conflict; the unique index on
+        ProductID makes the insert itself the existence check.
+        """
         try:
-            return self.mongo.db[PRODUCTS_COLLECTION].insert_one(product)
+            result = self.mongo.db[PRODUCTS_COLLECTION].insert_one(product)
+            self.prefix_index.upsert(product)
+            self.record_stock_movements(stock_movements([(product, quantity_change(None, product))], "create"))
+            return result
         except DuplicateKeyError:
-            print("Duplicate key error. The product already exists.")
+            raise
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
@@ -102,10 +404,161 @@ class Database:
             print(f"An unexpected error occurred: {e}")
         return None
 
-    def get_all_products(self):
-        """Fetch all products from the products collection."""
+    def bulk_write_products(self, products, mode="insert"):
+        """Write a chunk of products with a single unordered bulk_write.
+
+        In 'insert' mode every product is inserted; in 'upsert' mode products are matched on
+        ProductID and created or updated. Rows that fail do not stop the rest of the chunk; they
+        are reported in 'errors' with their index within the chunk.
+
+        The written rows are applied to the category summary as one delta per category. In
+        'upsert' mode the previous versions are read with one find() before the bulk_write, which
+        like apply_product_writes is not atomic with it.
+        """
+        if mode == "upsert":
+            operations = [UpdateOne({'ProductID': product['ProductID']}, {"$set": product}, upsert=True) for product in products]
+        else:
+            operations = [InsertOne(product) for product in products]
+
+        summary = {"inserted": 0, "upserted": 0, "modified": 0, "errors": []}
+        if not operations:
+            return summary
+
+        try:
+            previous_products = {}
+            if mode == "upsert":
+                previous_products = {product['ProductID']: product for product in self.mongo.db[PRODUCTS_COLLECTION].find(
+                    {'ProductID': {'$in': [product['ProductID'] for product in products]}}, SUMMARY_FIELDS_PROJECTION
+                )}
+            result = self.mongo.db[PRODUCTS_COLLECTION].bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as bwe:
+            details = bwe.details
+            summary["errors"] = [{"index": error["index"], "message": error["errmsg"]} for error in details["writeErrors"]]
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+            details = None
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
+            details = None
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            details = None
+        finally:
+            self.cache.invalidate(*(product['ProductID'] for product in products))
+
+        if details is None:
+            summary["errors"] = [{"index": index, "message": "Bulk write failed"} for index in range(len(products))]
+            return summary
+
+        failed_indexes = {error["index"] for error in summary["errors"]}
+        written = [product for index, product in enumerate(products) if index not in failed_indexes]
+        self.prefix_index.upsert_many(written)
+
+        """A ProductID repeated within the chunk changes the version written by its earlier row."""
+        changes = []
+        for product in written:
+            previous_product = previous_products.get(product['ProductID'])
+            current_product = {**previous_product, **product} if previous_product else product
+            previous_products[product['ProductID']] = current_product
+            changes.append((previous_product, current_product))
+        self.apply_category_summary_changes(changes)
+        self.record_stock_movements(stock_movements(
+            [(current, quantity_change(previous, current)) for previous, current in changes], "import"
+        ))
+
+        summary["inserted"] = details["nInserted"]
+        summary["upserted"] = details["nUpserted"]
+        summary["modified"] = details["nModified"]
+        return summary
+
+    def apply_product_writes(self, operations):
+        """Apply single-product inserts and updates from different callers with one unordered bulk_write.
+
+        One find() first fetches the products being updated, which gives each update its 404 (no
+        match) and the pre-image update_product_by_id returns. Write errors are mapped back to their
+        operation, with duplicate ProductIDs raised to the caller as DuplicateKeyError. StorageError is
+        raised when the database fails, and given to every caller when the writes were not acknowledged.
+
+        The pre-images are not read atomically with the writes: a write from another process that
+        lands between the find() and the bulk_write is missing from the returned pre-image, and so
+        from the summary delta the caller derives from it. The scheduled summary rebuild
+        (ANALYTICS_REBUILD_INTERVAL) corrects such drift.
+        """
+        collection = self.mongo.db[PRODUCTS_COLLECTION]
+        results = [(None, None)] * len(operations)
         try:
-            return list(self.mongo.db[PRODUCTS_COLLECTION].find())
+            update_ids = [operation["product_id"] for operation in operations if operation["type"] == "update"]
+            previous_products = {}
+            if update_ids:
+                previous_products = {product['ProductID']: product for product in collection.find({'ProductID': {'$in': update_ids}})}
+
+            requests, request_indexes = [], []
+            for index, operation in enumerate(operations):
+                if operation["type"] == "insert":
+                    requests.append(InsertOne(operation["product"]))
+                elif operation["product_id"] in previous_products:
+                    requests.append(UpdateOne({'ProductID': operation["product_id"]}, {"$set": operation["data"]}))
+                else:
+                    continue
+                request_indexes.append(index)
+
+            write_errors = {}
+            if requests:
+                try:
+                    collection.with_options(write_concern=self.batch_write_concern).bulk_write(requests, ordered=False)
+                except BulkWriteError as bwe:
+                    for error in bwe.details["writeErrors"]:
+                        error_type = DuplicateKeyError if error["code"] == 11000 else OperationFailure
+                        write_errors[request_indexes[error["index"]]] = error_type(error["errmsg"], error["code"])
+                    if bwe.details["writeConcernErrors"]:
+                        """The writes may or may not have been applied, so nobody gets a success they cannot rely on."""
+                        error = StorageError(f"The batched write was not acknowledged: {bwe.details['writeConcernErrors'][0]['errmsg']}")
+                        write_errors.update({index: write_errors.get(index, error) for index in request_indexes})
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The batched write failed") from e
+        except OperationFailure as e:
+            print(f"Error during the batched write operation: {e}")
+            raise StorageError("The batched write failed") from e
+        finally:
+            for operation in operations:
+                if operation["type"] == "insert":
+                    self.cache.invalidate(operation["product"].get('ProductID'))
+                else:
+                    self.cache.invalidate(operation["product_id"], operation["data"].get('ProductID'))
+
+        movements = []
+        for index in request_indexes:
+            if index in write_errors:
+                results[index] = (None, write_errors[index])
+                continue
+            operation = operations[index]
+            if operation["type"] == "insert":
+                self.prefix_index.upsert(operation["product"])
+                movements += stock_movements([(operation["product"], quantity_change(None, operation["product"]))], "create")
+                results[index] = (InsertOneResult(operation["product"]['_id'], acknowledged=True), None)
+            else:
+                previous_product = previous_products[operation["product_id"]]
+                current_product = {**previous_product, **operation["data"]}
+                self.prefix_index.replace(operation["product_id"], current_product)
+                movements += stock_movements([(current_product, quantity_change(previous_product, current_product))], "update")
+                results[index] = (previous_product, None)
+        self.record_stock_movements(movements)
+        return results
+
+    def _find_products(self, after=None, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Build a cursor for the filtered, keyset-paginated product listing (see build_product_query).
+
+        'fields' limits the returned fields through the query projection.
+        """
+        query, sort = build_product_query(after, filters, sort_field, descending)
+        return self.mongo.db[PRODUCTS_COLLECTION].find(query, build_projection(fields)).sort(sort)
+
+    def get_products_page(self, after=None, limit=100, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Fetch one page of filtered products in sort order, starting after the given keyset cursor."""
+        try:
+            return list(self._find_products(after, filters, sort_field, descending, fields).limit(limit))
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
@@ -116,58 +569,321 @@ class Database:
             print(f"An unexpected error occurred: {e}")
         return []
 
-    def get_product_by_id(self, product_id):
-        """Fetch a specific product using its ProductID."""
+    def iter_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None,
+                      batch_size=STREAM_BATCH_SIZE):
+        """Return a cursor over filtered products in sort order, so callers can stream documents as they arrive."""
         try:
-            return self.mongo.db[PRODUCTS_COLLECTION].find_one({'ProductID': product_id})
+            cursor = self._find_products(after, filters, sort_field, descending, fields).batch_size(batch_size)
+            if limit:
+                cursor = cursor.limit(limit)
+            return cursor
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
             print("Server selection timeout error.")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
-        return None
-
+        return []
 
-    def get_product_by_quantity(self, order="highest"):
-        """Retrieve a product based on its quantity."""
+    def explain_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Explain the product listing query and summarize the index used and the work done."""
         try:
-            sort_order = -1 if order == "highest" else 1
-            return self.mongo.db[PRODUCTS_COLLECTION].find_one(sort=[("AvailableQuantity", sort_order)])
+            cursor = self._find_products(after, filters, sort_field, descending, fields)
+            if limit:
+                cursor = cursor.limit(limit)
+            explanation = cursor.explain()
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
+            return None
         except ServerSelectionTimeoutError:
             print("Server selection timeout error.")
+            return None
         except OperationFailure as e:
-            print(f"Error during the retrieval operation: {e}")
+            print(f"Error during the explain operation: {e}")
+            return None
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return None
+
+        """Newer servers nest the classic plan under 'queryPlan'."""
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        stages, indexes = [], []
+        plan = winning_plan
+        while plan:
+            stages.append(plan.get("stage"))
+            if plan.get("indexName"):
+                indexes.append(plan["indexName"])
+            plan = plan.get("inputStage") or next(iter(plan.get("inputStages", [])), None)
+
+        execution_stats = explanation.get("executionStats", {})
+        return {
+            "stages": stages,
+            "indexes": indexes,
+            "collection_scan": "COLLSCAN" in stages,
+            "documents_examined": execution_stats.get("totalDocsExamined"),
+            "keys_examined": execution_stats.get("totalKeysExamined"),
+            "documents_returned": execution_stats.get("nReturned"),
+            "execution_time_ms": execution_stats.get("executionTimeMillis")
+        }
+
+    def get_product_by_id(self, product_id):
+        """Fetch a specific product using its ProductID, reading through the product cache."""
+        product = self.cache.get(product_id)
+        if product is not None:
+            return product
+
+        generation = self.cache.generation
+        try:
+            product = self.mongo.db[PRODUCTS_COLLECTION].find_one({'ProductID': product_id})
+            if product is not None:
+                self.cache.set(product_id, product, generation)
+            return product
+        except ConnectionFailure:
+            print("Failed to connect to the MongoDB server.")
+        except ServerSelectionTimeoutError:
+            print("Server selection timeout error.")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
         return None
 
-    def update_product_by_id(self, product_id, data):
-        """Update product details using its ProductID."""
+
+    def get_products_by_ids(self, product_ids):
+        """Fetch several products with one $in query, serving cached products without touching the database.
+
+        Returns a dict keyed by ProductID; IDs that do not exist are absent from it. StorageError is
+        raised when the database fails, so a failed lookup is not reported as missing products.
+        """
+        products = {}
+        for product_id in product_ids:
+            product = self.cache.get(product_id)
+            if product is not None:
+                products[product_id] = product
+
+        uncached_ids = [product_id for product_id in product_ids if product_id not in products]
+        if not uncached_ids:
+            return products
+
+        generation = self.cache.generation
         try:
-            return self.mongo.db[PRODUCTS_COLLECTION].update_one({'ProductID': product_id}, {"$set": data})
+            for product in self.mongo.db[PRODUCTS_COLLECTION].find({'ProductID': {'$in': uncached_ids}}):
+                self.cache.set(product['ProductID'], product, generation)
+                products[product['ProductID']] = product
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The products could not be fetched") from e
+        except OperationFailure as e:
+            print(f"Error during the retrieval operation: {e}")
+            raise StorageError("The products could not be fetched") from e
+        return products
+
+    def get_products_by_quantity(self, order="lowest", limit=10, category=None, fields=None):
+        """Return the 'limit' products with the lowest or highest AvailableQuantity, optionally within one category.
+
+        The sort matches the (AvailableQuantity, ProductID) index, or (ProductCategory, AvailableQuantity,
+        ProductID) for one category, so MongoDB reads 'limit' index entries instead of sorting the collection.
+        """
+        direction = -1 if order == "highest" else 1
+        query = {} if category is None else {'ProductCategory': category}
+        try:
+            return list(
+                self.mongo.db[PRODUCTS_COLLECTION].find(query, build_projection(fields))
+                .sort([("AvailableQuantity", direction), ("ProductID", direction)]).limit(limit)
+            )
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
             print("Server selection timeout error.")
         except OperationFailure as e:
-            print(f"Error during the update operation: {e}")
+            print(f"Error during the retrieval operation: {e}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
-        return None
+        return []
 
-    def delete_product_by_id(self, product_id):
-        """Remove a product using its ProductID."""
+    def get_categories(self):
+        """Return the distinct product categories, read from the ProductCategory index."""
         try:
-            return self.mongo.db[PRODUCTS_COLLECTION].delete_one({'ProductID': product_id})
+            return sorted(self.mongo.db[PRODUCTS_COLLECTION].distinct("ProductCategory"), key=str)
         except ConnectionFailure:
             print("Failed to connect to the MongoDB server.")
         except ServerSelectionTimeoutError:
             print("Server selection timeout error.")
         except OperationFailure as e:
-            print(f"Error during the delete operation: {e}")
+            print(f"Error during the retrieval operation: {e}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
-        return None
+        return []
+
+    def update_product_by_id(self, product_id, data):
+        """Update product details using its ProductID.
+
+        Returns the product as it was before the update, or None if no product matched.
+        DuplicateKeyError is re-raised when the new ProductID belongs to another product, and
+        StorageError is raised when the database fails, so the failure is not reported as a 404.
+        """
+        try:
+            previous_product = self.mongo.db[PRODUCTS_COLLECTION].find_one_and_update(
+                {'ProductID': product_id}, {"$set": data}, return_document=ReturnDocument.BEFORE
+            )
+            if previous_product is not None:
+                current_product = {**previous_product, **data}
+                self.prefix_index.replace(product_id, current_product)
+                self.record_stock_movements(stock_movements([(current_product, quantity_change(previous_product, current_product))], "update"))
+            return previous_product
+        except DuplicateKeyError:
+            raise
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The product update failed") from e
+        except OperationFailure as e:
+            print(f"Error during the update operation: {e}")
+            raise StorageError("The product update failed") from e
+        finally:
+            self.cache.invalidate(product_id, data.get('ProductID'))
+
+    def supports_transactions(self):
+        """Return True if the server is a replica set member or mongos, which is required for transactions."""
+        if self._supports_transactions is None:
+            try:
+                hello = self.mongo.cx.admin.command("hello")
+                self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+            except Exception:
+                self._supports_transactions = False
+        return self._supports_transactions
+
+    def adjust_stock(self, product_id, delta):
+        """Atomically add 'delta' to a product's AvailableQuantity without letting it drop below zero.
+
+        Returns the updated product, or None if the product does not exist or has too little stock.
+        StorageError is raised when the database fails, since the stock may or may not have changed.
+        """
+        query = {'ProductID': product_id}
+        if delta < 0:
+            query['AvailableQuantity'] = {'$gte': -delta}
+
+        try:
+            product = self.mongo.db[PRODUCTS_COLLECTION].find_one_and_update(
+                query, {"$inc": {'AvailableQuantity': delta}}, return_document=ReturnDocument.AFTER
+            )
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The stock update failed") from e
+        except OperationFailure as e:
+            print(f"Error during the stock update operation: {e}")
+            raise StorageError("The stock update failed") from e
+        finally:
+            self.cache.invalidate(product_id)
+
+        if product is not None:
+            self.record_stock_movements(stock_movements([(product, delta)], "adjustment"))
+        return product
+
+    def reserve_stock(self, quantities):
+        """Decrement stock for several products at once, all or nothing.
+
+        'quantities' maps ProductID to the number of units to reserve. Returns a tuple of
+        (reserved_products, failed_product_ids); on failure no stock is changed and
+        reserved_products is empty. StorageError is raised when the database fails.
+        """
+        try:
+            if self.supports_transactions():
+                reserved_products, failed_product_ids = self._reserve_stock_in_transaction(quantities)
+            else:
+                reserved_products, failed_product_ids = self._reserve_stock_with_compensation(quantities)
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The stock reservation failed") from e
+        except OperationFailure as e:
+            print(f"Error during the stock reservation operation: {e}")
+            raise StorageError("The stock reservation failed") from e
+        finally:
+            self.cache.invalidate(*quantities)
+
+        self.record_stock_movements(stock_movements(
+            [(product, -quantities[product['ProductID']]) for product in reserved_products], "reservation"
+        ))
+        return reserved_products, failed_product_ids
+
+    def _reserve_stock_in_transaction(self, quantities):
+        """Reserve stock with one guarded bulk_write inside a multi-document transaction.
+
+        with_transaction() runs the reservation again when it fails with a TransientTransactionError,
+        such as a write conflict with a concurrent reservation, and retries an uncertain commit.
+        """
+        collection = self.mongo.db[PRODUCTS_COLLECTION]
+
+        def reserve(session):
+            products = {product['ProductID']: product for product in collection.find({'ProductID': {'$in': list(quantities)}}, session=session)}
+            failed = [product_id for product_id, quantity in quantities.items()
+                      if product_id not in products or products[product_id].get('AvailableQuantity', 0) < quantity]
+            if failed:
+                session.abort_transaction()
+                return [], failed
+
+            operations = [
+                UpdateOne({'ProductID': product_id, 'AvailableQuantity': {'$gte': quantity}}, {"$inc": {'AvailableQuantity': -quantity}})
+                for product_id, quantity in quantities.items()
+            ]
+            result = collection.bulk_write(operations, ordered=False, session=session)
+            if result.matched_count < len(operations):
+                session.abort_transaction()
+                return [], list(quantities)
+            for product_id, quantity in quantities.items():
+                products[product_id]['AvailableQuantity'] -= quantity
+            return list(products.values()), []
+
+        with self.mongo.cx.start_session() as session:
+            return session.with_transaction(reserve)
+
+    def _reserve_stock_with_compensation(self, quantities):
+        """Reserve stock one guarded $inc at a time and undo the applied ones if any item falls short.
+
+        Used on standalone servers, where transactions are unavailable. Each step is still atomic,
+        so concurrent reservations never oversell, but other readers may briefly see a partial reservation.
+        The applied steps are also undone when the database fails part way through.
+        """
+        collection = self.mongo.db[PRODUCTS_COLLECTION]
+        reserved = []
+
+        def undo():
+            if reserved:
+                collection.bulk_write([
+                    UpdateOne({'ProductID': item['ProductID']}, {"$inc": {'AvailableQuantity': quantities[item['ProductID']]}})
+                    for item in reserved
+                ], ordered=False)
+
+        for product_id, quantity in quantities.items():
+            try:
+                product = collection.find_one_and_update(
+                    {'ProductID': product_id, 'AvailableQuantity': {'$gte': quantity}},
+                    {"$inc": {'AvailableQuantity': -quantity}},
+                    return_document=ReturnDocument.AFTER
+                )
+            except PyMongoError:
+                undo()
+                raise
+            if product is None:
+                undo()
+                return [], [product_id]
+            reserved.append(product)
+        return reserved, []
+
+    def delete_product_by_id(self, product_id):
+        """Remove a product using its ProductID.
+
+        Returns the deleted product, or None if no product matched. StorageError is raised when the database fails.
+        """
+        try:
+            deleted_product = self.mongo.db[PRODUCTS_COLLECTION].find_one_and_delete({'ProductID': product_id})
+            if deleted_product is not None:
+                self.prefix_index.remove(product_id)
+                self.record_stock_movements(stock_movements([(deleted_product, quantity_change(deleted_product, None))], "delete"))
+            return deleted_product
+        except ConnectionFailure as e:
+            print("Failed to connect to the MongoDB server.")
+            raise StorageError("The product delete failed") from e
+        except OperationFailure as e:
+            print(f"Error during the delete operation: {e}")
+            raise StorageError("The product delete failed") from e
+        finally:
+            self.cache.invalidate(product_id)
@@ -0,0 +1,48 @@
+# Gunicorn configuration for serving api:app in production.
+# Run 'flask --app api bootstrap' once before starting the server; workers only do per-process setup.
+import multiprocessing
+import os
+import tempfile
+import time
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+errorlog = "-"
+# The default access log line plus the response time in seconds and the request ID set by the app.
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(L)s request_id=%({x-request-id}o)s'
+
+# Workers share product cache invalidations through this file, so none serves a product another worker changed.
+if workers > 1:
+    os.environ.setdefault("PRODUCT_CACHE_GENERATION_FILE", os.path.join(tempfile.gettempdir(), "inventory-product-cache-generation"))
+
+
+def on_starting(server):
+    # Drop the metrics files of the previous run, so /metrics sums only this server's workers.
+    from metrics import clear_multiproc_dir
+
+    clear_multiproc_dir()
+
+
+def post_fork(server, worker):
+    # Record when the worker process was created, to measure its startup time.
+    worker.boot_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # The app module has been imported by now; finish per-worker setup and report how long startup took.
+    from api import start_worker
+
+    setup_seconds = start_worker()
+    total_seconds = time.perf_counter() - worker.boot_started
+    worker.log.info("Worker %s ready in %.1f ms (per-worker setup %.1f ms)", worker.pid, total_seconds * 1000, setup_seconds * 1000)
+
+
+def worker_exit(server, worker):
+    # Write the exiting worker's final metrics; its file is kept so the summed counters do not drop.
+    from metrics import write_process_file
+
+    write_process_file()
@@ -0,0 +1,98 @@
+import codecs
+import json
+
+# Bytes read from the underlying stream per call.
+READ_SIZE = 64 * 1024
+# The most text a read can end on in the middle of a literal, number or escape ('-Infinity').
+MAX_PARTIAL_TOKEN = 9
+
+
+def iter_json_documents(stream, read_size=READ_SIZE):
+    """Incrementally parse a JSON array or NDJSON body from a file-like object.
+
+    Yields (document, None) for each parsed document and (None, message) for a row that could
+    not be parsed. A malformed NDJSON line only affects that line; a malformed JSON array stops
+    the iteration, without reading the rest of the stream, because the parser cannot find the start
+    of the next element.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read():
+        chunk = stream.read(read_size)
+        if not chunk:
+            return None
+        return decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+
+    """Skip leading whitespace to find out whether this is an array or NDJSON."""
+    buffer = ""
+    while not buffer.strip():
+        chunk = read()
+        if chunk is None:
+            return
+        buffer += chunk
+    buffer = buffer.lstrip()
+
+    if buffer.startswith("["):
+        yield from _iter_json_array(buffer[1:], read)
+    else:
+        yield from _iter_ndjson(buffer, read)
+
+
+def _iter_ndjson(buffer, read):
+    """Yield one document per non-empty line."""
+    while True:
+        chunk = read()
+        if chunk is not None:
+            buffer += chunk
+        lines = buffer.split("\n")
+        buffer = lines.pop() if chunk is not None else ""
+
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield None, f"Invalid JSON: {e.msg}"
+
+        if chunk is None:
+            return
+
+
+def _iter_json_array(buffer, read):
+    """Yield each element of a JSON array whose opening bracket has already been consumed."""
+    json_decoder = json.JSONDecoder()
+    exhausted = False
+
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+
+        """Only accept a value once something follows it, so a number split across reads is not truncated."""
+        try:
+            document, end = json_decoder.raw_decode(buffer)
+            if end < len(buffer) or exhausted:
+                yield document, None
+                buffer = buffer[end:]
+                continue
+        except json.JSONDecodeError as e:
+            if exhausted or _is_malformed(buffer, e):
+                if buffer.strip():
+                    yield None, f"Invalid JSON: {e.msg}"
+                return
+
+        chunk = read()
+        if chunk is None:
+            exhausted = True
+        else:
+            buffer += chunk
+
+
+def _is_malformed(buffer, error):
+    """True when more input cannot fix the decode error, so the rest of the stream need not be read.
+
+    An unterminated string or an error near the end of the buffer may only mean that the element
+    continues in the next read.
+    """
+    return not error.msg.startswith("Unterminated string") and len(buffer[error.pos:].strip()) > MAX_PARTIAL_TOKEN
@@ -0,0 +1,338 @@
+# Request and MongoDB command metrics in the Prometheus text format, shared by api.py and async_api.py.
+# Metrics are kept per process. With METRICS_MULTIPROC_DIR set, every process also writes them to a file
+# in that directory and /metrics reports the sum over all the files, so any gunicorn worker can serve it.
+from pymongo import monitoring
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# Latency histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bucket upper bounds for the number of operations per coalesced write batch.
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Header used to accept and return the request ID, and the longest client-supplied ID that is kept.
+REQUEST_ID_HEADER = "X-Request-ID"
+MAX_REQUEST_ID_LENGTH = 128
+
+# Command fields included in slow query log lines, and the longest logged command.
+SLOW_QUERY_LOG_FIELDS = ("filter", "sort", "projection", "pipeline", "query", "update", "limit", "skip", "hint")
+MAX_SLOW_QUERY_LOG_LENGTH = 1000
+
+# ID of the request being handled. Set per request, it tags the log records written while serving it.
+current_request_id = contextvars.ContextVar("current_request_id", default="-")
+
+logger = logging.getLogger("inventory")
+
+# Directory shared by the processes of one server, or None to report each process on its own.
+MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") or None
+# Seconds between writes of a process's metrics to its file in MULTIPROC_DIR.
+MULTIPROC_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
+_registry = []
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """A monotonically increasing count, one series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def merge(values, label_values, value):
+        """Add one process's value of a series to 'values'."""
+        values[label_values] = values.get(label_values, 0) + value
+
+    def collect(self, values=None):
+        """Format this process's series, or the given merged ones."""
+        if values is None:
+            values = self.snapshot()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, one series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                """One count per bucket plus the +Inf bucket, then the sum of observed values."""
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {label_values: [list(counts), total] for label_values, (counts, total) in self._series.items()}
+
+    def reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def merge(values, label_values, value):
+        """Add one process's bucket counts and sum of a series to 'values'."""
+        counts, total = value
+        series = values.get(label_values)
+        if series is None:
+            values[label_values] = [list(counts), total]
+            return
+        series[0] = [merged + count for merged, count in zip(series[0], counts)]
+        series[1] += total
+
+    def collect(self, values=None):
+        """Format this process's series, or the given merged ones."""
+        if values is None:
+            values = self.snapshot()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _format_labels((*self.label_names, "le"), (*label_values, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Time to produce an HTTP response.", ("method", "route"))
+MONGO_COMMAND_DURATION = Histogram("mongodb_command_duration_seconds", "MongoDB command round-trip time.", ("command", "collection"))
+MONGO_DOCUMENTS_RETURNED = Counter("mongodb_documents_returned_total", "Documents returned by MongoDB commands.", ("command", "collection"))
+MONGO_COMMAND_FAILURES = Counter("mongodb_command_failures_total", "MongoDB commands that failed.", ("command", "collection"))
+MONGO_SLOW_COMMANDS = Counter("mongodb_slow_commands_total", "MongoDB commands slower than the slow query threshold.", ("command", "collection"))
+WRITE_BATCH_SIZE = Histogram("product_write_batch_size", "Product writes applied per coalesced batch.", buckets=BATCH_SIZE_BUCKETS)
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format.
+
+    With MULTIPROC_DIR set, the series are summed over the files of every process that wrote one.
+    """
+    merged = _read_process_files() if MULTIPROC_DIR else {}
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect(merged.get(metric.name, {}) if MULTIPROC_DIR else None))
+    return "\n".join(lines) + "\n"
+
+def record_request(method, route, status, seconds):
+    """Count a finished request and add its latency to the route's histogram."""
+    _ensure_flusher()
+    HTTP_REQUESTS.inc(method, route, status)
+    HTTP_REQUEST_DURATION.observe(seconds, method, route)
+
+
+# Process that owns the flusher thread and its metrics file; both are replaced after a fork.
+_flusher_pid = None
+_process_file = None
+_flusher_lock = threading.Lock()
+
+
+def _ensure_flusher():
+    """Start writing this process's metrics to MULTIPROC_DIR, again after a fork since threads do not survive it."""
+    global _flusher_pid, _process_file
+    if not MULTIPROC_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            """The random suffix keeps a reused pid from overwriting the file of the dead process it belonged to."""
+            _process_file = os.path.join(MULTIPROC_DIR, f"metrics_{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+            threading.Thread(target=_flush_periodically, name="metrics-flusher", daemon=True).start()
+            _flusher_pid = os.getpid()
+
+def _flush_periodically():
+    while True:
+        time.sleep(MULTIPROC_FLUSH_INTERVAL)
+        write_process_file()
+
+def write_process_file():
+    """Write this process's metrics to its file in MULTIPROC_DIR, replacing the previous version atomically.
+
+    Files of exited processes are kept, so counters summed over the directory never go down when a
+    worker is restarted. Call clear_multiproc_dir() when the server starts to reset them.
+    """
+    if not MULTIPROC_DIR or _flusher_pid != os.getpid():
+        return
+    snapshot = {metric.name: [[list(label_values), value] for label_values, value in metric.snapshot().items()]
+                for metric in _registry}
+    temporary_file = f"{_process_file}.tmp"
+    try:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        with open(temporary_file, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temporary_file, _process_file)
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", _process_file, e)
+
+def _read_process_files():
+    """Sum the series of every process file in MULTIPROC_DIR, after bringing this process's file up to date."""
+    _ensure_flusher()
+    write_process_file()
+    metrics = {metric.name: metric for metric in _registry}
+    merged = {}
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics_*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable metrics file %s: %s", path, e)
+            continue
+        for name, series in snapshot.items():
+            if name not in metrics:
+                continue
+            values = merged.setdefault(name, {})
+            for label_values, value in series:
+                metrics[name].merge(values, tuple(label_values), value)
+    return merged
+
+def clear_multiproc_dir():
+    """Delete the process files left in MULTIPROC_DIR by a previous server run."""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics_*.json*")):
+        os.remove(path)
+
+def _reset_after_fork():
+    """A forked child starts from zero; what the parent recorded stays in the parent's own file."""
+    global _flusher_lock
+    _flusher_lock = threading.Lock()
+    for metric in _registry:
+        metric.reset()
+
+
+if MULTIPROC_DIR:
+    os.register_at_fork(after_in_child=_reset_after_fork)
+    atexit.register(write_process_file)
+
+def resolve_request_id(header_value, generate):
+    """Use the client's request ID when it is reasonable, otherwise a new one from 'generate'."""
+    if header_value and len(header_value) <= MAX_REQUEST_ID_LENGTH and header_value.isprintable():
+        return header_value
+    return generate()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID to every record as 'request_id'."""
+
+    def filter(self, record):
+        record.request_id = current_request_id.get()
+        return True
+
+def configure_logging(level=logging.INFO):
+    """Send the 'inventory' logger to stderr with the request ID on every line."""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def _documents_returned(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if "value" in reply:
+        return 0 if reply["value"] is None else 1
+    return 0
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records the duration and returned document count of every MongoDB command.
+
+    Commands slower than 'slow_query_ms' are logged with their filter, sort and pipeline;
+    0 turns the slow query log off.
+    """
+
+    def __init__(self, slow_query_ms=0):
+        self.slow_query_ms = slow_query_ms
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        """Remember the collection and query shape; the finishing events do not carry the command."""
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        shape = None
+        if self.slow_query_ms:
+            shape = {field: event.command[field] for field in SLOW_QUERY_LOG_FIELDS if field in event.command}
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _finish(self, event):
+        with self._lock:
+            collection, shape = self._started.pop((event.connection_id, event.request_id), ("", None))
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_DURATION.observe(seconds, event.command_name, collection)
+
+        if self.slow_query_ms and seconds * 1000 >= self.slow_query_ms:
+            MONGO_SLOW_COMMANDS.inc(event.command_name, collection)
+            logger.warning(
+                "Slow MongoDB command %s on %s took %.1f ms: %s",
+                event.command_name, collection or event.database_name, seconds * 1000, str(shape)[:MAX_SLOW_QUERY_LOG_LENGTH]
+            )
+        return collection
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        documents = _documents_returned(event.reply)
+        if documents:
+            MONGO_DOCUMENTS_RETURNED.inc(event.command_name, collection, amount=documents)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_COMMAND_FAILURES.inc(event.command_name, collection)
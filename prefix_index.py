@@ -0,0 +1,163 @@
+from bisect import bisect_left, insort
+from heapq import merge
+import re
+import sys
+import threading
+
+# Product fields that are searchable by prefix.
+INDEXED_FIELDS = ("ProductName", "ProductCategory", "ProductID")
+# Smallest number of new keys buffered before they are merged into the main sorted list.
+MIN_MERGE_SIZE = 1024
+
+
+def index_terms(product):
+    """Return the lowercase terms a product can be found by: each field value and each word in it."""
+    terms = set()
+    for field in INDEXED_FIELDS:
+        value = product.get(field)
+        if value is None:
+            continue
+        value = str(value).lower()
+        terms.add(value)
+        terms.update(re.findall(r"\w+", value))
+    return terms
+
+
+class PrefixIndex:
+    """An in-process prefix index over product names, categories, and IDs for type-ahead lookups.
+
+    Terms are kept in sorted lists of (term, ProductID) pairs, so a lookup is a binary search
+    followed by a short forward scan. New pairs go to a small sorted buffer that is merged into the
+    main list once it holds 1/32 of it, which keeps a write's cost independent of the index size.
+    Pairs of removed or renamed products are not deleted from the lists but recorded as stale;
+    lookups skip them, and they are dropped when they make up half of the main list.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._pending = []
+        self._stale = set()
+        self._products = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._products)
+
+    def load(self, products):
+        """Replace the index contents with the given products."""
+        entries = {}
+        for product in products:
+            entries[product["ProductID"]] = tuple(product.get(field) for field in INDEXED_FIELDS)
+        keys = sorted(self._entry_keys(entries))
+
+        with self._lock:
+            self._products = entries
+            self._keys = keys
+            self._pending = []
+            self._stale = set()
+
+    def upsert(self, product):
+        """Add a product, or merge the given fields into an already indexed one."""
+        self.upsert_many([product])
+
+    def upsert_many(self, products):
+        """Add or update several products, buffering their new terms with one sort."""
+        with self._lock:
+            new_keys = []
+            for product in products:
+                new_keys.extend(self._upsert(product))
+            self._add_keys(new_keys)
+
+    def replace(self, product_id, product):
+        """Index 'product' in place of the product indexed under 'product_id', whose ProductID it may change."""
+        with self._lock:
+            if product.get("ProductID", product_id) != product_id:
+                self._remove(product_id)
+            self._add_keys(self._upsert({"ProductID": product_id, **product}))
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        entry = self._products.pop(product_id, None)
+        if entry is not None:
+            self._stale.update((term, product_id) for term in self._terms(entry))
+
+    def _upsert(self, product):
+        """Update the entry of one product and return the (term, ProductID) pairs it gained."""
+        product_id = product.get("ProductID")
+        if product_id is None:
+            return []
+
+        previous = self._products.get(product_id)
+        entry = tuple(
+            product[field] if field in product else (previous[index] if previous else None)
+            for index, field in enumerate(INDEXED_FIELDS)
+        )
+        if entry == previous:
+            return []
+
+        self._products[product_id] = entry
+        terms = self._terms(entry)
+        previous_terms = self._terms(previous) if previous else set()
+        self._stale.update((term, product_id) for term in previous_terms - terms)
+        new_keys = [(term, product_id) for term in terms - previous_terms]
+        self._stale.difference_update(new_keys)
+        return new_keys
+
+    def _add_keys(self, keys):
+        """Buffer new pairs, merging the buffer into the main list once it is full."""
+        if not keys:
+            return
+        if len(keys) < 16:
+            for key in keys:
+                insort(self._pending, key)
+        else:
+            self._pending.extend(keys)
+            self._pending.sort()
+        if len(self._pending) < max(MIN_MERGE_SIZE, len(self._keys) // 32):
+            return
+        self._keys.extend(self._pending)
+        self._pending = []
+        if len(self._stale) * 2 > len(self._keys):
+            """Most pairs would be stale, so rebuild the list from the live entries instead of merging."""
+            self._keys = sorted(self._entry_keys(self._products))
+            self._stale = set()
+        else:
+            """Both parts are sorted, which Timsort merges in one linear pass."""
+            self._keys.sort()
+
+    @staticmethod
+    def _terms(entry):
+        """Index terms of a stored entry, interned so products sharing a word share one string."""
+        return {sys.intern(term) for term in index_terms(dict(zip(INDEXED_FIELDS, entry)))}
+
+    @classmethod
+    def _entry_keys(cls, entries):
+        return [(term, product_id) for product_id, entry in entries.items() for term in cls._terms(entry)]
+
+    def search(self, prefix, limit=10):
+        """Return up to 'limit' indexed products with a term starting with 'prefix'."""
+        prefix = prefix.lower()
+        results = []
+        seen = set()
+
+        with self._lock:
+            candidates = merge(self._scan(self._keys, prefix), self._scan(self._pending, prefix))
+            for term, product_id in candidates:
+                if len(results) >= limit:
+                    break
+                if product_id in seen or (term, product_id) in self._stale:
+                    continue
+                seen.add(product_id)
+                results.append(dict(zip(INDEXED_FIELDS, self._products[product_id])))
+        return results
+
+    @staticmethod
+    def _scan(keys, prefix):
+        """Yield the pairs of a sorted list whose term starts with 'prefix', in order."""
+        position = bisect_left(keys, (prefix, ""))
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            yield keys[position]
+            position += 1
@@ -0,0 +1,267 @@
+# MongoDB query and update documents shared by the sync (db.py) and async (async_db.py) database layers.
+from bson.son import SON
+from datetime import datetime, timedelta, timezone
+
+# Constants
+PRODUCTS_COLLECTION = "products"
+CATEGORY_SUMMARY_COLLECTION = "category_summary"
+STOCK_MOVEMENTS_COLLECTION = "stock_movements"
+STOCK_MOVEMENT_BUCKETS_COLLECTION = "stock_movement_buckets"
+# Every stock movement is added to one per-product bucket of each granularity.
+MOVEMENT_GRANULARITIES = ("hour", "day")
+# Reasons that move stock in or out of the shop. Creates, updates, imports and deletes only correct the
+# recorded quantity, so their net delta is kept in 'corrections' instead of units_in and units_out.
+STOCK_FLOW_REASONS = ("adjustment", "reservation")
+MOVEMENT_BUCKET_FIELDS = ("units_in", "units_out", "corrections", "net_change", "movements")
+SORTABLE_FIELDS = ("ProductID", "Price", "AvailableQuantity")
+# Fields a client may request with '?fields='.
+PRODUCT_FIELDS = ("_id", "ProductID", "ProductName", "ProductCategory", "Price", "AvailableQuantity")
+
+# The fields a product contributes to the category summary, for reading the previous version of a product.
+SUMMARY_FIELDS_PROJECTION = {"_id": 0, "ProductID": 1, "ProductCategory": 1, "Price": 1, "AvailableQuantity": 1}
+
+# Projection and sort that rank $text search results by relevance.
+TEXT_SCORE_PROJECTION = {"score": {"$meta": "textScore"}}
+TEXT_SCORE_SORT = [("score", {"$meta": "textScore"}), ("ProductID", 1)]
+
+
+def build_product_query(after=None, filters=None, sort_field="ProductID", descending=False):
+    """Build the query and sort for the filtered, keyset-paginated product listing.
+
+    'filters' may contain category, min_price, max_price, min_quantity and max_quantity.
+    'after' is a ProductID when sorting by ProductID, otherwise a (sort value, ProductID) tuple
+    taken from the last product of the previous page.
+    """
+    filters = filters or {}
+    query = {}
+    if filters.get('category') is not None:
+        query['ProductCategory'] = filters['category']
+    for field, low, high in (('Price', 'min_price', 'max_price'), ('AvailableQuantity', 'min_quantity', 'max_quantity')):
+        bounds = {}
+        if filters.get(low) is not None:
+            bounds['$gte'] = filters[low]
+        if filters.get(high) is not None:
+            bounds['$lte'] = filters[high]
+        if bounds:
+            query[field] = bounds
+
+    direction = -1 if descending else 1
+    comparison = '$lt' if descending else '$gt'
+    if after is not None:
+        if sort_field == 'ProductID':
+            keyset = {'ProductID': {comparison: after}}
+        else:
+            value, product_id = after
+            """Missing and null values sort first ascending and last descending, and no range operator matches them."""
+            ties = {sort_field: value, 'ProductID': {comparison: product_id}}
+            if value is None:
+                keyset = ties if descending else {'$or': [ties, {sort_field: {'$ne': None}}]}
+            else:
+                keyset = {'$or': [{sort_field: {comparison: value}}, ties]}
+                if descending:
+                    keyset['$or'].append({sort_field: None})
+        query = {'$and': [query, keyset]} if query else keyset
+
+    sort = [(sort_field, direction)]
+    if sort_field != 'ProductID':
+        sort.append(('ProductID', direction))
+    return query, sort
+
+
+def build_projection(fields=None, base=None):
+    """Build a find() projection that returns only 'fields', or None to return whole documents.
+
+    '_id' is excluded unless it is requested. 'base' is merged in first, e.g. the text score projection.
+    """
+    if not fields:
+        return base
+    projection = dict(base or {})
+    projection.update({field: 1 for field in fields})
+    if '_id' not in fields:
+        projection['_id'] = 0
+    return projection
+
+
+def quantity_only_delta(previous, current):
+    """Return the AvailableQuantity delta when category and price are unchanged, otherwise None."""
+    if (previous and current and previous.get("ProductCategory") == current.get("ProductCategory")
+            and previous.get("Price") == current.get("Price")):
+        return (current.get("AvailableQuantity") or 0) - (previous.get("AvailableQuantity") or 0)
+    return None
+
+
+def quantity_delta_updates(changes):
+    """Turn (category, price, quantity_delta) changes into one summary $inc update per category."""
+    totals = {}
+    for category, price, quantity_delta in changes:
+        quantity, value = totals.get(category, (0, 0))
+        totals[category] = (quantity + quantity_delta, value + (price or 0) * quantity_delta)
+
+    return [
+        (category, {"$inc": {"total_quantity": quantity, "total_value": value}, "$set": {"updated_at": datetime.now(timezone.utc)}})
+        for category, (quantity, value) in totals.items()
+    ]
+
+
+def summary_delta_update(product, sign):
+    """Return the category and the summary update that adds (sign=1) or removes (sign=-1) a product."""
+    price = product.get("Price")
+    quantity = product.get("AvailableQuantity") or 0
+
+    update = {
+        "$inc": {
+            "count": sign,
+            "price_sum": sign * (price or 0),
+            "total_quantity": sign * quantity,
+            "total_value": sign * (price or 0) * quantity
+        },
+        "$set": {"updated_at": datetime.now(timezone.utc)}
+    }
+    if sign > 0 and price is not None:
+        update["$min"] = {"min_price": price}
+        update["$max"] = {"max_price": price}
+    return product.get("ProductCategory"), update
+
+
+def summary_change_updates(changes):
+    """Merge (previous, current) product changes into one summary update per category.
+
+    Returns (category, update, removed_prices) tuples. 'removed_prices' are the prices taken out of
+    the category, which need its bounds recomputed if one of them was on the boundary.
+    """
+    totals = {}
+
+    def category_total(category):
+        if category not in totals:
+            totals[category] = ({"$inc": {"count": 0, "price_sum": 0, "total_quantity": 0, "total_value": 0},
+                                 "$set": {"updated_at": datetime.now(timezone.utc)}}, [])
+        return totals[category]
+
+    for previous, current in changes:
+        quantity_delta = quantity_only_delta(previous, current)
+        if quantity_delta is not None:
+            """A quantity-only change never moves the count, the price sum or the price bounds."""
+            update, _ = category_total(current.get("ProductCategory"))
+            update["$inc"]["total_quantity"] += quantity_delta
+            update["$inc"]["total_value"] += (current.get("Price") or 0) * quantity_delta
+            continue
+
+        for product, sign in ((previous, -1), (current, 1)):
+            if not product:
+                continue
+            category, delta = summary_delta_update(product, sign)
+            update, removed_prices = category_total(category)
+            for field, value in delta["$inc"].items():
+                update["$inc"][field] += value
+            if "$min" in delta:
+                update["$min"] = {"min_price": min(update.get("$min", delta["$min"])["min_price"], delta["$min"]["min_price"])}
+                update["$max"] = {"max_price": max(update.get("$max", delta["$max"])["max_price"], delta["$max"]["max_price"])}
+            elif sign < 0 and product.get("Price") is not None:
+                removed_prices.append(product["Price"])
+
+    return [(category, update, removed_prices) for category, (update, removed_prices) in totals.items()]
+
+
+def removed_price_on_boundary(summary, product):
+    """Min and max cannot be decremented, so they need recomputing when a removed price was on the boundary."""
+    price = product.get("Price")
+    return price is not None and (price <= summary.get("min_price", price) or price >= summary.get("max_price", price))
+
+
+def category_bounds_pipeline(category):
+    """Aggregation that recomputes min and max price for a single category using the ProductCategory index."""
+    return [
+        {"$match": {"ProductCategory": category}},
+        {"$group": {"_id": None, "min_price": {"$min": "$Price"}, "max_price": {"$max": "$Price"}}}
+    ]
+
+
+def summary_to_analytics(summaries):
+    """Convert category summary documents to the '$group' output shape, ordered by count then category."""
+    results = []
+    for summary in summaries:
+        results.append({
+            "_id": summary["_id"],
+            "count": summary["count"],
+            "average_price": summary["price_sum"] / summary["count"] if summary["count"] else None,
+            "total_value": summary["total_value"],
+            "total_quantity": summary["total_quantity"],
+            "max_price": summary.get("max_price"),
+            "min_price": summary.get("min_price")
+        })
+    results.sort(key=lambda result: (result["count"], str(result["_id"])), reverse=True)
+    return results
+
+
+def bucket_start(moment, granularity):
+    """Truncate a timestamp to the start of its hour or day bucket."""
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def movement_window_start(days, now=None):
+    """Start of the movement window covering the current day and the 'days' - 1 days before it."""
+    return bucket_start(now or datetime.now(timezone.utc), "day") - timedelta(days=days - 1)
+
+
+def quantity_change(previous, current):
+    """The AvailableQuantity moved by a write; a missing version or quantity counts as zero."""
+    return ((current or {}).get("AvailableQuantity") or 0) - ((previous or {}).get("AvailableQuantity") or 0)
+
+
+def stock_movements(changes, reason):
+    """Turn (product, quantity_delta) changes into stock movement documents, skipping zero deltas."""
+    return [
+        {"ProductID": product["ProductID"], "ProductCategory": product.get("ProductCategory"), "delta": delta, "reason": reason}
+        for product, delta in changes if delta
+    ]
+
+
+def movement_buckets(movements, moment):
+    """Merge stock movements made at 'moment' into per-product hour and day bucket increments.
+
+    Each bucket's '_id' is '<granularity>:<start>:<ProductID>', so a write can upsert it without reading it first.
+    """
+    buckets = {}
+    for movement in movements:
+        delta = movement["delta"]
+        for granularity in MOVEMENT_GRANULARITIES:
+            start = bucket_start(moment, granularity)
+            bucket_id = f"{granularity}:{start:%Y-%m-%dT%H}:{movement['ProductID']}"
+            bucket = buckets.setdefault(bucket_id, {
+                "_id": bucket_id, "ProductID": movement["ProductID"], "granularity": granularity, "start": start,
+                **{field: 0 for field in MOVEMENT_BUCKET_FIELDS}
+            })
+            bucket["ProductCategory"] = movement.get("ProductCategory")
+            if movement.get("reason") in STOCK_FLOW_REASONS:
+                bucket["units_in"] += max(delta, 0)
+                bucket["units_out"] += max(-delta, 0)
+            else:
+                bucket["corrections"] += delta
+            bucket["net_change"] += delta
+            bucket["movements"] += 1
+    return list(buckets.values())
+
+
+def movement_bucket_update(bucket):
+    """Upsert update that adds a movement_buckets() increment to its bucket document."""
+    return {
+        "$inc": {field: bucket[field] for field in MOVEMENT_BUCKET_FIELDS},
+        "$set": {"ProductCategory": bucket["ProductCategory"]},
+        "$setOnInsert": {"ProductID": bucket["ProductID"], "granularity": bucket["granularity"], "start": bucket["start"]}
+    }
+
+
+def category_movements_pipeline(since):
+    """Aggregation that totals day buckets per category from 'since' on, most units moved out first."""
+    return [
+        {"$match": {"granularity": "day", "start": {"$gte": since}}},
+        {
+            "$group": {
+                "_id": "$ProductCategory",
+                **{field: {"$sum": f"${field}"} for field in MOVEMENT_BUCKET_FIELDS}
+            }
+        },
+        {"$sort": SON([("units_out", -1), ("_id", 1)])}
+    ]
@@ -0,0 +1,55 @@
+# JSON encoding shared by the Flask app (api.py) and the asyncio app (async_api.py).
+# orjson is used when it is installed, with the standard library as the fallback. Both encode ObjectId
+# and datetime values directly, so handlers can return documents as MongoDB hands them back.
+from bson import ObjectId
+from datetime import date, datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the encoder in use.
+ENCODER = "orjson" if orjson is not None else "json"
+
+
+def _default(value):
+    """Encode the BSON types that JSON has no native form for."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def dumps(value) -> bytes:
+        """Serialize 'value' to compact UTF-8 JSON."""
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(value) -> bytes:
+        """Serialize 'value' to compact UTF-8 JSON."""
+        return json.dumps(value, default=_default, separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+class JSONProviderMixin:
+    """Routes jsonify() and request.get_json() through this module.
+
+    Mix in ahead of the Flask or Quart DefaultJSONProvider, e.g.
+    'class ProductJSONProvider(JSONProviderMixin, DefaultJSONProvider)'.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
@@ -0,0 +1,658 @@
+from bson import ObjectId
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+from pymongo.results import InsertOneResult
+from queries import MOVEMENT_BUCKET_FIELDS, movement_buckets, quantity_change, stock_movements
+from serialization import dumps, loads
+from storage import STREAM_BATCH_SIZE, ProductStore, StorageError
+import json
+import re
+import sqlite3
+import threading
+
+# Product fields stored in their own indexed columns; every other field is kept in the 'extra' JSON column.
+COLUMN_FIELDS = ("ProductID", "ProductName", "ProductCategory", "Price", "AvailableQuantity")
+SELECT_PRODUCTS = "SELECT ProductID, ProductName, ProductCategory, Price, AvailableQuantity, extra FROM products"
+# Timestamps are stored as UTC text in this format, which sorts chronologically.
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+BUCKET_FIELDS = ("start",) + MOVEMENT_BUCKET_FIELDS
+# Largest number of ProductIDs bound into a single IN (...) query.
+MAX_IN_CLAUSE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    ProductID TEXT NOT NULL UNIQUE,
+    ProductName TEXT,
+    ProductCategory TEXT,
+    Price INTEGER,
+    AvailableQuantity INTEGER,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id INTEGER PRIMARY KEY,
+    ProductID TEXT NOT NULL,
+    ProductCategory TEXT,
+    delta INTEGER NOT NULL,
+    reason TEXT,
+    at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock_movement_buckets (
+    id TEXT PRIMARY KEY,
+    ProductID TEXT NOT NULL,
+    ProductCategory TEXT,
+    granularity TEXT NOT NULL,
+    start TEXT NOT NULL,
+    units_in INTEGER NOT NULL,
+    units_out INTEGER NOT NULL,
+    corrections INTEGER NOT NULL DEFAULT 0,
+    net_change INTEGER NOT NULL,
+    movements INTEGER NOT NULL
+);
+"""
+
+# Indexes mirroring the MongoDB ones: ProductID is the keyset tiebreaker after equality and sort columns.
+INDEXES = """
+CREATE INDEX IF NOT EXISTS products_quantity ON products (AvailableQuantity, ProductID);
+CREATE INDEX IF NOT EXISTS products_price ON products (Price, ProductID);
+CREATE INDEX IF NOT EXISTS products_category ON products (ProductCategory, ProductID);
+CREATE INDEX IF NOT EXISTS products_category_quantity ON products (ProductCategory, AvailableQuantity, ProductID);
+CREATE INDEX IF NOT EXISTS products_category_price ON products (ProductCategory, Price, ProductID);
+CREATE INDEX IF NOT EXISTS stock_movements_product ON stock_movements (ProductID, at);
+CREATE INDEX IF NOT EXISTS stock_movement_buckets_window ON stock_movement_buckets (granularity, start, ProductCategory);
+CREATE INDEX IF NOT EXISTS stock_movement_buckets_product ON stock_movement_buckets (ProductID, granularity, start);
+"""
+
+# An external-content FTS5 table over the products table, kept in sync by triggers.
+TEXT_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    ProductName, ProductCategory, ProductID, content='products', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, ProductName, ProductCategory, ProductID)
+    VALUES (new.id, new.ProductName, new.ProductCategory, new.ProductID);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, ProductName, ProductCategory, ProductID)
+    VALUES ('delete', old.id, old.ProductName, old.ProductCategory, old.ProductID);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF ProductName, ProductCategory, ProductID ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, ProductName, ProductCategory, ProductID)
+    VALUES ('delete', old.id, old.ProductName, old.ProductCategory, old.ProductID);
+    INSERT INTO products_fts (rowid, ProductName, ProductCategory, ProductID)
+    VALUES (new.id, new.ProductName, new.ProductCategory, new.ProductID);
+END;
+"""
+
+
+def product_row(product):
+    """Split a product into its column values followed by the JSON of its remaining fields."""
+    extra = {field: value for field, value in product.items() if field not in COLUMN_FIELDS}
+    return tuple(product.get(field) for field in COLUMN_FIELDS) + (dumps(extra).decode('utf-8'),)
+
+def row_to_product(row):
+    product = {field: value for field, value in zip(COLUMN_FIELDS, row) if value is not None}
+    product.update(loads(row[-1]))
+    return product
+
+def project(product, fields):
+    """Keep only 'fields', dropping '_id' unless it is listed, like queries.build_projection does for MongoDB."""
+    if not fields:
+        return product
+    return {field: product[field] for field in fields if field in product}
+
+def build_product_sql(after=None, filters=None, sort_field="ProductID", descending=False):
+    """The SQL counterpart of queries.build_product_query. Returns (where, params, order_by).
+
+    'sort_field' must be one of SORTABLE_FIELDS, which are column names, so it is safe to interpolate.
+    """
+    filters = filters or {}
+    clauses, params = [], []
+    if filters.get('category') is not None:
+        clauses.append("ProductCategory = ?")
+        params.append(filters['category'])
+    for column, low, high in (('Price', 'min_price', 'max_price'), ('AvailableQuantity', 'min_quantity', 'max_quantity')):
+        if filters.get(low) is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(filters[low])
+        if filters.get(high) is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(filters[high])
+
+    direction = "DESC" if descending else "ASC"
+    comparison = "<" if descending else ">"
+    if after is not None:
+        if sort_field == 'ProductID':
+            clauses.append(f"ProductID {comparison} ?")
+            params.append(after)
+        else:
+            """NULLs sort first ascending and last descending, and compare as neither greater nor less than a value."""
+            value, product_id = after
+            if value is None:
+                clauses.append(f"{sort_field} IS NULL AND ProductID {comparison} ?" if descending
+                               else f"(({sort_field} IS NULL AND ProductID {comparison} ?) OR {sort_field} IS NOT NULL)")
+                params.append(product_id)
+            else:
+                clauses.append(f"(({sort_field}, ProductID) {comparison} (?, ?) OR {sort_field} IS NULL)" if descending
+                               else f"({sort_field}, ProductID) {comparison} (?, ?)")
+                params.extend(after)
+
+    order_by = f"{sort_field} {direction}"
+    if sort_field != 'ProductID':
+        order_by += f", ProductID {direction}"
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params, order_by
+
+def is_duplicate_key(error):
+    """True when an IntegrityError comes from the UNIQUE constraint on ProductID, not from another constraint."""
+    return str(error).startswith("UNIQUE constraint failed")
+
+def fts_query(query):
+    """Turn free text into an FTS5 query matching any of its words, like MongoDB's $text search."""
+    return " OR ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+
+class SQLiteDatabase(ProductStore):
+    """Embedded storage backend on SQLite, for deployments without a MongoDB server.
+
+    SQLITE_PATH selects the database file; the default ':memory:' keeps the catalog in this process
+    only. One connection is shared by all threads, with a lock around each operation. Category
+    analytics are aggregated on read from the ProductCategory index instead of a stored summary,
+    so the summary maintenance methods have nothing to do.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.path = app.config.get("SQLITE_PATH", ":memory:")
+        self.ephemeral = self.path == ":memory:"
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        bucket_columns = {row[1] for row in self._connection.execute("PRAGMA table_info(stock_movement_buckets)")}
+        if "corrections" not in bucket_columns:
+            """Bucket tables created before corrections were split out of units_in and units_out."""
+            self._connection.execute("ALTER TABLE stock_movement_buckets ADD COLUMN corrections INTEGER NOT NULL DEFAULT 0")
+        """Text search triggers must exist before the first write, so the schema is complete from the start."""
+        self.create_indexes()
+        self.create_text_index()
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block of statements as one write transaction, holding the connection lock."""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def load_sample_data(self):
+        """Load sample data into the database if the products table is empty."""
+        try:
+            if self._query("SELECT COUNT(*) FROM products")[0][0] == 0:
+                with open("sample_data.json", "r") as file:
+                    self.bulk_write_products(json.load(file))
+        except json.JSONDecodeError:
+            print("Error decoding the sample data JSON file.")
+        except FileNotFoundError:
+            print("sample_data.json file not found.")
+        except sqlite3.Error as e:
+            print(f"SQLite error while loading sample data: {e}")
+
+    def create_indexes(self):
+        """Create the listing indexes; the unique ProductID index comes with the table. Returns False on failure."""
+        try:
+            with self._lock:
+                self._connection.executescript(INDEXES)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error during the index creation operation: {e}")
+            return False
+
+    def create_text_index(self):
+        """Create the FTS5 index and its triggers, and index any products written before it existed.
+
+        Returns False on failure.
+        """
+        try:
+            with self._lock:
+                existed = self._connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+                ).fetchone()
+                self._connection.executescript(TEXT_INDEX)
+                if not existed:
+                    self._connection.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error during the index creation operation: {e}")
+            return False
+
+    def get_product_analytics(self):
+        """Aggregate per-category analytics and find the most and least stocked products."""
+        return {
+            "categories": self.get_category_summary(),
+            "most_stocked_product": self.get_product_by_quantity("highest"),
+            "least_stocked_product": self.get_product_by_quantity("lowest")
+        }
+
+    def get_category_summary(self):
+        """Aggregate per-category analytics with one GROUP BY over the ProductCategory index."""
+        try:
+            rows = self._query(
+                "SELECT ProductCategory, COUNT(*), AVG(Price), COALESCE(SUM(Price * AvailableQuantity), 0),"
+                " COALESCE(SUM(AvailableQuantity), 0), MAX(Price), MIN(Price)"
+                " FROM products GROUP BY ProductCategory ORDER BY COUNT(*) DESC, ProductCategory DESC"
+            )
+        except sqlite3.Error as e:
+            print(f"Error during the aggregation operation: {e}")
+            return []
+
+        fields = ("_id", "count", "average_price", "total_value", "total_quantity", "max_price", "min_price")
+        return [dict(zip(fields, row)) for row in rows]
+
+    def rebuild_category_summary(self):
+        """Analytics are aggregated on read, so there is no summary to rebuild."""
+        return True
+
+    def update_category_summary(self, previous=None, current=None):
+        """Analytics are aggregated on read, so there is no summary to update."""
+
+    def adjust_category_quantities(self, changes):
+        """Analytics are aggregated on read, so there is no summary to update."""
+
+    def record_stock_movements(self, movements):
+        """Append movements to the ledger and add them to their hour and day buckets in one transaction."""
+        if not movements:
+            return
+        moment = datetime.now(timezone.utc)
+        at = moment.strftime(TIMESTAMP_FORMAT)
+        try:
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO stock_movements (ProductID, ProductCategory, delta, reason, at) VALUES (?, ?, ?, ?, ?)",
+                    [(movement["ProductID"], movement.get("ProductCategory"), movement["delta"], movement.get("reason"), at)
+                     for movement in movements]
+                )
+                connection.executemany(
+                    f"INSERT INTO stock_movement_buckets (id, ProductID, ProductCategory, granularity, start,"
+                    f" {', '.join(MOVEMENT_BUCKET_FIELDS)}) VALUES (?, ?, ?, ?, ?{', ?' * len(MOVEMENT_BUCKET_FIELDS)})"
+                    " ON CONFLICT (id) DO UPDATE SET ProductCategory = excluded.ProductCategory, "
+                    + ", ".join(f"{field} = {field} + excluded.{field}" for field in MOVEMENT_BUCKET_FIELDS),
+                    [(bucket["_id"], bucket["ProductID"], bucket["ProductCategory"], bucket["granularity"],
+                      bucket["start"].strftime(TIMESTAMP_FORMAT), *(bucket[field] for field in MOVEMENT_BUCKET_FIELDS))
+                     for bucket in movement_buckets(movements, moment)]
+                )
+        except sqlite3.Error as e:
+            print(f"Error while recording stock movements: {e}")
+
+    def get_category_movements(self, since):
+        """Total the day buckets from 'since' on per category, most units moved out first."""
+        try:
+            rows = self._query(
+                f"SELECT ProductCategory, {', '.join(f'SUM({field})' for field in MOVEMENT_BUCKET_FIELDS)}"
+                " FROM stock_movement_buckets WHERE granularity = 'day' AND start >= ?"
+                " GROUP BY ProductCategory ORDER BY SUM(units_out) DESC, ProductCategory",
+                (since.strftime(TIMESTAMP_FORMAT),)
+            )
+        except sqlite3.Error as e:
+            print(f"Error during the aggregation operation: {e}")
+            return []
+        return [dict(zip(("_id",) + MOVEMENT_BUCKET_FIELDS, row)) for row in rows]
+
+    def get_product_movements(self, product_id, since, granularity="day"):
+        """Return one product's hour or day buckets from 'since' on, oldest first."""
+        try:
+            rows = self._query(
+                f"SELECT {', '.join(BUCKET_FIELDS)} FROM stock_movement_buckets"
+                " WHERE ProductID = ? AND granularity = ? AND start >= ? ORDER BY start",
+                (product_id, granularity, since.strftime(TIMESTAMP_FORMAT))
+            )
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            return []
+        return [{**dict(zip(BUCKET_FIELDS, row)), "start": datetime.fromisoformat(row[0])} for row in rows]
+
+    def search_products(self, query, limit=50, skip=0, fields=None):
+        """Search the FTS5 index, best bm25 match first. 'score' is the negated bm25 rank, so higher is better."""
+        match = fts_query(query)
+        if not match:
+            return []
+        try:
+            rows = self._query(
+                "SELECT p.ProductID, p.ProductName, p.ProductCategory, p.Price, p.AvailableQuantity, p.extra,"
+                " bm25(products_fts) AS rank FROM products_fts JOIN products p ON p.id = products_fts.rowid"
+                " WHERE products_fts MATCH ? ORDER BY rank, p.ProductID LIMIT ? OFFSET ?",
+                (match, limit, skip)
+            )
+        except sqlite3.Error as e:
+            print(f"Error during the search operation: {e}")
+            return []
+
+        results = []
+        for row in rows:
+            product = project(row_to_product(row[:-1]), fields and [*fields, "score"])
+            product["score"] = -row[-1]
+            results.append(product)
+        return results
+
+    def load_prefix_index(self):
+        """Rebuild the in-process prefix index from the products table."""
+        try:
+            rows = self._query("SELECT ProductName, ProductCategory, ProductID FROM products")
+        except sqlite3.Error as e:
+            print(f"Error while loading the prefix index: {e}")
+            return
+        self.prefix_index.load(
+            {"ProductName": name, "ProductCategory": category, "ProductID": product_id} for name, category, product_id in rows
+        )
+
+    def add_product(self, product):
+        """Insert a new product. DuplicateKeyError is raised when the ProductID is taken, as with MongoDB."""
+        product.setdefault('_id', str(ObjectId()))
+        try:
+            with self._transaction() as connection:
+                connection.execute("INSERT INTO products (ProductID, ProductName, ProductCategory, Price, AvailableQuantity, extra)"
+                                   " VALUES (?, ?, ?, ?, ?, ?)", product_row(product))
+        except sqlite3.IntegrityError as e:
+            if is_duplicate_key(e):
+                raise DuplicateKeyError(f"ProductID {product.get('ProductID')} already exists")
+            print(f"Error during the insert operation: {e}")
+            return None
+        except sqlite3.Error as e:
+            print(f"Error during the insert operation: {e}")
+            return None
+
+        self.prefix_index.upsert(product)
+        self.record_stock_movements(stock_movements([(product, quantity_change(None, product))], "create"))
+        return InsertOneResult(product['_id'], acknowledged=True)
+
+    def bulk_write_products(self, products, mode="insert"):
+        """Insert or upsert a chunk of products in one transaction, reporting failed rows by their index."""
+        summary = {"inserted": 0, "upserted": 0, "modified": 0, "errors": []}
+        if not products:
+            return summary
+
+        written, changes = [], []
+        try:
+            with self._transaction() as connection:
+                for index, product in enumerate(products):
+                    existing = None
+                    if mode == "upsert":
+                        row = connection.execute(f"{SELECT_PRODUCTS} WHERE ProductID = ?", (product['ProductID'],)).fetchone()
+                        existing = row_to_product(row) if row else None
+
+                    if existing is not None:
+                        merged = {**existing, **product}
+                        if merged != existing:
+                            connection.execute(
+                                "UPDATE products SET ProductID = ?, ProductName = ?, ProductCategory = ?, Price = ?,"
+                                " AvailableQuantity = ?, extra = ? WHERE ProductID = ?",
+                                product_row(merged) + (product['ProductID'],)
+                            )
+                            summary["modified"] += 1
+                        written.append(merged)
+                        changes.append((merged, quantity_change(existing, merged)))
+                        continue
+
+                    new_product = {'_id': str(ObjectId()), **product}
+                    try:
+                        connection.execute("INSERT INTO products (ProductID, ProductName, ProductCategory, Price, AvailableQuantity, extra)"
+                                           " VALUES (?, ?, ?, ?, ?, ?)", product_row(new_product))
+                    except sqlite3.IntegrityError as e:
+                        message = f"Duplicate ProductID {product['ProductID']}" if is_duplicate_key(e) else str(e)
+                        summary["errors"].append({"index": index, "message": message})
+                        continue
+                    summary["upserted" if mode == "upsert" else "inserted"] += 1
+                    written.append(new_product)
+                    changes.append((new_product, quantity_change(None, new_product)))
+        except sqlite3.Error as e:
+            print(f"Error during the bulk write operation: {e}")
+            summary = {"inserted": 0, "upserted": 0, "modified": 0, "errors": [
+                {"index": index, "message": "Bulk write failed"} for index in range(len(products))
+            ]}
+            return summary
+        finally:
+            self.cache.invalidate(*(product['ProductID'] for product in products))
+
+        self.prefix_index.upsert_many(written)
+        self.record_stock_movements(stock_movements(changes, "import"))
+        return summary
+
+    def _select_products(self, after=None, limit=100, filters=None, sort_field="ProductID", descending=False):
+        where, params, order_by = build_product_sql(after, filters, sort_field, descending)
+        try:
+            rows = self._query(f"{SELECT_PRODUCTS} {where} ORDER BY {order_by} LIMIT ?", (*params, limit))
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            return []
+        return [row_to_product(row) for row in rows]
+
+    def get_products_page(self, after=None, limit=100, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Fetch one page of filtered products in sort order, starting after the given keyset cursor."""
+        return [project(product, fields) for product in self._select_products(after, limit, filters, sort_field, descending)]
+
+    def iter_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None,
+                      batch_size=STREAM_BATCH_SIZE):
+        """Yield filtered products in sort order, fetching 'batch_size' rows per keyset query.
+
+        The lock is only held while a batch is read, so a slow client does not block other requests.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            products = self._select_products(after, size, filters, sort_field, descending)
+            for product in products:
+                yield project(product, fields)
+            if len(products) < size:
+                return
+
+            if remaining is not None:
+                remaining -= len(products)
+            last = products[-1]
+            after = last['ProductID'] if sort_field == 'ProductID' else (last.get(sort_field), last['ProductID'])
+
+    def explain_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Summarize SQLite's plan for the listing query in the same shape as the MongoDB explain summary."""
+        where, params, order_by = build_product_sql(after, filters, sort_field, descending)
+        sql = f"{SELECT_PRODUCTS} {where} ORDER BY {order_by}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        try:
+            plan = self._query(f"EXPLAIN QUERY PLAN {sql}", params)
+        except sqlite3.Error as e:
+            print(f"Error during the explain operation: {e}")
+            return None
+
+        stages = [row[3] for row in plan]
+        return {
+            "stages": stages,
+            "indexes": [match for stage in stages for match in re.findall(r"USING (?:COVERING )?INDEX (\w+)", stage)],
+            "collection_scan": any(stage.startswith("SCAN") and "INDEX" not in stage for stage in stages),
+            "documents_examined": None,
+            "keys_examined": None,
+            "documents_returned": None,
+            "execution_time_ms": None
+        }
+
+    def get_product_by_id(self, product_id):
+        """Fetch a specific product using its ProductID, reading through the product cache."""
+        product = self.cache.get(product_id)
+        if product is not None:
+            return product
+
+        generation = self.cache.generation
+        try:
+            rows = self._query(f"{SELECT_PRODUCTS} WHERE ProductID = ?", (product_id,))
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            return None
+        if not rows:
+            return None
+
+        product = row_to_product(rows[0])
+        self.cache.set(product_id, product, generation)
+        return product
+
+    def get_products_by_ids(self, product_ids):
+        """Fetch several products with IN queries, serving cached products without touching the database."""
+        products = {}
+        for product_id in product_ids:
+            product = self.cache.get(product_id)
+            if product is not None:
+                products[product_id] = product
+
+        uncached_ids = [product_id for product_id in product_ids if product_id not in products]
+        generation = self.cache.generation
+        try:
+            for start in range(0, len(uncached_ids), MAX_IN_CLAUSE_SIZE):
+                chunk = uncached_ids[start:start + MAX_IN_CLAUSE_SIZE]
+                for row in self._query(f"{SELECT_PRODUCTS} WHERE ProductID IN ({', '.join('?' * len(chunk))})", chunk):
+                    product = row_to_product(row)
+                    self.cache.set(product['ProductID'], product, generation)
+                    products[product['ProductID']] = product
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            raise StorageError("The products could not be fetched") from e
+        return products
+
+    def get_products_by_quantity(self, order="lowest", limit=10, category=None, fields=None):
+        """Return the 'limit' products with the lowest or highest AvailableQuantity from the quantity indexes."""
+        direction = "DESC" if order == "highest" else "ASC"
+        where, params = ("WHERE ProductCategory = ?", (category,)) if category is not None else ("", ())
+        try:
+            rows = self._query(
+                f"{SELECT_PRODUCTS} {where} ORDER BY AvailableQuantity {direction}, ProductID {direction} LIMIT ?", (*params, limit)
+            )
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            return []
+        return [project(row_to_product(row), fields) for row in rows]
+
+    def get_categories(self):
+        """Return the distinct product categories, read from the ProductCategory index."""
+        try:
+            rows = self._query("SELECT DISTINCT ProductCategory FROM products ORDER BY ProductCategory")
+        except sqlite3.Error as e:
+            print(f"Error during the retrieval operation: {e}")
+            return []
+        return [category for category, in rows]
+
+    def update_product_by_id(self, product_id, data):
+        """Update product details and return the product as it was before, or None if no product matched.
+
+        DuplicateKeyError is raised when the new ProductID belongs to another product, and StorageError
+        when the database fails.
+        """
+        try:
+            with self._transaction() as connection:
+                row = connection.execute(f"{SELECT_PRODUCTS} WHERE ProductID = ?", (product_id,)).fetchone()
+                if row is None:
+                    return None
+                previous_product = row_to_product(row)
+                connection.execute(
+                    "UPDATE products SET ProductID = ?, ProductName = ?, ProductCategory = ?, Price = ?,"
+                    " AvailableQuantity = ?, extra = ? WHERE ProductID = ?",
+                    product_row({**previous_product, **data}) + (product_id,)
+                )
+        except sqlite3.IntegrityError as e:
+            if is_duplicate_key(e):
+                raise DuplicateKeyError(f"ProductID {data.get('ProductID')} already exists")
+            print(f"Error during the update operation: {e}")
+            raise StorageError("The product update failed") from e
+        except sqlite3.Error as e:
+            print(f"Error during the update operation: {e}")
+            raise StorageError("The product update failed") from e
+        finally:
+            self.cache.invalidate(product_id, data.get('ProductID'))
+
+        current_product = {**previous_product, **data}
+        self.prefix_index.replace(product_id, current_product)
+        self.record_stock_movements(stock_movements([(current_product, quantity_change(previous_product, current_product))], "update"))
+        return previous_product
+
+    def adjust_stock(self, product_id, delta):
+        """Add 'delta' to AvailableQuantity with a guarded UPDATE, so stock never drops below zero.
+
+        Returns the updated product, or None if the product does not exist or has too little stock.
+        StorageError is raised when the database fails.
+        """
+        try:
+            with self._transaction() as connection:
+                updated = connection.execute(
+                    "UPDATE products SET AvailableQuantity = AvailableQuantity + ? WHERE ProductID = ? AND AvailableQuantity >= ?",
+                    (delta, product_id, max(0, -delta))
+                ).rowcount
+                if not updated:
+                    return None
+                row = connection.execute(f"{SELECT_PRODUCTS} WHERE ProductID = ?", (product_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error during the stock update operation: {e}")
+            raise StorageError("The stock update failed") from e
+        finally:
+            self.cache.invalidate(product_id)
+
+        product = row_to_product(row)
+        self.record_stock_movements(stock_movements([(product, delta)], "adjustment"))
+        return product
+
+    def reserve_stock(self, quantities):
+        """Decrement stock for several products in one transaction, all or nothing.
+
+        BEGIN IMMEDIATE takes the write lock first, so the stock checked here cannot change before it is decremented.
+        """
+        product_ids = list(quantities)
+        try:
+            with self._transaction() as connection:
+                rows = connection.execute(
+                    f"{SELECT_PRODUCTS} WHERE ProductID IN ({', '.join('?' * len(product_ids))})", product_ids
+                ).fetchall()
+                products = {product['ProductID']: product for product in map(row_to_product, rows)}
+                failed = [product_id for product_id, quantity in quantities.items()
+                          if product_id not in products or products[product_id].get('AvailableQuantity', 0) < quantity]
+                if failed:
+                    return [], failed
+
+                connection.executemany(
+                    "UPDATE products SET AvailableQuantity = AvailableQuantity - ? WHERE ProductID = ?",
+                    [(quantity, product_id) for product_id, quantity in quantities.items()]
+                )
+        except sqlite3.Error as e:
+            print(f"Error during the stock reservation operation: {e}")
+            raise StorageError("The stock reservation failed") from e
+        finally:
+            self.cache.invalidate(*quantities)
+
+        for product_id, quantity in quantities.items():
+            products[product_id]['AvailableQuantity'] -= quantity
+        self.record_stock_movements(stock_movements(
+            [(product, -quantities[product['ProductID']]) for product in products.values()], "reservation"
+        ))
+        return list(products.values()), []
+
+    def delete_product_by_id(self, product_id):
+        """Remove a product and return it, or None if no product matched. StorageError is raised when the database fails."""
+        try:
+            with self._transaction() as connection:
+                row = connection.execute(f"{SELECT_PRODUCTS} WHERE ProductID = ?", (product_id,)).fetchone()
+                if row is None:
+                    return None
+                connection.execute("DELETE FROM products WHERE ProductID = ?", (product_id,))
+        except sqlite3.Error as e:
+            print(f"Error during the delete operation: {e}")
+            raise StorageError("The product delete failed") from e
+        finally:
+            self.cache.invalidate(product_id)
+
+        deleted_product = row_to_product(row)
+        self.prefix_index.remove(product_id)
+        self.record_stock_movements(stock_movements([(deleted_product, quantity_change(deleted_product, None))], "delete"))
+        return deleted_product
@@ -0,0 +1,232 @@
+# Storage interface shared by the MongoDB backend (db.py) and the embedded SQLite backend (sqlite_db.py).
+from abc import ABC, abstractmethod
+from cache import ProductCache
+from prefix_index import PrefixIndex
+from pymongo.errors import DuplicateKeyError
+
+# Constants
+STREAM_BATCH_SIZE = 500
+BULK_WRITE_MODES = ("insert", "upsert")
+STORAGE_BACKENDS = ("mongodb", "sqlite")
+
+
+class StorageError(Exception):
+    """A storage operation failed or timed out, so its outcome cannot be reported; the API answers 503."""
+
+
+class ProductStore(ABC):
+    """The operations the API needs from a storage backend.
+
+    Backends keep the product cache and the prefix index current as they write. Like the original
+    Database methods, they print storage errors and return an empty result rather than raising,
+    except that writes reusing an existing ProductID raise pymongo's DuplicateKeyError, which the
+    API turns into a 409, and that methods whose empty result already has a meaning (such as
+    "insufficient stock" or "not found") raise StorageError, which the API turns into a 503.
+    """
+
+    # True when the data lives only in this process, so each process has to bootstrap its own copy.
+    ephemeral = False
+
+    def __init__(self, app):
+        self.cache = ProductCache(
+            max_size=app.config.get("PRODUCT_CACHE_SIZE", 1024),
+            ttl=app.config.get("PRODUCT_CACHE_TTL", 30),
+            shared_generation=app.config.get("PRODUCT_CACHE_GENERATION_FILE")
+        )
+        self.prefix_index = PrefixIndex()
+
+    @abstractmethod
+    def load_sample_data(self):
+        """Load sample_data.json if there are no products yet."""
+
+    @abstractmethod
+    def create_indexes(self):
+        """Create the unique ProductID index and the indexes used by listing, filtering and sorting.
+
+        Returns True on success and False if an index could not be created.
+        """
+
+    @abstractmethod
+    def create_text_index(self):
+        """Create the full-text index used by search_products. Returns True on success and False on failure."""
+
+    @abstractmethod
+    def get_product_analytics(self):
+        """Compute per-category analytics and the most and least stocked products from the products themselves.
+
+        Returns {"categories": [...], "most_stocked_product": ..., "least_stocked_product": ...}, where each
+        category has '_id', 'count', 'average_price', 'total_value', 'total_quantity', 'max_price' and 'min_price'.
+        """
+
+    @abstractmethod
+    def get_category_summary(self):
+        """Return per-category analytics in the same shape as get_product_analytics()["categories"]."""
+
+    @abstractmethod
+    def rebuild_category_summary(self):
+        """Recompute any stored category summary from scratch. Returns True on success."""
+
+    @abstractmethod
+    def update_category_summary(self, previous=None, current=None):
+        """Apply a change from 'previous' to 'current' (None for insert or delete) to any stored summary."""
+
+    @abstractmethod
+    def adjust_category_quantities(self, changes):
+        """Apply (category, price, quantity_delta) stock changes to any stored summary."""
+
+    def check_category_summary(self):
+        """Compare the category summary with a full recomputation and return the categories that differ."""
+        expected = {result["_id"]: result for result in self.get_product_analytics()["categories"]}
+        actual = {result["_id"]: result for result in self.get_category_summary()}
+        fields = ["count", "total_quantity", "total_value", "max_price", "min_price"]
+
+        mismatches = []
+        for category in sorted(set(expected) | set(actual), key=str):
+            expected_values = {field: expected.get(category, {}).get(field) for field in fields}
+            actual_values = {field: actual.get(category, {}).get(field) for field in fields}
+            if expected_values != actual_values:
+                mismatches.append({"category": category, "expected": expected_values, "actual": actual_values})
+        return mismatches
+
+    @abstractmethod
+    def record_stock_movements(self, movements):
+        """Append quantity changes to the stock movement ledger and add them to the hour and day buckets.
+
+        Each movement is {"ProductID": ..., "ProductCategory": ..., "delta": ..., "reason": ...}. The write
+        methods record every quantity they change themselves, with the reason "create", "update", "import",
+        "adjustment", "reservation" or "delete", so callers never need to.
+        """
+
+    @abstractmethod
+    def get_category_movements(self, since):
+        """Total the day buckets from 'since' on per category, most units moved out first.
+
+        Returns [{"_id": category, "units_in": ..., "units_out": ..., "net_change": ..., "movements": ...}].
+        """
+
+    @abstractmethod
+    def get_product_movements(self, product_id, since, granularity="day"):
+        """Return one product's hour or day buckets from 'since' on, oldest first."""
+
+    @abstractmethod
+    def search_products(self, query, limit=50, skip=0, fields=None):
+        """Full-text search over name, category and ID, most relevant first, with a 'score' on each result."""
+
+    @abstractmethod
+    def load_prefix_index(self):
+        """Rebuild the in-process prefix index from the stored products."""
+
+    def suggest_products(self, prefix, limit=10):
+        """Return products whose name, category, or ID has a word starting with 'prefix'."""
+        return self.prefix_index.search(prefix, limit)
+
+    @abstractmethod
+    def add_product(self, product):
+        """Insert a product. Returns a result with 'acknowledged', or None on failure."""
+
+    def apply_product_writes(self, operations):
+        """Apply a batch of single-product writes from different callers, for write_batcher.WriteBatcher.
+
+        Each operation is {"type": "insert", "product": ...} or {"type": "update", "product_id": ..., "data": ...}.
+        Returns one (result, error) pair per operation, where 'result' is what add_product or
+        update_product_by_id would have returned and 'error' is the exception they would have raised.
+        This default applies the operations one at a time; backends override it to write them together.
+        """
+        results = []
+        for operation in operations:
+            try:
+                if operation["type"] == "insert":
+                    results.append((self.add_product(operation["product"]), None))
+                else:
+                    results.append((self.update_product_by_id(operation["product_id"], operation["data"]), None))
+            except (DuplicateKeyError, StorageError) as e:
+                results.append((None, e))
+        return results
+
+    @abstractmethod
+    def bulk_write_products(self, products, mode="insert"):
+        """Insert or upsert a chunk of products. Returns counts and per-row errors (see Database)."""
+
+    @abstractmethod
+    def get_products_page(self, after=None, limit=100, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Fetch one page of filtered products in sort order, starting after the given keyset cursor."""
+
+    @abstractmethod
+    def iter_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None,
+                      batch_size=STREAM_BATCH_SIZE):
+        """Return an iterable over filtered products in sort order that fetches them 'batch_size' at a time."""
+
+    @abstractmethod
+    def explain_products(self, after=None, limit=None, filters=None, sort_field="ProductID", descending=False, fields=None):
+        """Summarize the plan of the listing query: stages, indexes and whether it scans every product."""
+
+    @abstractmethod
+    def get_product_by_id(self, product_id):
+        """Fetch a product by ProductID, or None."""
+
+    @abstractmethod
+    def get_products_by_ids(self, product_ids):
+        """Fetch several products at once, as a dict keyed by ProductID without the missing IDs. Raises StorageError on failure."""
+
+    def get_product_by_quantity(self, order="highest"):
+        """Return the product with the highest or lowest AvailableQuantity."""
+        products = self.get_products_by_quantity(order, limit=1)
+        return products[0] if products else None
+
+    @abstractmethod
+    def get_products_by_quantity(self, order="lowest", limit=10, category=None, fields=None):
+        """Return the 'limit' products with the lowest or highest AvailableQuantity, optionally within one category.
+
+        Ties are broken by ProductID, so the query walks the AvailableQuantity index and stops after 'limit' entries.
+        """
+
+    def get_products_by_quantity_per_category(self, order="lowest", limit=10, fields=None):
+        """Return [{"category": ..., "products": [...]}] with the top or bottom 'limit' products of every category.
+
+        Each category is one indexed top-K query, rather than a sort of the whole catalog.
+        """
+        return [
+            {"category": category, "products": self.get_products_by_quantity(order, limit, category, fields)}
+            for category in self.get_categories()
+        ]
+
+    @abstractmethod
+    def get_categories(self):
+        """Return the distinct product categories, sorted."""
+
+    @abstractmethod
+    def update_product_by_id(self, product_id, data):
+        """Set the fields in 'data' and return the product as it was before, or None if it does not exist.
+
+        Raises StorageError on failure.
+        """
+
+    @abstractmethod
+    def adjust_stock(self, product_id, delta):
+        """Atomically add 'delta' to AvailableQuantity without going below zero.
+
+        Returns the updated product, or None if it does not exist or has too little stock. Raises StorageError on failure.
+        """
+
+    @abstractmethod
+    def reserve_stock(self, quantities):
+        """Decrement several products' stock all or nothing. Returns (reserved_products, failed_product_ids).
+
+        Raises StorageError on failure, so that a failed reservation is not reported as insufficient stock.
+        """
+
+    @abstractmethod
+    def delete_product_by_id(self, product_id):
+        """Delete a product and return it, or None if it does not exist. Raises StorageError on failure."""
+
+
+def create_database(app):
+    """Create the storage backend named by the STORAGE_BACKEND config value."""
+    backend = app.config.get("STORAGE_BACKEND", "mongodb")
+    if backend == "mongodb":
+        from db import Database
+        return Database(app)
+    if backend == "sqlite":
+        from sqlite_db import SQLiteDatabase
+        return SQLiteDatabase(app)
+    raise ValueError(f"STORAGE_BACKEND must be one of: {', '.join(STORAGE_BACKENDS)}")
@@ -0,0 +1,41 @@
+# The suite runs the Flask app on the embedded SQLite backend, so it needs no MongoDB server.
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ["SUGGEST_INDEX_REFRESH_INTERVAL"] = "0"
+os.environ["ANALYTICS_REBUILD_INTERVAL"] = "0"
+
+import api  # noqa: E402
+from sqlite_db import SQLiteDatabase  # noqa: E402
+
+PRODUCTS = [
+    {"ProductID": "1", "ProductName": "Laptop", "ProductCategory": "Electronics", "Price": 1500, "AvailableQuantity": 40},
+    {"ProductID": "2", "ProductName": "Smartphone", "ProductCategory": "Electronics", "Price": 800, "AvailableQuantity": 5},
+    {"ProductID": "3", "ProductName": "Headphones", "ProductCategory": "Electronics", "Price": 80, "AvailableQuantity": 120},
+    {"ProductID": "4", "ProductName": "Desk", "ProductCategory": "Furniture", "Price": 300, "AvailableQuantity": 2},
+    {"ProductID": "5", "ProductName": "Office Chair", "ProductCategory": "Furniture", "Price": 150, "AvailableQuantity": 60},
+    {"ProductID": "6", "ProductName": "Novel", "ProductCategory": "Books", "Price": 20, "AvailableQuantity": 0},
+]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """A fresh in-memory catalog holding PRODUCTS, installed as the app's database and writer."""
+    store = SQLiteDatabase(api.app)
+    store.bulk_write_products([dict(product) for product in PRODUCTS])
+    store.load_prefix_index()
+    monkeypatch.setattr(api, "db", store)
+    monkeypatch.setattr(api, "writer", store)
+    monkeypatch.setattr(api, "_worker_started", True)
+    return store
+
+
+@pytest.fixture
+def client(store):
+    return api.app.test_client()
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+
+from async_db import AsyncDatabase  # noqa: E402
+
+
+class SlowCollection:
+    """A products collection whose guarded $inc for one product takes 'delay' seconds, like a slow server."""
+
+    def __init__(self, stock, slow_product_id, delay):
+        self.stock = stock
+        self.slow_product_id = slow_product_id
+        self.delay = delay
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        product_id = query['ProductID']
+        if product_id == self.slow_product_id:
+            await asyncio.sleep(self.delay)
+        if self.stock[product_id] < query['AvailableQuantity']['$gte']:
+            return None
+        self.stock[product_id] += update['$inc']['AvailableQuantity']
+        return {'ProductID': product_id, 'AvailableQuantity': self.stock[product_id]}
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.stock[operation._filter['ProductID']] += operation._doc['$inc']['AvailableQuantity']
+
+
+def test_cancelled_reservation_restores_the_stock():
+    async def reserve():
+        store = AsyncDatabase("mongodb://localhost:27017/test")
+        store._supports_transactions = False
+        collection = SlowCollection({"1": 10, "2": 10, "3": 10}, slow_product_id="2", delay=0.2)
+        store.db = {"products": collection, "stock_movements": None, "stock_movement_buckets": None}
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.reserve_stock({"1": 4, "2": 4, "3": 4}), 0.05)
+        store.close()
+        return collection.stock
+
+    """The step in flight when the request timed out is applied late and undone as well."""
+    assert asyncio.run(reserve()) == {"1": 10, "2": 10, "3": 10}
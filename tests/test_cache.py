@@ -0,0 +1,39 @@
+from cache import ProductCache
+
+
+def test_set_skips_values_read_before_an_invalidation():
+    cache = ProductCache()
+    generation = cache.generation
+    cache.invalidate("1")
+    cache.set("1", {"ProductID": "1", "Price": 1}, generation)
+    assert cache.get("1") is None
+
+    cache.set("1", {"ProductID": "1", "Price": 2}, cache.generation)
+    assert cache.get("1")["Price"] == 2
+
+
+def test_update_drops_cached_product(client, store):
+    assert client.get('/products/1').get_json()["Price"] == 1500
+    client.put('/products/1', json={"Price": 1200})
+    assert store.cache.get("1") is None
+    assert client.get('/products/1').get_json()["Price"] == 1200
+
+
+def test_shared_generation_invalidates_other_processes_caches(tmp_path):
+    """Two caches sharing a generation file stand in for two gunicorn workers."""
+    path = str(tmp_path / "generation")
+    worker, other_worker = ProductCache(shared_generation=path), ProductCache(shared_generation=path)
+    worker.set("1", {"ProductID": "1", "Price": 1})
+    other_worker.set("2", {"ProductID": "2", "Price": 2})
+    generation = worker.generation
+
+    other_worker.invalidate("2")
+    assert worker.get("1") is None
+    worker.set("1", {"ProductID": "1", "Price": 1}, generation)
+    assert worker.get("1") is None
+
+    worker.set("1", {"ProductID": "1", "Price": 1}, worker.generation)
+    assert worker.get("1")["Price"] == 1
+    """A process's own invalidation only drops the keys it names."""
+    worker.invalidate("3")
+    assert worker.get("1")["Price"] == 1
@@ -0,0 +1,70 @@
+from http import HTTPStatus
+import gzip
+import io
+import json
+
+from jsonstream import iter_json_documents
+
+
+def test_export_ndjson(client):
+    response = client.get('/products/export')
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == 'application/x-ndjson'
+    products = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [product["ProductID"] for product in products] == ["1", "2", "3", "4", "5", "6"]
+
+
+def test_export_csv_with_fields_and_filters(client):
+    response = client.get('/products/export?format=csv&fields=ProductName,Price&category=Furniture&batch_size=1')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == ["ProductName,Price,ProductID", "Desk,300,4", "Office Chair,150,5"]
+
+
+def test_export_gzip(client):
+    response = client.get('/products/export?fields=ProductID', headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert len(lines) == 6
+
+
+def test_export_validation(client):
+    assert client.get('/products/export?format=xml').status_code == HTTPStatus.BAD_REQUEST
+    assert client.get('/products/export?batch_size=0').status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_bulk_insert_reports_bad_rows(client):
+    body = "\n".join([
+        json.dumps({"ProductID": "7", "ProductName": "Lamp", "ProductCategory": "Furniture", "Price": 40, "AvailableQuantity": 3}),
+        "{not json",
+        json.dumps({"ProductName": "No ID"}),
+        json.dumps({"ProductID": "1", "ProductName": "Duplicate"}),
+        json.dumps({"ProductID": "8", "Price": "free"}),
+    ])
+    result = client.post('/products/bulk', data=body, content_type='application/x-ndjson').get_json()
+    assert (result["received"], result["inserted"], result["error_count"]) == (5, 1, 4)
+    assert sorted(error["index"] for error in result["errors"]) == [1, 2, 3, 4]
+    assert client.get('/products/7').get_json()["ProductName"] == "Lamp"
+    assert client.get('/products/analytics/consistency').get_json()["consistent"] is True
+
+
+def test_bulk_upsert(client):
+    body = json.dumps([{"ProductID": "1", "Price": 1400}, {"ProductID": "9", "ProductName": "Globe", "ProductCategory": "Books"}])
+    result = client.post('/products/bulk?mode=upsert', data=body, content_type='application/json').get_json()
+    assert (result["upserted"], result["modified"], result["error_count"]) == (1, 1, 0)
+    assert client.get('/products/1').get_json()["Price"] == 1400
+    assert [product["ProductID"] for product in client.get('/products/suggest?prefix=glo').get_json()] == ["9"]
+
+
+def test_bulk_rejects_unknown_mode(client):
+    assert client.post('/products/bulk?mode=replace', data="").status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_malformed_json_array_stops_reading_the_stream():
+    body = '[{"ProductID": "1", "Price": -Infinity, "Tags": ["a\\u00e9", true, null, 1.5e+3]}, {"ProductID": x}, ' + '{}, ' * 10000 + '{}]'
+    for read_size in range(1, 40):
+        stream = io.StringIO(body)
+        rows = list(iter_json_documents(stream, read_size=read_size))
+        assert rows[0][0]["Tags"] == ["aé", True, None, 1500.0]
+        assert rows[1] == (None, "Invalid JSON: Expecting value")
+        assert len(rows) == 2
+        assert stream.tell() < 200
@@ -0,0 +1,28 @@
+import json
+
+import metrics
+
+
+def test_multiprocess_metrics_sum_every_process_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_flusher_pid", None)
+    monkeypatch.setattr(metrics.HTTP_REQUESTS, "_values", {})
+    monkeypatch.setattr(metrics.HTTP_REQUEST_DURATION, "_series", {})
+
+    """Another worker, which may have exited since, left its metrics behind."""
+    buckets = [0] * (len(metrics.LATENCY_BUCKETS) + 1)
+    buckets[0] = 2
+    (tmp_path / "metrics_1_other.json").write_text(json.dumps({
+        "http_requests_total": [[["GET", "/products", 200], 2]],
+        "http_request_duration_seconds": [[["GET", "/products"], [buckets, 0.001]]]
+    }))
+    metrics.record_request("GET", "/products", 200, 0.5)
+
+    output = metrics.render()
+    assert 'http_requests_total{method="GET",route="/products",status="200"} 3' in output
+    assert 'http_request_duration_seconds_count{method="GET",route="/products"} 3' in output
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/products",le="0.001"} 2' in output
+    assert len(list(tmp_path.glob("metrics_*.json"))) == 2
+
+    metrics.clear_multiproc_dir()
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,52 @@
+import random
+
+import prefix_index
+from prefix_index import INDEXED_FIELDS, PrefixIndex, index_terms
+
+WORDS = ["laptop", "lamp", "desk", "chair", "cable", "novel", "notebook"]
+CATEGORIES = ["Electronics", "Furniture", "Books"]
+
+
+def expected_matches(products, prefix):
+    return sorted(product_id for product_id, product in products.items()
+                  if any(term.startswith(prefix) for term in index_terms(product)))
+
+
+def test_search_matches_words_and_whole_values():
+    index = PrefixIndex()
+    index.load([{"ProductID": "1", "ProductName": "Office Chair", "ProductCategory": "Furniture"}])
+    assert index.search("cha") == [{"ProductName": "Office Chair", "ProductCategory": "Furniture", "ProductID": "1"}]
+    assert index.search("office c") == index.search("fur")
+    assert index.search("desk") == []
+
+
+def test_updates_renames_and_removals_match_a_full_scan(monkeypatch):
+    """Small merge batches exercise buffering, merging and stale-pair compaction."""
+    monkeypatch.setattr(prefix_index, "MIN_MERGE_SIZE", 4)
+    rng = random.Random(7)
+    index, products = PrefixIndex(), {}
+
+    for _ in range(3000):
+        product_id = str(rng.randint(0, 60))
+        action = rng.random()
+        if action < 0.5:
+            fields = {"ProductName": f"{rng.choice(WORDS)} {rng.choice(WORDS)}", "ProductCategory": rng.choice(CATEGORIES)}
+            product = {"ProductID": product_id, **rng.choice([fields, {"ProductName": fields["ProductName"]}])}
+            index.upsert(product)
+            products[product_id] = {**products.get(product_id, dict.fromkeys(INDEXED_FIELDS)), **product}
+        elif action < 0.65:
+            index.remove(product_id)
+            products.pop(product_id, None)
+        elif action < 0.8 and product_id in products:
+            new_id = str(rng.randint(0, 60))
+            if new_id == product_id or new_id not in products:
+                product = {**products.pop(product_id), "ProductID": new_id, "ProductName": rng.choice(WORDS)}
+                index.replace(product_id, product)
+                products[new_id] = product
+        else:
+            prefix = rng.choice(WORDS + CATEGORIES)[:rng.randint(1, 4)].lower()
+            found = index.search(prefix, limit=1000)
+            assert sorted(product["ProductID"] for product in found) == expected_matches(products, prefix)
+            assert all(product == products[product["ProductID"]] for product in found)
+
+    assert len(index) == len(products)
@@ -0,0 +1,144 @@
+from http import HTTPStatus
+import sqlite3
+
+import api
+
+
+def test_add_and_get_product(client):
+    response = client.post('/products', json={"ProductID": 7, "ProductName": "Lamp", "ProductCategory": "Furniture",
+                                              "Price": "45", "AvailableQuantity": 10})
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.get_json()["ProductID"] == "7"
+
+    product = client.get('/products/7').get_json()
+    assert product["Price"] == 45
+    assert product["ProductName"] == "Lamp"
+
+
+def test_add_duplicate_product_is_conflict(client):
+    response = client.post('/products', json={"ProductID": "1", "ProductName": "Laptop"})
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+def test_add_product_requires_product_id(client, store):
+    response = client.post('/products', json={"ProductName": "Nameless"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.get_json()["message"] == "ProductID is required"
+
+
+def test_non_object_body_is_rejected(client):
+    assert client.post('/products', json=["x"]).status_code == HTTPStatus.BAD_REQUEST
+    assert client.put('/products/1', json=["x"]).status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_invalid_price_is_rejected(client):
+    response = client.put('/products/1', json={"Price": "cheap"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.get_json()["message"] == "Invalid Price value"
+
+
+def test_update_product(client):
+    assert client.put('/products/2', json={"Price": 700}).status_code == HTTPStatus.OK
+    assert client.get('/products/2').get_json()["Price"] == 700
+    assert client.put('/products/missing', json={"Price": 1}).status_code == HTTPStatus.NOT_FOUND
+
+
+def test_update_to_taken_product_id_is_conflict(client):
+    assert client.put('/products/2', json={"ProductID": "1"}).status_code == HTTPStatus.CONFLICT
+
+
+def test_delete_product(client):
+    assert client.delete('/products/6').status_code == HTTPStatus.OK
+    assert client.get('/products/6').status_code == HTTPStatus.NOT_FOUND
+    assert client.delete('/products/6').status_code == HTTPStatus.NOT_FOUND
+
+
+def test_get_product_etag(client):
+    response = client.get('/products/1')
+    etag = response.headers["ETag"]
+    assert client.get('/products/1', headers={"If-None-Match": etag}).status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_listing_pages_with_keyset_cursor(client):
+    first = client.get('/products?limit=4&sort=Price').get_json()
+    assert [product["ProductID"] for product in first["products"]] == ["6", "3", "5", "4"]
+
+    second = client.get(f'/products?limit=4&sort=Price&after={first["next_cursor"]}').get_json()
+    assert [product["ProductID"] for product in second["products"]] == ["2", "1"]
+    assert second["next_cursor"] is None
+
+
+def test_keyset_pages_past_products_without_the_sort_field(client):
+    for product_id in ("7", "8", "9"):
+        client.post('/products', json={"ProductID": product_id, "ProductName": "Unpriced"})
+
+    for sort, expected in (("Price", ["7", "8", "9", "6", "3", "5", "4", "2", "1"]),
+                           ("-Price", ["1", "2", "4", "5", "3", "6", "9", "8", "7"])):
+        page = client.get(f'/products?sort={sort}&limit=2').get_json()
+        product_ids = [product["ProductID"] for product in page["products"]]
+        while page["next_cursor"] is not None:
+            page = client.get(f'/products?sort={sort}&limit=2&after={page["next_cursor"]}').get_json()
+            product_ids += [product["ProductID"] for product in page["products"]]
+        assert product_ids == expected
+
+
+def test_listing_filters_and_fields(client):
+    products = client.get('/products?category=Furniture&fields=ProductName').get_json()
+    assert products == [{"ProductID": "4", "ProductName": "Desk"}, {"ProductID": "5", "ProductName": "Office Chair"}]
+
+
+def test_batch_get(client):
+    response = client.post('/products/batch-get', json={"ids": ["1", 4, "missing"]})
+    assert response.status_code == HTTPStatus.OK
+    body = response.get_json()
+    assert sorted(body["products"]) == ["1", "4"]
+    assert body["missing"] == ["missing"]
+
+
+def test_search_and_suggest(client):
+    results = client.get('/products/search?q=chair').get_json()
+    assert [product["ProductID"] for product in results] == ["5"]
+
+    suggestions = client.get('/products/suggest?prefix=off').get_json()
+    assert [product["ProductID"] for product in suggestions] == ["5"]
+
+
+def test_analytics(client):
+    results = client.get('/products/analytics').get_json()
+    categories = {result["category"]: result for result in results[:-1]}
+    assert categories["Furniture"]["count"] == 2
+    assert categories["Electronics"]["total_quantity"] == 165
+    assert results[-1]["most_stocked_product"]["ProductID"] == "3"
+    assert client.get('/products/analytics/consistency').get_json()["consistent"] is True
+
+
+def test_missing_product_id_is_not_reported_as_duplicate(store):
+    assert store.add_product({"ProductName": "Nameless"}) is None
+
+
+def test_batch_get_storage_failure_is_503(client, store, monkeypatch):
+    def fail(sql, params=()):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_query", fail)
+    response = client.post('/products/batch-get', json={"ids": ["1", "2"]})
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_update_and_delete_storage_failures_are_503(client, store, monkeypatch):
+    def fail():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "_transaction", fail)
+    assert client.put('/products/1', json={"Price": 1}).status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert client.delete('/products/1').status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_bootstrap_fails_when_an_index_cannot_be_created(store, monkeypatch):
+    runner = api.app.test_cli_runner()
+    assert runner.invoke(args=["bootstrap"]).exit_code == 0
+
+    monkeypatch.setattr(store, "create_indexes", lambda: False)
+    result = runner.invoke(args=["bootstrap"])
+    assert result.exit_code == 1
+    assert "the indexes could not be created" in result.output
@@ -0,0 +1,131 @@
+from http import HTTPStatus
+import sqlite3
+
+
+def product_ids(products):
+    return [product["ProductID"] for product in products]
+
+
+def test_adjust_stock(client):
+    response = client.patch('/products/2/stock', json={"delta": -3})
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json() == {"ProductID": "2", "AvailableQuantity": 2}
+
+
+def test_adjust_stock_cannot_go_below_zero(client):
+    response = client.patch('/products/2/stock', json={"delta": -6})
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.get_json()["AvailableQuantity"] == 5
+    assert client.patch('/products/missing/stock', json={"delta": 1}).status_code == HTTPStatus.NOT_FOUND
+    assert client.patch('/products/2/stock', json={"delta": "x"}).status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_reservation_is_all_or_nothing(client):
+    response = client.post('/products/reservations', json={"items": [{"ProductID": "1", "quantity": 10},
+                                                                     {"ProductID": "4", "quantity": 3}]})
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.get_json()["failed"] == ["4"]
+    assert client.get('/products/1').get_json()["AvailableQuantity"] == 40
+
+    response = client.post('/products/reservations', json={"items": [{"ProductID": "1", "quantity": 10},
+                                                                     {"ProductID": 1, "quantity": 5},
+                                                                     {"ProductID": "4", "quantity": 2}]})
+    assert response.status_code == HTTPStatus.OK
+    assert sorted((item["ProductID"], item["AvailableQuantity"]) for item in response.get_json()["items"]) == [("1", 25), ("4", 0)]
+
+
+def test_reservation_validation(client):
+    assert client.post('/products/reservations', json={"items": []}).status_code == HTTPStatus.BAD_REQUEST
+    response = client.post('/products/reservations', json={"items": [{"ProductID": "1", "quantity": 0}]})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_stock_ranking(client):
+    lowest = client.get('/products/stock/lowest?limit=3').get_json()["products"]
+    assert product_ids(lowest) == ["6", "4", "2"]
+
+    highest = client.get('/products/stock/highest?limit=2&category=Furniture&fields=AvailableQuantity').get_json()["products"]
+    assert highest == [{"ProductID": "5", "AvailableQuantity": 60}, {"ProductID": "4", "AvailableQuantity": 2}]
+
+
+def test_stock_ranking_per_category(client):
+    categories = client.get('/products/stock/highest?limit=1&per_category=true').get_json()["categories"]
+    assert {entry["category"]: product_ids(entry["products"]) for entry in categories} == {
+        "Books": ["6"], "Electronics": ["3"], "Furniture": ["5"]
+    }
+    response = client.get('/products/stock/lowest?per_category=true&category=Books')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_low_stock_pages_lowest_first(client):
+    first = client.get('/products/stock/below?threshold=41&limit=2').get_json()
+    assert product_ids(first["products"]) == ["6", "4"]
+
+    second = client.get(f'/products/stock/below?threshold=41&limit=2&after={first["next_cursor"]}').get_json()
+    assert product_ids(second["products"]) == ["2", "1"]
+
+    third = client.get(f'/products/stock/below?threshold=41&limit=2&after={second["next_cursor"]}').get_json()
+    assert third == {"products": [], "next_cursor": None}
+
+
+def test_low_stock_requires_threshold(client):
+    assert client.get('/products/stock/below').status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_product_movements(client):
+    client.patch('/products/1/stock', json={"delta": -10})
+    client.patch('/products/1/stock', json={"delta": 4})
+    client.post('/products/reservations', json={"items": [{"ProductID": "1", "quantity": 6}]})
+
+    report = client.get('/products/1/movements?days=1&granularity=hour').get_json()
+    assert report["AvailableQuantity"] == 28
+    """The fixture's bulk load of 40 units is a correction, not stock flow."""
+    assert (report["units_in"], report["units_out"], report["corrections"], report["net_change"], report["movements"]) == (4, 16, 40, 28, 4)
+    assert len(report["buckets"]) == 1
+    assert report["daily_velocity"] == 16
+    assert client.get('/products/missing/movements').status_code == HTTPStatus.NOT_FOUND
+    assert client.get('/products/1/movements?granularity=week').status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_category_movements(client):
+    client.patch('/products/4/stock', json={"delta": -2})
+    client.patch('/products/5/stock', json={"delta": 8})
+
+    report = client.get('/products/analytics/movements?days=1').get_json()
+    furniture = {entry["category"]: entry for entry in report["categories"]}["Furniture"]
+    assert (furniture["units_in"], furniture["units_out"], furniture["corrections"], furniture["net_change"]) == (8, 2, 2 + 60, 68)
+    assert furniture["total_quantity"] == 68
+    assert furniture["days_of_cover"] == 34
+
+
+def test_quantity_corrections_do_not_change_velocity(client):
+    client.patch('/products/1/stock', json={"delta": -10})
+    client.put('/products/1', json={"AvailableQuantity": 5})
+
+    report = client.get('/products/1/movements?days=1').get_json()
+    assert (report["units_in"], report["units_out"], report["corrections"]) == (0, 10, 40 - 25)
+    assert report["daily_velocity"] == 10
+
+
+def test_every_write_records_its_movements(client, store):
+    client.post('/products', json={"ProductID": "7", "ProductCategory": "Books", "Price": 10, "AvailableQuantity": 3})
+    client.put('/products/7', json={"AvailableQuantity": 5})
+    client.put('/products/7', json={"Price": 12})
+    client.post('/products/bulk?mode=upsert', data='{"ProductID": "7", "AvailableQuantity": 9}\n',
+                content_type='application/x-ndjson')
+    client.delete('/products/7')
+
+    movements = store._query("SELECT delta, reason FROM stock_movements WHERE ProductID = '7' ORDER BY id")
+    assert movements == [(3, "create"), (2, "update"), (4, "import"), (-9, "delete")]
+
+
+def test_storage_failures_are_not_reported_as_insufficient_stock(client, store, monkeypatch):
+    def fail():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "_transaction", fail)
+    response = client.patch('/products/2/stock', json={"delta": -1})
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    response = client.post('/products/reservations', json={"items": [{"ProductID": "1", "quantity": 1}]})
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import time
+
+import pytest
+
+import api
+from storage import StorageError
+from write_batcher import WriteBatcher
+
+
+@pytest.fixture
+def batcher(store, monkeypatch):
+    batcher = WriteBatcher(store, max_size=50, max_delay=0.01, timeout=1)
+    monkeypatch.setattr(api, "writer", batcher)
+    return batcher
+
+
+def test_concurrent_writes_get_their_own_results(client, batcher):
+    def create(number):
+        return client.post('/products', json={"ProductID": f"n{number}", "ProductCategory": "Books", "Price": 1}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(create, range(20)))
+    assert statuses == [HTTPStatus.CREATED] * 20
+
+    assert client.post('/products', json={"ProductID": "n0"}).status_code == HTTPStatus.CONFLICT
+    assert client.put('/products/missing', json={"Price": 2}).status_code == HTTPStatus.NOT_FOUND
+    assert client.put('/products/n1', json={"Price": 2}).status_code == HTTPStatus.OK
+    assert client.get('/products/n1').get_json()["Price"] == 2
+
+
+def test_writes_to_one_product_keep_their_order(store, batcher):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda price: batcher.update_product_by_id("1", {"Price": price}), range(10)))
+        batcher.update_product_by_id("1", {"Price": 99})
+    assert store.get_product_by_id("1")["Price"] == 99
+
+
+def test_failed_flush_fails_the_callers_but_not_the_batcher(client, store, batcher, monkeypatch):
+    def fail(operations):
+        raise RuntimeError("storage is down")
+
+    monkeypatch.setattr(store, "apply_product_writes", fail)
+    with pytest.raises(StorageError):
+        batcher.update_product_by_id("1", {"Price": 1})
+    assert client.put('/products/1', json={"Price": 1}).status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert client.post('/products', json={"ProductID": "n1"}).status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    monkeypatch.undo()
+    assert batcher.update_product_by_id("1", {"Price": 2})["Price"] == 1500
+
+
+def test_slow_flush_times_out(client, store, batcher, monkeypatch):
+    apply_product_writes = store.apply_product_writes
+    monkeypatch.setattr(store, "apply_product_writes", lambda operations: time.sleep(1.5) or apply_product_writes(operations))
+
+    with pytest.raises(StorageError):
+        batcher.update_product_by_id("1", {"Price": 1})
+    assert client.put('/products/2', json={"Price": 1}).status_code == HTTPStatus.SERVICE_UNAVAILABLE
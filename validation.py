@@ -0,0 +1,289 @@
+# Request validation and parsing shared by the Flask app (api.py) and the asyncio app (async_api.py).
+from queries import MOVEMENT_GRANULARITIES, PRODUCT_FIELDS, SORTABLE_FIELDS
+
+# Pagination limits for GET /products.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Products returned per list by GET /products/stock/lowest and /products/stock/highest.
+DEFAULT_STOCK_RANKING_LIMIT = 10
+
+# Length in days of the stock movement report window.
+DEFAULT_MOVEMENT_DAYS = 7
+MAX_MOVEMENT_DAYS = 366
+
+# Output formats of GET /products/export and the number of products it reads per database round trip.
+EXPORT_FORMATS = ("ndjson", "csv")
+DEFAULT_EXPORT_BATCH_SIZE = 1000
+MAX_EXPORT_BATCH_SIZE = 10000
+
+# Maximum number of ProductIDs accepted by POST /products/batch-get.
+MAX_BATCH_GET_SIZE = 1000
+
+# Result limits for search and type-ahead suggestions.
+DEFAULT_SEARCH_LIMIT = 50
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+
+def sanitize_product_data(data):
+    """Sanitize product data in place and return an error message, or None if the data is valid."""
+
+    """Anything other than a JSON object cannot be stored as a product"""
+    if not isinstance(data, dict):
+        return "Request body must be a JSON object"
+
+    """Ensure that ProductID is a string"""
+    if 'ProductID' in data:
+        data['ProductID'] = str(data['ProductID'])
+
+    """Validate AvailableQuantity and Price"""
+    fields_to_validate = ['AvailableQuantity', 'Price']
+    for field in fields_to_validate:
+        if field in data:
+            try:
+                data[field] = int(data[field])
+            except (TypeError, ValueError):
+                return f"Invalid {field} value"
+
+    return None
+
+def parse_product_filters(args):
+    """Parse the listing filters from the query string. Returns (filters, error_message)."""
+    filters = {'category': args.get('category')}
+    for name in ('min_price', 'max_price', 'min_quantity', 'max_quantity'):
+        value = args.get(name)
+        if value is None:
+            continue
+        try:
+            filters[name] = int(value)
+        except ValueError:
+            return None, f"Invalid {name} value"
+    return filters, None
+
+def parse_fields(args, required=('ProductID',)):
+    """Parse a sparse fieldset ('fields=ProductID,Price'). Returns (fields, error_message).
+
+    'fields' is None when the parameter is absent; otherwise it lists the requested fields plus 'required'.
+    """
+    value = args.get('fields')
+    if value is None:
+        return None, None
+
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if not fields or unknown:
+        return None, f"fields must be a comma-separated list of: {', '.join(PRODUCT_FIELDS)}"
+    return list(dict.fromkeys([*fields, *required])), None
+
+def parse_keyset_cursor(after, sort_field):
+    """Decode an 'after' cursor. Cursors for non-ProductID sorts are '<sort value>,<ProductID>'."""
+    if after is None or sort_field == 'ProductID':
+        return after
+    value, _, product_id = after.partition(',')
+    return (int(value) if value else None), product_id
+
+def encode_keyset_cursor(product, sort_field):
+    """Encode the cursor that resumes the listing after the given product."""
+    if sort_field == 'ProductID':
+        return product['ProductID']
+    value = product.get(sort_field)
+    return f"{'' if value is None else value},{product['ProductID']}"
+
+def parse_listing_args(args):
+    """Parse the GET /products query string. Returns (listing, error_message).
+
+    'listing' holds the output format, the limit, the raw 'after' value, the explain flag, and
+    a 'query' dict of keyword arguments for the database listing methods.
+    """
+    output_format = args.get('format', 'json')
+    if output_format not in ('json', 'ndjson'):
+        return None, "Invalid format value"
+
+    sort = args.get('sort', 'ProductID')
+    descending = sort.startswith('-')
+    sort_field = sort.lstrip('-')
+    if sort_field not in SORTABLE_FIELDS:
+        return None, f"sort must be one of: {', '.join(SORTABLE_FIELDS)}"
+
+    filters, error_message = parse_product_filters(args)
+    if error_message:
+        return None, error_message
+
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return None, "Invalid limit value"
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+
+    """The keyset cursor is built from ProductID and the sort field, so those are always returned."""
+    fields, error_message = parse_fields(args, required=('ProductID', sort_field))
+    if error_message:
+        return None, error_message
+
+    after = args.get('after')
+    try:
+        cursor = parse_keyset_cursor(after, sort_field)
+    except ValueError:
+        return None, "Invalid after value"
+
+    return {
+        "format": output_format,
+        "limit": limit,
+        "after": after,
+        "explain": args.get('explain', '').lower() in ('1', 'true', 'yes'),
+        "query": {"after": cursor, "filters": filters, "sort_field": sort_field,
+                  "descending": descending, "fields": fields}
+    }, None
+
+def parse_export_args(args):
+    """Parse the GET /products/export query string. Returns (export, error_message).
+
+    'export' holds the output format, the read batch size, and the listing filters and fields.
+    """
+    output_format = args.get('format', 'ndjson')
+    if output_format not in EXPORT_FORMATS:
+        return None, f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+
+    try:
+        batch_size = int(args.get('batch_size', DEFAULT_EXPORT_BATCH_SIZE))
+    except ValueError:
+        return None, "Invalid batch_size value"
+    if batch_size < 1 or batch_size > MAX_EXPORT_BATCH_SIZE:
+        return None, f"batch_size must be between 1 and {MAX_EXPORT_BATCH_SIZE}"
+
+    filters, error_message = parse_product_filters(args)
+    if error_message:
+        return None, error_message
+
+    fields, error_message = parse_fields(args)
+    if error_message:
+        return None, error_message
+
+    return {"format": output_format, "batch_size": batch_size, "filters": filters, "fields": fields}, None
+
+def parse_stock_ranking_args(args):
+    """Parse the GET /products/stock/<order> query string. Returns (ranking, error_message)."""
+    try:
+        limit = int(args.get('limit', DEFAULT_STOCK_RANKING_LIMIT))
+    except ValueError:
+        return None, "Invalid limit value"
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+
+    per_category = args.get('per_category', '').lower() in ('1', 'true', 'yes')
+    category = args.get('category')
+    if per_category and category is not None:
+        return None, "category and per_category cannot be combined"
+
+    fields, error_message = parse_fields(args, required=('ProductID', 'AvailableQuantity'))
+    if error_message:
+        return None, error_message
+
+    return {"limit": limit, "category": category, "per_category": per_category, "fields": fields}, None
+
+def parse_low_stock_args(args):
+    """Parse the GET /products/stock/below query string. Returns (low_stock, error_message).
+
+    Like parse_listing_args, 'low_stock' holds the limit and a 'query' dict for get_products_page,
+    here sorted by AvailableQuantity and limited to products below the threshold.
+    """
+    try:
+        threshold = int(args['threshold'])
+    except KeyError:
+        return None, "Query parameter 'threshold' is required"
+    except ValueError:
+        return None, "Invalid threshold value"
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, "Invalid limit value"
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+
+    fields, error_message = parse_fields(args, required=('ProductID', 'AvailableQuantity'))
+    if error_message:
+        return None, error_message
+
+    try:
+        cursor = parse_keyset_cursor(args.get('after'), 'AvailableQuantity')
+    except ValueError:
+        return None, "Invalid after value"
+
+    """Quantities are integers, so 'below the threshold' is the inclusive range up to threshold - 1."""
+    filters = {'category': args.get('category'), 'max_quantity': threshold - 1}
+    return {
+        "limit": limit,
+        "query": {"after": cursor, "filters": filters, "sort_field": "AvailableQuantity",
+                  "descending": False, "fields": fields}
+    }, None
+
+def parse_movement_args(args):
+    """Parse 'days' and 'granularity' for the stock movement reports. Returns (days, granularity, error_message)."""
+    try:
+        days = int(args.get('days', DEFAULT_MOVEMENT_DAYS))
+    except ValueError:
+        return None, None, "Invalid days value"
+    if days < 1 or days > MAX_MOVEMENT_DAYS:
+        return None, None, f"days must be between 1 and {MAX_MOVEMENT_DAYS}"
+
+    granularity = args.get('granularity', 'day')
+    if granularity not in MOVEMENT_GRANULARITIES:
+        return None, None, f"granularity must be one of: {', '.join(MOVEMENT_GRANULARITIES)}"
+    return days, granularity, None
+
+def parse_result_window(args, default_limit, max_limit):
+    """Parse 'limit' and 'offset' from the query string. Returns (limit, offset, error_message)."""
+    try:
+        limit = int(args.get('limit', default_limit))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return None, None, "Invalid limit or offset value"
+    if limit < 1 or limit > max_limit:
+        return None, None, f"limit must be between 1 and {max_limit}"
+    if offset < 0:
+        return None, None, "offset must not be negative"
+    return limit, offset, None
+
+def parse_stock_delta(data):
+    """Parse the PATCH /products/<id>/stock body. Returns (delta, error_message)."""
+    try:
+        return int(data['delta']), None
+    except (KeyError, TypeError, ValueError):
+        return None, "Invalid delta value"
+
+def parse_reservation_items(data):
+    """Parse the POST /products/reservations body into {ProductID: quantity}. Returns (quantities, error_message).
+
+    Repeated ProductIDs are merged, so each product is decremented once.
+    """
+    items = data.get('items') if isinstance(data, dict) else None
+    if not items:
+        return None, "A non-empty 'items' list is required"
+
+    quantities = {}
+    for item in items:
+        try:
+            product_id = str(item['ProductID'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            return None, "Each item needs a ProductID and an integer quantity"
+        if quantity <= 0:
+            return None, "quantity must be positive"
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities, None
+
+def parse_product_ids(data):
+    """Parse the POST /products/batch-get body into unique string ProductIDs. Returns (product_ids, error_message)."""
+    product_ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(product_ids, list) or not product_ids:
+        return None, "A non-empty 'ids' list is required"
+    if len(product_ids) > MAX_BATCH_GET_SIZE:
+        return None, f"At most {MAX_BATCH_GET_SIZE} ids can be requested at once"
+
+    """ProductIDs are stored as strings, so normalize them the same way sanitize_product_data does."""
+    return list(dict.fromkeys(str(product_id) for product_id in product_ids)), None
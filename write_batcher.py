@@ -0,0 +1,131 @@
+from concurrent.futures import Future, TimeoutError
+from metrics import WRITE_BATCH_SIZE
+from storage import StorageError
+import os
+import queue
+import threading
+import time
+
+
+def operation_keys(operation):
+    """The ProductIDs an operation reads or writes."""
+    if operation["type"] == "insert":
+        return {operation["product"].get("ProductID")}
+    return {operation["product_id"], operation["data"].get("ProductID", operation["product_id"])}
+
+
+class WriteBatcher:
+    """Coalesces single-product writes from concurrent requests into batched writes.
+
+    Callers block in add_product() or update_product_by_id() while a background thread collects
+    operations for up to 'max_delay' seconds or 'max_size' operations and applies them with one
+    store.apply_product_writes() call. Each caller gets the same result, or the same exception,
+    as the store's own method would have given it.
+
+    An operation on a ProductID that is already in the batch being collected waits for the next
+    batch, so writes to one product are applied in the order they were submitted. A caller that
+    gets no result within 'timeout' seconds gets a StorageError; its write may still be applied.
+    """
+
+    def __init__(self, store, max_size=500, max_delay=0.005, timeout=10.0):
+        self.store = store
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add_product(self, product):
+        return self._submit({"type": "insert", "product": product})
+
+    def update_product_by_id(self, product_id, data):
+        return self._submit({"type": "update", "product_id": product_id, "data": data})
+
+    def _submit(self, operation):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((operation, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise StorageError(f"No write result within {self.timeout:g} seconds; the write may still be applied") from None
+
+    def _ensure_started(self):
+        """Start the flusher thread, again after a fork since threads do not survive it."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                threading.Thread(target=self._run, name="write-batcher", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        """Collect and flush batches forever. An error fails the affected callers, never the thread."""
+        deferred = []
+        while True:
+            batch = []
+            try:
+                batch, deferred = self._collect(deferred)
+                self._flush(batch)
+            except Exception as e:
+                print(f"An unexpected error occurred while batching writes: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _collect(self, deferred):
+        """Gather the next batch, starting with operations deferred from the previous one.
+
+        Returns the batch and the operations deferred to the batch after it.
+        """
+        pending = iter(deferred)
+        batch, next_deferred, keys = [], [], set()
+        deadline = None
+        while len(batch) < self.max_size:
+            item = next(pending, None)
+            if item is None:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if deadline is None:
+                deadline = time.monotonic() + self.max_delay
+
+            try:
+                item_keys = operation_keys(item[0])
+            except Exception as e:
+                item[1].set_exception(e)
+                continue
+            if keys & item_keys:
+                next_deferred.append(item)
+            else:
+                batch.append(item)
+            keys |= item_keys
+
+        """Operations left over when the batch filled up keep their place ahead of newer ones."""
+        next_deferred.extend(pending)
+        return batch, next_deferred
+
+    def _flush(self, batch):
+        WRITE_BATCH_SIZE.observe(len(batch))
+        try:
+            results = self.store.apply_product_writes([operation for operation, _ in batch])
+        except StorageError as e:
+            results = [(None, e)] * len(batch)
+        except Exception as e:
+            print(f"An unexpected error occurred while flushing writes: {e}")
+            """The writes may or may not have been applied, so callers get a StorageError, as on a timeout."""
+            error = StorageError("The batched write failed")
+            error.__cause__ = e
+            results = [(None, error)] * len(batch)
+
+        for (_, future), (result, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)